@@ -0,0 +1,179 @@
+"""
+Benchmark suite for the carpark hot paths at 10^3 to 10^6 rows.
+
+For each size, synthetic SPACES/CARS/PARKED files are written (half the
+spaces parked, so parks always find room) and these are timed on one
+CarPark:
+
+    load_spaces, load_cars, load_parked   whole file, rows/s
+    available_spaces                      what get_available_spaces calls, calls/s
+    park, leave                           auto-assigned parks of unparked cars, then their exits, ops/s
+    save_parked                           whole snapshot, rows/s
+
+Each timing is the best of `repeat` runs. Results are written as JSON so
+two versions can be compared number for number:
+
+    python bench_carpark.py --output before.json
+    ... change the code ...
+    python bench_carpark.py --output after.json --compare before.json
+
+Usage: python bench_carpark.py [--sizes 1000 10000 ...] [--repeat N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import carpark
+from bench_loaders import write_fixtures
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+RESULTS_FILE = "bench_results.json"
+# Parks and leaves timed per size, and available_spaces calls per size
+MAX_OPS = 20_000
+QUERIES = 20
+
+
+def best_of(repeat: int, setup: Callable[[], object], fn: Callable[[object], object]) -> float:
+    """Fastest of `repeat` timed calls of fn(setup()), in seconds; setup is not timed."""
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        fn(state)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def loaded(paths: Dict[str, str]) -> carpark.CarPark:
+    car_park = carpark.CarPark()
+    car_park.load_spaces(paths["SPACES.txt"])
+    car_park.load_cars(paths["CARS.txt"])
+    car_park.load_parked(paths["PARKED.txt"])
+    return car_park
+
+
+def park_all(car_park: carpark.CarPark, regs: List[str], time_in: int) -> None:
+    for reg in regs:
+        if not car_park.park(reg, 60, time_in=time_in).ok:
+            raise RuntimeError(f"benchmark park of '{reg}' was refused")
+
+
+def leave_all(car_park: carpark.CarPark, regs: List[str], time_out: int) -> None:
+    for reg in regs:
+        if not car_park.leave(reg, time_out).ok:
+            raise RuntimeError(f"benchmark leave of '{reg}' was refused")
+
+
+def bench_size(rows: int, repeat: int = 3) -> List[Dict[str, object]]:
+    """Time every operation at one size; one result dict per operation."""
+    parked = rows // 2
+    ops = min(rows - parked, MAX_OPS)
+    regs = [f"CP{i:07d}" for i in range(parked, parked + ops)]
+    minute = carpark.to_epoch_minutes("2025-10-01 09:00")
+    timings: List[Tuple[str, int, float]] = []
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_fixtures(folder, rows, parked)
+        for name, filename, count in (("load_spaces", "SPACES.txt", rows), ("load_cars", "CARS.txt", rows)):
+            method = getattr(carpark.CarPark, name)
+            timings.append((name, count, best_of(repeat, carpark.CarPark,
+                                                 lambda car_park: method(car_park, paths[filename]))))
+
+        def with_spaces() -> carpark.CarPark:
+            car_park = carpark.CarPark()
+            car_park.load_spaces(paths["SPACES.txt"])
+            return car_park
+
+        timings.append(("load_parked", parked, best_of(
+            repeat, with_spaces, lambda car_park: car_park.load_parked(paths["PARKED.txt"]))))
+
+        car_park = loaded(paths)
+        timings.append(("available_spaces", QUERIES, best_of(
+            repeat, lambda: car_park,
+            lambda car_park: [car_park.available_spaces("Standard") for _ in range(QUERIES)])))
+
+        # park then leave the same cars, so every repeat starts from the loaded state
+        park_s = leave_s = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            park_all(car_park, regs, minute)
+            park_s = min(park_s, time.perf_counter() - start)
+            start = time.perf_counter()
+            leave_all(car_park, regs, minute + 30)
+            leave_s = min(leave_s, time.perf_counter() - start)
+        timings.append(("park", ops, park_s))
+        timings.append(("leave", ops, leave_s))
+
+        output = os.path.join(folder, "SAVED.txt")
+        timings.append(("save_parked", parked, best_of(
+            repeat, lambda: car_park, lambda car_park: car_park.save_parked(output))))
+    return [{"rows": rows, "operation": name, "count": count, "seconds": seconds,
+             "per_second": count / seconds if seconds else float("inf")}
+            for name, count, seconds in timings]
+
+
+def git_version() -> Optional[str]:
+    """`git describe` of the checkout, or None outside a git tree."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: Tuple[int, ...] = SIZES, repeat: int = 3) -> Dict[str, object]:
+    """Benchmark every size, returning the machine-readable results document."""
+    results = []
+    for rows in sizes:
+        results.extend(bench_size(rows, repeat))
+    return {
+        "version": git_version(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, object], baseline: Dict[str, object]) -> List[Dict[str, object]]:
+    """Per (rows, operation) throughput of `current` relative to `baseline`; above 1.0 is faster."""
+    before = {(r["rows"], r["operation"]): r["per_second"] for r in baseline["results"]}
+    return [{"rows": r["rows"], "operation": r["operation"],
+             "ratio": r["per_second"] / before[r["rows"], r["operation"]]}
+            for r in current["results"] if before.get((r["rows"], r["operation"]))]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the carpark hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="row counts to generate")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the best is kept")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON file to write the results to")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    document = run(tuple(args.sizes), args.repeat)
+    with open(args.output, "w") as file:
+        json.dump(document, file, indent=2)
+    ratios = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        ratios = {(r["rows"], r["operation"]): r["ratio"] for r in compare(document, baseline)}
+        print(f"Compared with {args.compare} ({baseline.get('version') or 'unknown version'})")
+    print(f"{'Rows':>10} {'Operation':<17} {'Count':>9} {'Seconds':>9} {'Per second':>13}"
+          + (f" {'vs base':>8}" if ratios else ""))
+    for r in document["results"]:
+        line = f"{r['rows']:>10,} {r['operation']:<17} {r['count']:>9,} {r['seconds']:>9.4f} {r['per_second']:>13,.0f}"
+        ratio = ratios.get((r["rows"], r["operation"]))
+        print(line + (f" {ratio:>7.2f}x" if ratio is not None else ""))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Rows/sec benchmark: chunked loaders in carpark.py against the original
+line-by-line loaders.
+
+Each loader pair reads the same file, and each timing is the best of
+`repeat` runs. CarPark.load_spaces only parses and checks the file, so
+"SPACES+build" also times building the Space objects and their registry
+on first use.
+
+Usage: python bench_loaders.py [--rows N] [--parked-rows N] [--repeat N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import carpark
+
+PARKED_ROWS = 5_000
+
+
+def legacy_load_spaces(filename: str) -> List[Dict]:
+    """The original load_spaces: one strip/split/dict per line."""
+    spaces = []
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                spaces_id, location, space_type = line.split(", ", 2)
+                spaces.append({"id": spaces_id, "location": location, "type": space_type, "occupied": False})
+    return spaces
+
+
+def legacy_load_cars(filename: str) -> Dict[str, Dict]:
+    """The original load_cars."""
+    cars = {}
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                reg, name, contract, entitlement = line.split(", ", 3)
+                cars[reg.upper()] = {"owner": name, "contract": contract, "entitlement": entitlement}
+    return cars
+
+
+def legacy_load_parked(filename: str, spaces: List[Dict]) -> List[Dict]:
+    """The original load_parked, including its scan of spaces per record."""
+    parked = []
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                spaces_id, reg, time_in, expected_time_out = line.split(", ", 3)
+                parked.append({"space_id": spaces_id, "reg": reg.upper(),
+                               "time_in": time_in, "expected_time_out": expected_time_out})
+                for space in spaces:
+                    if space["id"] == spaces_id:
+                        space["occupied"] = True
+                        break
+    return parked
+
+
+def write_fixtures(folder: str, rows: int, parked: Optional[int] = None) -> Dict[str, str]:
+    """Write SPACES/CARS files with `rows` lines each and PARKED with the first `parked` (default: all)."""
+    types = ["Standard"] * 8 + ["Disabled", "EV"]
+    paths = {name: os.path.join(folder, name) for name in ("SPACES.txt", "CARS.txt", "PARKED.txt")}
+    with open(paths["SPACES.txt"], "w") as file:
+        file.write("# Space ID, Location, Type\n")
+        for i in range(rows):
+            file.write(f"S{i:07d}, Level {i // 100 + 1} - Bay {i % 100 + 1:02d}, {types[i % 10]}\n")
+    with open(paths["CARS.txt"], "w") as file:
+        file.write("# Registration, Owner Name, Contact, Entitlement\n")
+        for i in range(rows):
+            file.write(f"CP{i:07d}, Owner {i}, owner{i}@email.com, {types[i % 10]}\n")
+    with open(paths["PARKED.txt"], "w") as file:
+        file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
+        for i in range(rows if parked is None else parked):
+            start = 7 * 60 + (i % 240)
+            time_in = f"2025-09-30 {start // 60:02d}:{start % 60:02d}"
+            time_out = f"2025-09-30 {start // 60 + 8:02d}:{start % 60:02d}"
+            file.write(f"S{i:07d}, CP{i:07d}, {time_in}, {time_out}\n")
+    return paths
+
+
+def rows_per_second(rows: int, fn: Callable[[], object], repeat: int = 3) -> float:
+    """Rows/sec of the fastest of `repeat` calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def run(rows: int = 200_000, parked_rows: int = PARKED_ROWS, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """Time each loader pair on the same files, returning rows/sec per file.
+
+    SPACES and CARS have `rows` lines. The legacy PARKED loader scans
+    every space per record (O(n^2)), so both PARKED loaders are timed on
+    their own `parked_rows`-line fixture.
+    """
+    results = {}
+    car_park = carpark.CarPark()
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_fixtures(folder, rows, parked=0)
+        results["SPACES.txt"] = {
+            "legacy": rows_per_second(rows, lambda: legacy_load_spaces(paths["SPACES.txt"]), repeat),
+            "chunked": rows_per_second(rows, lambda: car_park.load_spaces(paths["SPACES.txt"]), repeat),
+        }
+        results["SPACES+build"] = {
+            "legacy": results["SPACES.txt"]["legacy"],
+            "chunked": rows_per_second(rows, lambda: (car_park.load_spaces(paths["SPACES.txt"]),
+                                                      car_park.space_registry), repeat),
+        }
+        results["CARS.txt"] = {
+            "legacy": rows_per_second(rows, lambda: legacy_load_cars(paths["CARS.txt"]), repeat),
+            "chunked": rows_per_second(rows, lambda: car_park.load_cars(paths["CARS.txt"]), repeat),
+        }
+        parked_folder = os.path.join(folder, "parked")
+        os.mkdir(parked_folder)
+        parked_paths = write_fixtures(parked_folder, parked_rows)
+        legacy_spaces = legacy_load_spaces(parked_paths["SPACES.txt"])
+        car_park.load_spaces(parked_paths["SPACES.txt"])
+        results["PARKED.txt"] = {
+            "legacy": rows_per_second(parked_rows, lambda: legacy_load_parked(parked_paths["PARKED.txt"], legacy_spaces),
+                                      repeat),
+            "chunked": rows_per_second(parked_rows, lambda: car_park.load_parked(parked_paths["PARKED.txt"]), repeat),
+        }
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the chunked loaders with the line-by-line originals")
+    parser.add_argument("--rows", type=int, default=200_000, help="lines in the SPACES and CARS fixtures")
+    parser.add_argument("--parked-rows", type=int, default=PARKED_ROWS,
+                        help="lines in the PARKED fixture (the legacy loader is O(n^2))")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the best is kept")
+    args = parser.parse_args(argv)
+    print(f"{'File':<13} {'Rows':>9} {'Legacy rows/s':>15} {'Chunked rows/s':>15} {'Speed-up':>9}")
+    for name, timing in run(args.rows, args.parked_rows, args.repeat).items():
+        rows = args.parked_rows if name == "PARKED.txt" else args.rows
+        print(f"{name:<13} {rows:>9,} {timing['legacy']:>15,.0f} {timing['chunked']:>15,.0f} "
+              f"{timing['chunked'] / timing['legacy']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
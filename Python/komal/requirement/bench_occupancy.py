@@ -0,0 +1,116 @@
+"""
+Multithreaded stress test for CarPark.park/leave: threads churn their own
+cars through a shared, oversubscribed set of spaces, checking that no
+space is ever granted twice, and report throughput as threads are added.
+
+Each run is compared with the same workload behind one global lock.
+
+Usage: python bench_occupancy.py [--ops N] [--max-threads N]
+"""
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+import carpark
+
+TYPES = [carpark.SpaceType.STANDARD] * 8 + [carpark.SpaceType.DISABLED, carpark.SpaceType.EV]
+
+
+class GlobalLockCarPark(carpark.CarPark):
+    """Baseline: every park and leave serialised behind one lock."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._big_lock = threading.Lock()
+
+    def park(self, *args, **kwargs) -> carpark.EventResult:
+        with self._big_lock:
+            return super().park(*args, **kwargs)
+
+    def leave(self, identifier: str, time_out: Optional[int] = None) -> carpark.EventResult:
+        with self._big_lock:
+            return super().leave(identifier, time_out)
+
+
+def build(car_park: carpark.CarPark, spaces: int, cars: int) -> carpark.CarPark:
+    """Fill a car park with `spaces` spaces and `cars` registered cars, none parked."""
+    car_park.spaces = [carpark.Space(f"S{i:06d}", f"Level {i // 100 + 1} - Bay {i % 100 + 1:02d}", TYPES[i % 10])
+                       for i in range(spaces)]
+    car_park.space_registry.add_many(car_park.spaces)
+    car_park.cars.extend([f"CP{i:06d}" for i in range(cars)], [f"Owner {i}" for i in range(cars)],
+                         [f"owner{i}@email.com" for i in range(cars)], [TYPES[i % 10] for i in range(cars)])
+    return car_park
+
+
+def churn(car_park: carpark.CarPark, regs: List[str], ops: int, holders: Dict[str, str],
+          clashes: List[str], seed: int) -> None:
+    """Randomly park and leave this thread's cars, noting any space granted twice."""
+    rng = random.Random(seed)
+    parked_in: Dict[str, str] = {}
+    time_in = carpark.to_epoch_minutes("2025-10-01 08:00")
+    for _ in range(ops):
+        reg = rng.choice(regs)
+        space_id = parked_in.pop(reg, None)
+        if space_id is not None:
+            # Drop the claim before the space is released, so the next holder finds it unset
+            del holders[space_id]
+            car_park.leave(reg)
+            continue
+        result = car_park.park(reg, 15, time_in=time_in)
+        if result.ok:
+            space_id = result.record.space_id
+            if holders.setdefault(space_id, reg) != reg:
+                clashes.append(space_id)
+            parked_in[reg] = space_id
+
+
+def check_consistent(car_park: carpark.CarPark) -> None:
+    index, registry = car_park.parked_index, car_park.space_registry
+    occupied = {space.id for space in car_park.spaces if space.occupied}
+    assert occupied == set(index.by_space), "occupied spaces match parked records"
+    assert len(index.records) == len(index.by_reg) == len(index.by_space)
+    free = sum(len(pool) for pool in registry.free_by_type.values())
+    assert free + len(occupied) == len(car_park.spaces), "free sets and occupancy agree"
+
+
+def run(threads: int, ops: int, engine=carpark.CarPark, spaces: int = 2_000,
+        cars_per_thread: int = 500) -> Dict[str, float]:
+    """Stress one engine with `threads` workers; returns ops/sec and clashes."""
+    car_park = build(engine(), spaces, cars_per_thread * threads)
+    regs = list(car_park.cars)
+    holders: Dict[str, str] = {}
+    clashes: List[str] = []
+    workers = [threading.Thread(target=churn, args=(car_park, regs[t::threads], ops, holders, clashes, t))
+               for t in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+    check_consistent(car_park)
+    return {"threads": threads, "ops_per_second": threads * ops / seconds, "clashes": len(clashes),
+            "parked": len(car_park.parked)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stress CarPark.park/leave from several threads")
+    parser.add_argument("--ops", type=int, default=50_000, help="park/leave operations per thread")
+    parser.add_argument("--max-threads", type=int, default=8, help="thread counts double from 1 up to this")
+    args = parser.parse_args(argv)
+    print(f"{'Threads':>7} {'Striped ops/s':>14} {'Global ops/s':>13} {'Scaling':>8} {'Clashes':>8}")
+    base = None
+    threads = 1
+    while threads <= args.max_threads:
+        striped = run(threads, args.ops)
+        single = run(threads, args.ops, GlobalLockCarPark)
+        base = base or striped["ops_per_second"]
+        print(f"{threads:>7} {striped['ops_per_second']:>14,.0f} {single['ops_per_second']:>13,.0f} "
+              f"{striped['ops_per_second'] / base:>7.2f}x {striped['clashes'] + single['clashes']:>8}")
+        threads *= 2
+
+
+if __name__ == "__main__":
+    main()
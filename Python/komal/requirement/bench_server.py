@@ -0,0 +1,121 @@
+"""
+Load generator for carpark_server.py: many concurrent barrier clients
+parking and leaving, reporting p50/p99 request latency.
+
+By default it starts a server in-process on a generated car park with one
+space and one registered car per client; pass --port to drive a server
+that is already running instead (its CARS.txt must hold the CP0000000...
+registrations written by bench_loaders.write_fixtures).
+
+Usage: python bench_server.py [--clients N] [--rounds N] [--port PORT]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Dict, List, Optional
+
+import carpark
+from bench_loaders import write_fixtures
+from carpark_server import DEFAULT_HOST, CarParkServer, request
+
+
+async def barrier_client(host: str, port: int, reg: str, rounds: int, latencies: List[float],
+                         start: asyncio.Event) -> int:
+    """Park and leave `reg` `rounds` times on one connection; returns the number of failures."""
+    reader, writer = await asyncio.open_connection(host, port)
+    await start.wait()
+    failures = 0
+    try:
+        for _ in range(rounds):
+            for line in (f"PARK, {reg}, 15", f"LEAVE, {reg}"):
+                sent = time.perf_counter()
+                reply = await request(reader, writer, line)
+                latencies.append(time.perf_counter() - sent)
+                failures += not reply["ok"]
+    finally:
+        writer.close()
+    return failures
+
+
+async def race_for_bay(host: str, port: int, regs: List[str], space_id: str) -> int:
+    """Have every client ask for the same bay at once; returns how many were granted it."""
+    connections = await asyncio.gather(*(asyncio.open_connection(host, port) for _ in regs))
+    replies = await asyncio.gather(*(request(reader, writer, f"PARK, {reg}, 15, {space_id}")
+                                     for (reader, writer), reg in zip(connections, regs)))
+    winners = [reg for reg, reply in zip(regs, replies) if reply["ok"]]
+    for (reader, writer), reg in zip(connections, regs):
+        if reg in winners:
+            await request(reader, writer, f"LEAVE, {reg}")
+        writer.close()
+    return len(winners)
+
+
+async def drive(host: str, port: int, clients: int, rounds: int) -> Dict[str, float]:
+    regs = [f"CP{i:07d}" for i in range(clients)]
+    latencies: List[float] = []
+    start = asyncio.Event()
+    tasks = [asyncio.create_task(barrier_client(host, port, reg, rounds, latencies, start)) for reg in regs]
+    # Let every client connect before the clock starts
+    await asyncio.sleep(0.5)
+    began = time.perf_counter()
+    start.set()
+    failures = sum(await asyncio.gather(*tasks))
+    elapsed = time.perf_counter() - began
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "failures": failures,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": cuts[49] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "max_ms": max(latencies) * 1000,
+        "bay_winners": await race_for_bay(host, port, regs, "S0000000"),
+    }
+
+
+async def run_local(clients: int, rounds: int) -> Dict[str, float]:
+    """Benchmark against an in-process server on a generated car park."""
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_fixtures(folder, clients)
+        # Start with the car park empty so every client can park
+        with open(paths["PARKED.txt"], "w") as file:
+            file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
+        car_park = carpark.CarPark()
+        car_park.load_spaces(paths["SPACES.txt"])
+        car_park.load_cars(paths["CARS.txt"])
+        car_park.load_parked(paths["PARKED.txt"])
+        car_park.open_journal(paths["PARKED.txt"])
+        server = CarParkServer(car_park, DEFAULT_HOST, 0)
+        await server.start()
+        try:
+            return await drive(DEFAULT_HOST, server.port, clients, rounds)
+        finally:
+            await server.stop()
+            car_park.close_journal()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Concurrent barrier load test for carpark_server.py")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5, help="park/leave pairs per client")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, help="use a running server instead of starting one")
+    args = parser.parse_args(argv)
+    if args.port is None:
+        with redirect_stdout(StringIO()):
+            results = asyncio.run(run_local(args.clients, args.rounds))
+    else:
+        results = asyncio.run(drive(args.host, args.port, args.clients, args.rounds))
+    print(f"{results['clients']} clients, {results['requests']} requests "
+          f"({results['failures']} failed) at {results['requests_per_second']:,.0f} req/s")
+    print(f"latency p50 {results['p50_ms']:.2f} ms, p99 {results['p99_ms']:.2f} ms, max {results['max_ms']:.2f} ms")
+    print(f"{results['bay_winners']} of {results['clients']} clients won the race for bay S0000000")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Throughput of carpark_shards.ShardedCarPark as workers are added, against
+one in-process CarPark replaying the same park/leave events.
+
+Each car parks at most once at a time and every event names its car, so
+batches split cleanly by shard; load time (each worker parsing its slice
+of the files) is reported separately from replay throughput.
+
+Usage: python bench_shards.py [--rows N] [--events N] [--max-workers N]
+"""
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+from io import StringIO
+from typing import Dict, List, Optional
+
+import carpark
+from bench_loaders import write_fixtures
+from carpark_shards import ShardedCarPark
+
+
+def make_events(rows: int, count: int, seed: int = 1) -> List[str]:
+    """Random park/leave events over the CP0000000... cars written by write_fixtures."""
+    rng = random.Random(seed)
+    parked = set()
+    minute = carpark.to_epoch_minutes("2025-10-01 00:00")
+    events = []
+    for i in range(count):
+        reg = f"CP{rng.randrange(rows):07d}"
+        stamp = carpark.format_epoch_minutes(minute + i // 100)
+        if reg in parked:
+            parked.discard(reg)
+            events.append(f"LEAVE, {stamp}, {reg}")
+        else:
+            parked.add(reg)
+            events.append(f"PARK, {stamp}, {reg}, 60")
+    return events
+
+
+def run_single(paths: Dict[str, str], events: List[str]) -> Dict[str, float]:
+    car_park = carpark.CarPark()
+    start = time.perf_counter()
+    car_park.load_spaces(paths["SPACES.txt"])
+    car_park.load_cars(paths["CARS.txt"])
+    car_park.load_parked(paths["PARKED.txt"])
+    load = time.perf_counter() - start
+    stats = carpark.replay_events(events, StringIO(), car_park=car_park)
+    return {"workers": 0, "load_s": load, "events_per_second": stats.events_per_second, "accepted": stats.accepted}
+
+
+def run_sharded(paths: Dict[str, str], events: List[str], workers: int) -> Dict[str, float]:
+    with ShardedCarPark(workers) as shards:
+        start = time.perf_counter()
+        shards.start(paths["SPACES.txt"], paths["CARS.txt"], paths["PARKED.txt"])
+        load = time.perf_counter() - start
+        stats = shards.replay(events)
+    return {"workers": workers, "load_s": load, "events_per_second": stats.events_per_second,
+            "accepted": stats.accepted}
+
+
+def run(rows: int = 1_000_000, count: int = 1_000_000, max_workers: int = 8) -> List[Dict[str, float]]:
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_fixtures(folder, rows)
+        # Start empty, so parks are not refused for want of a space
+        with open(paths["PARKED.txt"], "w") as file:
+            file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
+        events = make_events(rows, count)
+        results = [run_single(paths, events)]
+        workers = 1
+        while workers <= max_workers:
+            results.append(run_sharded(paths, events, workers))
+            workers *= 2
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay throughput of ShardedCarPark against one CarPark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="cars and spaces in the fixtures")
+    parser.add_argument("--events", type=int, default=1_000_000, help="park/leave events to replay")
+    parser.add_argument("--max-workers", type=int, default=8, help="worker counts double from 1 up to this")
+    args = parser.parse_args(argv)
+    print(f"{args.rows:,} cars and spaces, {args.events:,} events, {multiprocessing.cpu_count()} CPUs")
+    print(f"{'Workers':>7} {'Load s':>8} {'Events/s':>12} {'Scaling':>8} {'Accepted':>10}")
+    results = run(args.rows, args.events, args.max_workers)
+    base = results[0]["events_per_second"]
+    for result in results:
+        label = "single" if result["workers"] == 0 else result["workers"]
+        print(f"{label:>7} {result['load_s']:>8.2f} {result['events_per_second']:>12,.0f} "
+              f"{result['events_per_second'] / base:>7.2f}x {result['accepted']:>10,}")
+
+
+if __name__ == "__main__":
+    main()
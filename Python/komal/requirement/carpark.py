@@ -1,203 +1,2813 @@
+import argparse
+import csv
 import datetime
+import gc
+import heapq
+import itertools
+import json
+import mmap
 import os
-from typing import List, Dict, Optional
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass, field
+from enum import IntEnum
+from operator import add, attrgetter, eq, itemgetter
+from typing import BinaryIO, Callable, ClassVar, List, Dict, Iterable, Iterator, Optional, TextIO, Tuple, Union
 
-##data structures
-spaces : List[Dict[str, str]] = []
-cars : List[Dict[str, str]] = {}
-parked: List[Dict[str, str]] = []
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MINUTE = datetime.timedelta(minutes=1)
 
-def load_spaces(filename: str) -> None:
-    '''Load parking spaces from a spaces file.'''
+
+def to_epoch_minutes(value: Union[str, datetime.datetime]) -> int:
+    """Convert a "YYYY-MM-DD HH:MM" string or datetime to whole minutes since 1970."""
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, TIME_FORMAT)
+    return (value - _EPOCH) // _MINUTE
+
+
+def format_epoch_minutes(minutes: int) -> str:
+    """Inverse of to_epoch_minutes, giving the "YYYY-MM-DD HH:MM" form used in the files."""
+    return (_EPOCH + minutes * _MINUTE).strftime(TIME_FORMAT)
+
+
+class SpaceType(IntEnum):
+    """Space types (and entitlements) stored as small integer codes."""
+    STANDARD = 0
+    DISABLED = 1
+    EV = 2
+
+    @property
+    def label(self) -> str:
+        return _SPACE_TYPE_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label: Union[str, "SpaceType"]) -> "SpaceType":
+        """Parse "Standard"/"Disabled"/"EV"; raises ValueError for anything else."""
+        if isinstance(label, SpaceType):
+            return label
+        try:
+            return _SPACE_TYPE_CODES[label]
+        except KeyError:
+            raise ValueError(f"Unknown space type '{label}'") from None
+
+
+_SPACE_TYPE_LABELS = {SpaceType.STANDARD: "Standard", SpaceType.DISABLED: "Disabled", SpaceType.EV: "EV"}
+_SPACE_TYPE_CODES = {label: code for code, label in _SPACE_TYPE_LABELS.items()}
+# The same with the newline that ends a line in the middle of a block
+_SPACE_TYPE_LINE_ENDS = {label + "\n": code for label, code in _SPACE_TYPE_CODES.items()}
+# Indexing this tuple is much cheaper than calling SpaceType(code)
+_SPACE_TYPES_BY_CODE = tuple(SpaceType)
+
+
+class DictView:
+    """Mixin giving slotted records the old dict-style access, e.g. space["occupied"]."""
+    __slots__ = ()
+    _keys: ClassVar[Tuple[str, ...]] = ()
+
+    def __getitem__(self, key: str):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self._keys:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self._keys else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._keys
+
+
+_LEVEL_PART = re.compile(r"Level\s*(\d+)", re.IGNORECASE)
+_BAY_PART = re.compile(r"(\d+)")
+# Level or bay of a location that does not name one; sorts after any real one
+UNKNOWN_COORDINATE = 1 << 30
+
+
+def _coordinate(pattern: re.Pattern, text: str) -> int:
+    match = pattern.search(text)
+    return int(match.group(1)) if match else UNKNOWN_COORDINATE
+
+
+def location_coordinates(location: str) -> Tuple[int, int]:
+    """(level, bay) of a "Level N - Bay NN" location; parts it lacks are UNKNOWN_COORDINATE."""
+    level_text, _, bay_text = location.partition(" - ")
+    return _coordinate(_LEVEL_PART, level_text), _coordinate(_BAY_PART, bay_text)
+
+
+def location_columns(locations: List[str]) -> Tuple[List[int], List[int]]:
+    """location_coordinates over a whole column, parsing each distinct level and bay text once."""
+    parts = list(map(str.partition, locations, itertools.repeat(" - ")))
+    level_texts = list(map(itemgetter(0), parts))
+    bay_texts = list(map(itemgetter(2), parts))
+    levels = {text: _coordinate(_LEVEL_PART, text) for text in set(level_texts)}
+    bays = {text: _coordinate(_BAY_PART, text) for text in set(bay_texts)}
+    return list(map(levels.__getitem__, level_texts)), list(map(bays.__getitem__, bay_texts))
+
+
+@dataclass(slots=True)
+class Space(DictView):
+    """A parking space; `type` reads the label, `type_code` holds the enum.
+
+    `level` and `bay` are parsed from the location on first use unless
+    given, so loading never pays for them; SpaceRegistry fills them in for
+    a whole batch at once when it first needs them. Dict-style writes
+    raise, as the registry's free sets must change along with the space.
+    """
+    id: str
+    location: str
+    type_code: SpaceType
+    occupied: bool = False
+    _level: Optional[int] = field(default=None, repr=False)
+    _bay: Optional[int] = field(default=None, repr=False)
+    _keys: ClassVar[Tuple[str, ...]] = ("id", "location", "type", "occupied")
+
+    @property
+    def level(self) -> int:
+        if self._level is None or self._bay is None:
+            self._level, self._bay = location_coordinates(self.location)
+        return self._level
+
+    @property
+    def bay(self) -> int:
+        if self._level is None or self._bay is None:
+            self._level, self._bay = location_coordinates(self.location)
+        return self._bay
+
+    @property
+    def type(self) -> str:
+        return self.type_code.label
+
+    def __setitem__(self, key: str, value) -> None:
+        raise TypeError(f"Cannot set '{key}': occupy or release spaces through the SpaceRegistry")
+
+
+def _fill_coordinates(spaces: List[Space]) -> None:
+    """Give every space still without them its level and bay, via location_columns."""
+    pending = [space for space in spaces if space._level is None or space._bay is None]
+    levels, bays = location_columns(list(map(attrgetter("location"), pending)))
+    for space, level, bay in zip(pending, levels, bays):
+        space._level, space._bay = level, bay
+
+
+@dataclass(slots=True)
+class Car(DictView):
+    """A registered car; `entitlement` reads and writes the label."""
+    owner: str
+    contract: str
+    entitlement_code: SpaceType
+    _keys: ClassVar[Tuple[str, ...]] = ("owner", "contract", "entitlement")
+
+    @property
+    def entitlement(self) -> str:
+        return self.entitlement_code.label
+
+    @entitlement.setter
+    def entitlement(self, value: Union[str, SpaceType]) -> None:
+        self.entitlement_code = SpaceType.from_label(value)
+
+
+@dataclass(slots=True)
+class ParkedRecord(DictView):
+    """An active parking session with times held as epoch minutes.
+
+    `time_in` and `expected_time_out` give the "YYYY-MM-DD HH:MM" strings.
+    """
+    space_id: str
+    reg: str
+    time_in_min: int
+    expected_out_min: int
+    _keys: ClassVar[Tuple[str, ...]] = ("space_id", "reg", "time_in", "expected_time_out")
+
+    @property
+    def time_in(self) -> str:
+        return format_epoch_minutes(self.time_in_min)
+
+    @time_in.setter
+    def time_in(self, value: Union[str, datetime.datetime]) -> None:
+        self.time_in_min = to_epoch_minutes(value)
+
+    @property
+    def expected_time_out(self) -> str:
+        return format_epoch_minutes(self.expected_out_min)
+
+    @expected_time_out.setter
+    def expected_time_out(self, value: Union[str, datetime.datetime]) -> None:
+        self.expected_out_min = to_epoch_minutes(value)
+
+
+@dataclass(frozen=True, slots=True)
+class FrozenCar(DictView):
+    """A car served from a read-only registry; assigning to it raises rather than being lost."""
+    owner: str
+    contract: str
+    entitlement_code: SpaceType
+    _keys: ClassVar[Tuple[str, ...]] = Car._keys
+
+    @property
+    def entitlement(self) -> str:
+        return self.entitlement_code.label
+
+    def __setitem__(self, key: str, value) -> None:
+        raise TypeError(f"Cannot set '{key}': cars from a memory-mapped index are read-only")
+
+
+class RegisteredCar(DictView):
+    """One CarRegistry row seen as a Car: reads and writes go to the registry's columns."""
+    __slots__ = ("_registry", "_row")
+    _keys: ClassVar[Tuple[str, ...]] = Car._keys
+
+    def __init__(self, registry: "CarRegistry", row: int) -> None:
+        self._registry = registry
+        self._row = row
+
+    @property
+    def owner(self) -> str:
+        return self._registry._owners[self._row]
+
+    @owner.setter
+    def owner(self, value: str) -> None:
+        self._registry._owners[self._row] = value
+
+    @property
+    def contract(self) -> str:
+        return self._registry._contracts[self._row]
+
+    @contract.setter
+    def contract(self, value: str) -> None:
+        self._registry._contracts[self._row] = value
+
+    @property
+    def entitlement_code(self) -> SpaceType:
+        return _SPACE_TYPES_BY_CODE[self._registry._entitlements[self._row]]
+
+    @entitlement_code.setter
+    def entitlement_code(self, value: Union[str, SpaceType]) -> None:
+        self._registry._entitlements[self._row] = SpaceType.from_label(value)
+
+    @property
+    def entitlement(self) -> str:
+        return self.entitlement_code.label
+
+    @entitlement.setter
+    def entitlement(self, value: Union[str, SpaceType]) -> None:
+        self.entitlement_code = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (Car, FrozenCar, RegisteredCar)):
+            return NotImplemented
+        return (self.owner, self.contract, self.entitlement_code) == (other.owner, other.contract, other.entitlement_code)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"RegisteredCar(owner={self.owner!r}, contract={self.contract!r}, entitlement={self.entitlement!r})"
+
+
+class CarRegistry(Mapping):
+    """Registered cars held column-wise, keyed by registration.
+
+    Owners, contracts and entitlement codes sit in parallel columns so a
+    whole chunk of CARS.txt can be appended at once. Looking a registration
+    up gives a RegisteredCar view of its row, so dict-style writes such as
+    cars[reg]["entitlement"] = "EV" land in the registry.
+    """
+
+    def __init__(self) -> None:
+        self._row: Dict[str, int] = {}
+        self._owners: List[str] = []
+        self._contracts: List[str] = []
+        self._entitlements = array('b')
+
+    def __len__(self) -> int:
+        return len(self._row)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._row)
+
+    def __contains__(self, reg: object) -> bool:
+        return reg in self._row
+
+    def __getitem__(self, reg: str) -> RegisteredCar:
+        return RegisteredCar(self, self._row[reg])
+
+    def columns(self) -> Tuple[List[str], List[str], List[str], List[int]]:
+        """Current registrations with their owner, contract and entitlement columns."""
+        rows = list(self._row.values())
+        return (list(self._row), [self._owners[r] for r in rows],
+                [self._contracts[r] for r in rows], [self._entitlements[r] for r in rows])
+
+    def add(self, reg: str, car: Union[Car, RegisteredCar]) -> None:
+        self.extend([reg], [car.owner], [car.contract], [car.entitlement_code])
+
+    def extend(self, regs: Iterable[str], owners: Iterable[str], contracts: Iterable[str],
+               entitlements: Iterable[int]) -> None:
+        """Append columns of equal length; a repeated registration keeps its latest row."""
+        start = len(self._owners)
+        self._owners.extend(owners)
+        self._contracts.extend(contracts)
+        self._entitlements.extend(entitlements)
+        self._row.update(zip(regs, range(start, len(self._owners))))
+
+
+# Space types each entitlement may use, in order of preference.
+ENTITLEMENT_SPACE_TYPES: Dict[SpaceType, List[SpaceType]] = {
+    SpaceType.STANDARD: [SpaceType.STANDARD],
+    SpaceType.DISABLED: [SpaceType.DISABLED, SpaceType.STANDARD],
+    SpaceType.EV: [SpaceType.EV],
+}
+
+
+def allowed_space_types(required_type: Union[str, SpaceType]) -> List[SpaceType]:
+    """Space types usable by an entitlement; unknown entitlements may use none."""
+    try:
+        return ENTITLEMENT_SPACE_TYPES[SpaceType.from_label(required_type)]
+    except ValueError:
+        return []
+
+
+class AllocationPolicy:
+    """How the car park picks a bay when the driver does not choose one.
+
+    Free spaces of each type sit in a heap ordered by key(space), lowest
+    first, so every assignment is O(log n). space_types() gives the types
+    an entitlement may be offered, in order of preference.
+    """
+    name = "first-free"
+
+    def key(self, space: Space) -> Tuple:
+        return space.level, space.bay
+
+    def space_types(self, required_type: Union[str, SpaceType]) -> List[SpaceType]:
+        return allowed_space_types(required_type)
+
+    def claimed(self, space: Space) -> None:
+        """Called with each space the policy hands out."""
+
+
+class NearestEntrance(AllocationPolicy):
+    """Closest bay to the entrance: fewest levels away, then lowest bay number."""
+    name = "nearest"
+
+    def __init__(self, entrance_level: int = 1, entrance_bay: int = 1) -> None:
+        self.entrance_level = entrance_level
+        self.entrance_bay = entrance_bay
+
+    def key(self, space: Space) -> Tuple:
+        return (abs(space.level - self.entrance_level), abs(space.bay - self.entrance_bay),
+                space.level, space.bay)
+
+
+class FillByLevel(AllocationPolicy):
+    """Fill levels one at a time in the given order, so later levels can stay closed."""
+    name = "fill-by-level"
+
+    def __init__(self, level_order: Optional[List[int]] = None) -> None:
+        self.rank = {level: i for i, level in enumerate(level_order or [])}
+
+    def key(self, space: Space) -> Tuple:
+        # Levels missing from the order follow it, lowest first
+        return self.rank.get(space.level, len(self.rank)), space.level, space.bay
+
+
+class SpreadWear(AllocationPolicy):
+    """Hand out the least-used bay, so wear and cleaning spread evenly."""
+    name = "spread-wear"
+
+    def __init__(self) -> None:
+        self.uses: Dict[str, int] = {}
+
+    def key(self, space: Space) -> Tuple:
+        return self.uses.get(space.id, 0), space.level, space.bay
+
+    def claimed(self, space: Space) -> None:
+        self.uses[space.id] = self.uses.get(space.id, 0) + 1
+
+
+class KeepEVBays(AllocationPolicy):
+    """Wrap another policy so EV bays only ever go to EV cars.
+
+    With `ev_overflow`, EV cars fall back to Standard bays once every EV bay
+    is taken, instead of being turned away. The car park then accepts a
+    Standard bay for an EV car everywhere: when assigning one, when the
+    driver names it, and when booking.
+    """
+    name = "keep-ev"
+
+    def __init__(self, inner: Optional[AllocationPolicy] = None, ev_overflow: bool = False) -> None:
+        self.inner = inner or NearestEntrance()
+        self.ev_overflow = ev_overflow
+
+    def key(self, space: Space) -> Tuple:
+        return self.inner.key(space)
+
+    def space_types(self, required_type: Union[str, SpaceType]) -> List[SpaceType]:
+        types = [t for t in self.inner.space_types(required_type) if t != SpaceType.EV]
+        if allowed_space_types(required_type) == [SpaceType.EV]:
+            types = [SpaceType.EV] + ([SpaceType.STANDARD] if self.ev_overflow else [])
+        return types
+
+    def claimed(self, space: Space) -> None:
+        self.inner.claimed(space)
+
+
+ALLOCATION_POLICIES = {policy.name: policy for policy in (NearestEntrance, FillByLevel, SpreadWear, KeepEVBays)}
+
+
+class SpaceRegistry:
+    """Spaces keyed by ID, with free-set indexes per space type and per level.
+
+    Each free set is a dict used as an ordered set (space ID -> space), so
+    lookup, occupy and release are all O(1). `free_by_level` splits the
+    same free spaces by level and then type, so per-level questions only
+    touch that level; `level_sizes` counts every space on each level.
+    Both are built on the first per-level question rather than while
+    loading, and dropped again whenever spaces are added.
+
+    Occupancy changes are safe across threads: each space type has its own
+    lock (a stripe), so claims for different types never wait on each
+    other, and occupy/claim_first test and take a space in one step.
+    Loading (add, add_many, clear) is not; do it before sharing.
+
+    With an allocation policy set, each free set also gets a heap of
+    (policy key, space ID) that claim_first pops from. Entries for spaces
+    taken some other way are skipped when they surface, and the heaps are
+    rebuilt after loading.
+    """
+
+    def __init__(self) -> None:
+        self.by_id: Dict[str, Space] = {}
+        self.free_by_type: Dict[SpaceType, Dict[str, Space]] = {t: {} for t in SpaceType}
+        self._free_by_level: Optional[Dict[int, Dict[SpaceType, Dict[str, Space]]]] = None
+        self._level_sizes: Optional[Dict[int, int]] = None
+        self._locks: Dict[SpaceType, threading.Lock] = {t: threading.Lock() for t in SpaceType}
+        self.policy: Optional[AllocationPolicy] = None
+        self._heaps: Optional[Dict[SpaceType, List[Tuple[Tuple, str]]]] = None
+
+    def clear(self) -> None:
+        self.by_id.clear()
+        for free in self.free_by_type.values():
+            free.clear()
+        self._free_by_level = self._level_sizes = None
+        self._heaps = None
+
+    def set_policy(self, policy: Optional[AllocationPolicy]) -> None:
+        """Choose how claim_first picks a space; None takes the first free one in file order."""
+        self.policy = policy
+        self._heaps = None
+
+    def _policy_heaps(self) -> Dict[SpaceType, List[Tuple[Tuple, str]]]:
+        if self._heaps is None:
+            _fill_coordinates(list(self.by_id.values()))
+            key = self.policy.key
+            heaps = {}
+            for space_type, free in self.free_by_type.items():
+                heaps[space_type] = [(key(space), space_id) for space_id, space in free.items()]
+                heapq.heapify(heaps[space_type])
+            self._heaps = heaps
+        return self._heaps
+
+    def add(self, space: Space) -> bool:
+        """Register a space; returns False if the ID is already known."""
+        if space.id in self.by_id:
+            return False
+        self.by_id[space.id] = space
+        if not space.occupied:
+            self.free_by_type[space.type_code][space.id] = space
+        self._free_by_level = self._level_sizes = None
+        self._heaps = None
+        return True
+
+    def add_many(self, new_spaces: List[Space]) -> bool:
+        """Register a batch of spaces in C-level passes.
+
+        Adds nothing and returns False if any ID clashes.
+        """
+        new_ids = list(map(attrgetter("id"), new_spaces))
+        if len(set(new_ids)) != len(new_ids) or not self.by_id.keys().isdisjoint(new_ids):
+            return False
+        self.by_id.update(zip(new_ids, new_spaces))
+        free_types = list(map(attrgetter("type_code"), new_spaces))
+        if any(map(attrgetter("occupied"), new_spaces)):
+            free_types = [None if space.occupied else code for space, code in zip(new_spaces, free_types)]
+        pairs = list(zip(new_ids, new_spaces))
+        for space_type, free in self.free_by_type.items():
+            free.update(itertools.compress(pairs, map(eq, free_types, itertools.repeat(space_type))))
+        self._free_by_level = self._level_sizes = None
+        self._heaps = None
+        return True
+
+    @property
+    def free_by_level(self) -> Dict[int, Dict[SpaceType, Dict[str, Space]]]:
+        return self._level_index()
+
+    @property
+    def level_sizes(self) -> Dict[int, int]:
+        self._level_index()
+        return self._level_sizes
+
+    def _level_index(self) -> Dict[int, Dict[SpaceType, Dict[str, Space]]]:
+        """free_by_level, built (with level_sizes) from the free sets the first time it is needed.
+
+        Must not be called holding a type lock, unless the index is known
+        to be built already.
+        """
+        by_level = self._free_by_level
+        if by_level is not None:
+            return by_level
+        spaces = list(self.by_id.values())
+        _fill_coordinates(spaces)
+        with self._all_locks():
+            if self._free_by_level is None:
+                by_level = {}
+                for space_type, free in self.free_by_type.items():
+                    for space_id, space in free.items():
+                        pools = by_level.get(space.level)
+                        if pools is None:
+                            pools = by_level[space.level] = {t: {} for t in SpaceType}
+                        pools[space_type][space_id] = space
+                self._level_sizes = Counter(map(attrgetter("level"), spaces))
+                self._free_by_level = by_level
+            return self._free_by_level
+
+    @contextmanager
+    def _all_locks(self) -> Iterator[None]:
+        # Always in SpaceType order; nothing else holds two type locks at once
+        locks = [self._locks[t] for t in SpaceType]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _free_pool(self, space_type: SpaceType, level: Optional[int]) -> Dict[str, Space]:
+        if level is None:
+            return self.free_by_type[space_type]
+        pools = self._level_index().get(level)
+        return pools[space_type] if pools is not None else {}
+
+    def _take(self, space: Space) -> None:
+        # Caller holds the lock for the space's type
+        space.occupied = True
+        del self.free_by_type[space.type_code][space.id]
+        by_level = self._free_by_level
+        if by_level is not None:
+            del by_level[space.level][space.type_code][space.id]
+
+    def get(self, space_id: str) -> Optional[Space]:
+        return self.by_id.get(space_id)
+
+    def occupy(self, space_id: str) -> bool:
+        """Atomically claim a space; returns False if unknown or already taken.
+
+        The policy, if any, is told of the claim as if it had handed the
+        space out, so claims by ID count towards SpreadWear's uses.
+        """
+        space = self.by_id.get(space_id)
+        if space is None:
+            return False
+        with self._locks[space.type_code]:
+            if space.occupied:
+                return False
+            self._take(space)
+            if self.policy is not None:
+                self.policy.claimed(space)
+        return True
+
+    def occupy_many(self, space_ids: Iterable[str]) -> None:
+        """occupy() a batch of spaces under one hold of the locks; unknown or taken IDs are skipped."""
+        policy = self.policy
+        with self._all_locks():
+            for space in map(self.by_id.get, space_ids):
+                if space is not None and not space.occupied:
+                    self._take(space)
+                    if policy is not None:
+                        policy.claimed(space)
+
+    def release_many(self, space_ids: Iterable[str]) -> None:
+        """release() a batch of spaces under one hold of the locks, rebuilding any policy heaps after."""
+        with self._all_locks():
+            by_level = self._free_by_level
+            for space in map(self.by_id.get, space_ids):
+                if space is not None and space.occupied:
+                    space.occupied = False
+                    self.free_by_type[space.type_code][space.id] = space
+                    if by_level is not None:
+                        by_level[space.level][space.type_code][space.id] = space
+            self._heaps = None
+
+    def release(self, space_id: str) -> bool:
+        """Mark a space free again; returns False if unknown or already free."""
+        space = self.by_id.get(space_id)
+        if space is None:
+            return False
+        with self._locks[space.type_code]:
+            if not space.occupied:
+                return False
+            space.occupied = False
+            free = self.free_by_type[space.type_code]
+            free[space_id] = space
+            by_level = self._free_by_level
+            if by_level is not None:
+                by_level[space.level][space.type_code][space_id] = space
+            heaps = self._heaps
+            if heaps is not None:
+                heap = heaps[space.type_code]
+                heapq.heappush(heap, (self.policy.key(space), space_id))
+                if len(heap) > 2 * len(free) + 64:
+                    heaps[space.type_code] = [(self.policy.key(s), s.id) for s in free.values()]
+                    heapq.heapify(heaps[space.type_code])
+        return True
+
+    def space_types(self, required_type: Union[str, SpaceType]) -> List[SpaceType]:
+        """Space types an entitlement may use here, in order of preference, as the policy allows."""
+        if self.policy is None:
+            return allowed_space_types(required_type)
+        return self.policy.space_types(required_type)
+
+    def claim_first(self, required_type: Union[str, SpaceType], level: Optional[int] = None) -> Optional[Space]:
+        """Atomically find and occupy the best free space an entitlement may use.
+
+        Without a policy that is the first free space in file order. With
+        `level`, only that level's free spaces are considered; the policy
+        then ranks them directly rather than through its heaps.
+        """
+        policy = self.policy
+        if policy is not None and level is None:
+            return self._claim_by_policy(required_type)
+        if level is not None:
+            # Build the level index now, as _free_pool runs under a type lock
+            self._level_index()
+        for space_type in self.space_types(required_type):
+            with self._locks[space_type]:
+                free = self._free_pool(space_type, level)
+                if free:
+                    if policy is None:
+                        space = next(iter(free.values()))
+                    else:
+                        space = min(free.values(), key=policy.key)
+                        policy.claimed(space)
+                    self._take(space)
+                    return space
+        return None
+
+    def _claim_by_policy(self, required_type: Union[str, SpaceType]) -> Optional[Space]:
+        policy = self.policy
+        heaps = self._policy_heaps()
+        for space_type in policy.space_types(required_type):
+            free = self.free_by_type[space_type]
+            with self._locks[space_type]:
+                heap = heaps[space_type]
+                while heap:
+                    key, space_id = heapq.heappop(heap)
+                    space = free.get(space_id)
+                    # Skip spaces taken by ID since they were pushed, and outdated keys
+                    if space is None or key != policy.key(space):
+                        continue
+                    self._take(space)
+                    policy.claimed(space)
+                    return space
+        return None
+
+    def count_free(self, required_type: Union[str, SpaceType], level: Optional[int] = None) -> int:
+        """Number of free spaces an entitlement may use, on one level if given."""
+        return sum(len(self._free_pool(t, level)) for t in self.space_types(required_type))
+
+    def first_free(self, required_type: Union[str, SpaceType], level: Optional[int] = None) -> Optional[Space]:
+        """First free space an entitlement may use, preferring its own type."""
+        for space_type in self.space_types(required_type):
+            free = self._free_pool(space_type, level)
+            if free:
+                return next(iter(free.values()))
+        return None
+
+    def iter_free(self, required_type: Union[str, SpaceType], offset: int = 0,
+                  limit: Optional[int] = None, level: Optional[int] = None) -> Iterator[Space]:
+        """Lazily yield free spaces an entitlement may use, skipping `offset` of them."""
+        pools = []
+        for space_type in self.space_types(required_type):
+            free = self._free_pool(space_type, level)
+            if offset >= len(free):
+                offset -= len(free)
+                continue
+            pools.append(itertools.islice(free.values(), offset, None))
+            offset = 0
+        return itertools.islice(itertools.chain.from_iterable(pools), limit)
+
+    def free_list(self, required_type: Union[str, SpaceType], level: Optional[int] = None) -> List[Space]:
+        """Free spaces an entitlement may use, in iter_free order, copied under each type's lock."""
+        if level is not None:
+            self._level_index()
+        free = []
+        for space_type in self.space_types(required_type):
+            with self._locks[space_type]:
+                free.extend(self._free_pool(space_type, level).values())
+        return free
+
+    def iter_free_by_level(self, level: Optional[int] = None,
+                           space_type: Union[str, SpaceType, None] = None) -> Iterator[Space]:
+        """Lazily yield free spaces level by level in bay order, optionally one level or type only."""
+        types = list(SpaceType) if space_type is None else [SpaceType.from_label(space_type)]
+        for number in (self.levels() if level is None else [level]):
+            pools = self._level_index().get(number)
+            if pools is not None:
+                free = []
+                for t in types:
+                    # Copied under the lock, as parks and leaves resize the pools meanwhile
+                    with self._locks[t]:
+                        free.extend(pools[t].values())
+                yield from sorted(free, key=attrgetter("bay"))
+
+    def levels(self) -> List[int]:
+        """Every level with spaces, lowest first; spaces without one come last."""
+        return sorted(self.level_sizes)
+
+    def free_on_level(self, level: int) -> Dict[SpaceType, int]:
+        """Free spaces of each type on one level."""
+        pools = self._level_index().get(level, {})
+        return {space_type: len(pools.get(space_type, ())) for space_type in SpaceType}
+
+
+class ParkedIndex:
+    """Active parking records indexed by registration and by space ID.
+
+    Records live in `records` (the list exposed as `parked`); each record's
+    position is tracked so it can be removed by swapping in the last record,
+    keeping departures O(1). Callers sharing an index across threads hold
+    `lock` around each change; it is only ever held for O(1) work.
+
+    A min-heap of (expected_out_min, seq, record) answers overdue and
+    leaving-soon queries. Departed records are left in it and skipped,
+    and the heap is rebuilt once they outnumber the live ones. Change a
+    record's expected time out only through reschedule().
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.records: List[ParkedRecord] = []
+        self.by_reg: Dict[str, ParkedRecord] = {}
+        self.by_space: Dict[str, ParkedRecord] = {}
+        self._slot: Dict[str, int] = {}
+        self._departures: List[Tuple[int, int, ParkedRecord]] = []
+        self._seq = itertools.count()
+        self._stale = 0
+
+    def clear(self) -> None:
+        self.records.clear()
+        self.by_reg.clear()
+        self.by_space.clear()
+        self._slot.clear()
+        self._departures.clear()
+        self._stale = 0
+
+    def add(self, record: ParkedRecord) -> bool:
+        """Add a record; returns False if its car or space is already in use."""
+        if record.reg in self.by_reg or record.space_id in self.by_space:
+            return False
+        self._slot[record.space_id] = len(self.records)
+        self.records.append(record)
+        self.by_reg[record.reg] = record
+        self.by_space[record.space_id] = record
+        heapq.heappush(self._departures, (record.expected_out_min, next(self._seq), record))
+        return True
+
+    def add_many(self, new_records: List[ParkedRecord]) -> bool:
+        """Add a batch of records; adds nothing and returns False on any clash."""
+        regs = list(map(attrgetter("reg"), new_records))
+        space_ids = list(map(attrgetter("space_id"), new_records))
+        if (len(set(regs)) != len(regs) or len(set(space_ids)) != len(space_ids)
+                or not self.by_reg.keys().isdisjoint(regs) or not self.by_space.keys().isdisjoint(space_ids)):
+            return False
+        self._slot.update(zip(space_ids, range(len(self.records), len(self.records) + len(new_records))))
+        self.records.extend(new_records)
+        self.by_reg.update(zip(regs, new_records))
+        self.by_space.update(zip(space_ids, new_records))
+        self._departures.extend(zip(map(attrgetter("expected_out_min"), new_records), self._seq, new_records))
+        heapq.heapify(self._departures)
+        return True
+
+    def find(self, identifier: str) -> Optional[ParkedRecord]:
+        """Look up an active record by registration or space ID."""
+        return self.by_reg.get(identifier) or self.by_space.get(identifier)
+
+    def remove(self, record: ParkedRecord) -> None:
+        pos = self._slot.pop(record.space_id)
+        last = self.records.pop()
+        if last is not record:
+            self.records[pos] = last
+            self._slot[last.space_id] = pos
+        del self.by_reg[record.reg]
+        del self.by_space[record.space_id]
+        self._stale += 1
+        if self._stale > max(len(self.records), 64):
+            self._rebuild_departures()
+
+    def reschedule(self, record: ParkedRecord, expected_out_min: int) -> None:
+        """Move an active record's expected time out, keeping the heap in step."""
+        record.expected_out_min = expected_out_min
+        heapq.heappush(self._departures, (expected_out_min, next(self._seq), record))
+        self._stale += 1
+
+    def _rebuild_departures(self) -> None:
+        self._departures = list(zip(map(attrgetter("expected_out_min"), self.records), self._seq, self.records))
+        heapq.heapify(self._departures)
+        self._stale = 0
+
+    def due_before(self, before_min: int, after_min: Optional[int] = None) -> List[ParkedRecord]:
+        """Active records expected out before `before_min` (and at or after `after_min`), soonest first.
+
+        Walks only the heap nodes that are due, so the cost is O(k log k)
+        for k matches (plus any departed records still in the heap)
+        rather than a scan of every record.
+        """
+        heap, by_reg = self._departures, self.by_reg
+        found, seen = [], set()
+        pending = [0] if heap else []
+        while pending:
+            i = pending.pop()
+            due, _, record = heap[i]
+            if due >= before_min:
+                continue
+            # Skip departed records and superseded reschedules
+            if (by_reg.get(record.reg) is record and record.expected_out_min == due
+                    and (after_min is None or due >= after_min) and id(record) not in seen):
+                seen.add(id(record))
+                found.append(heap[i])
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    pending.append(child)
+        found.sort()
+        return [entry[2] for entry in found]
+
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class ParkedJournal:
+    """Append-only log of park/leave events kept beside a PARKED.txt snapshot.
+
+    Every event is flushed to the OS straight away and fsync'd in batches of
+    `sync_every`; after `compact_every` events the snapshot is rewritten and
+    the journal emptied. load_parked replays the journal over the snapshot.
+    """
+
+    def __init__(self, snapshot: str, write_snapshot: Callable[[str], None], sync_every: int = 16,
+                 compact_every: int = 1000) -> None:
+        self.snapshot = snapshot
+        self.write_snapshot = write_snapshot
+        self.path = snapshot + JOURNAL_SUFFIX
+        self.sync_every = sync_every
+        self.compact_every = compact_every
+        self._file = open(self.path, "a")
+        self._unsynced = 0
+        self._events = 0
+
+    def record_park(self, record: ParkedRecord) -> None:
+        self._append(f"P, {record.space_id}, {record.reg}, {record.time_in}, {record.expected_time_out}")
+
+    def record_leave(self, record: ParkedRecord) -> None:
+        self._append(f"L, {record.space_id}, {record.reg}")
+
+    def _append(self, line: str) -> None:
+        self._file.write(line + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        self._events += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        if self.compact_every and self._events >= self.compact_every:
+            self.compact()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def reset(self) -> None:
+        """Empty the journal once its events are in the snapshot."""
+        self._file.truncate(0)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._events = 0
+
+    def compact(self) -> None:
+        """Fold the journal into the snapshot file and start it afresh."""
+        self.write_snapshot(self.snapshot)
+        self.reset()
+
+    def close(self) -> None:
+        self.sync()
+        self._file.close()
+
+
+# Filenames that load_*/save_parked/open_journal hand to carpark_sqlite
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def is_sqlite_path(filename: str) -> bool:
+    return filename.lower().endswith(SQLITE_SUFFIXES)
+
+
+LOAD_CHUNK_SIZE = 1 << 20
+MAX_REPORTED_BAD_LINES = 20
+
+
+@dataclass(slots=True)
+class LoadReport:
+    """Outcome of loading one data file: rows kept and lines skipped."""
+    filename: str
+    loaded: int = 0
+    skipped: int = 0
+    bad_lines: List[Tuple[int, str]] = field(default_factory=list)
+    missing: bool = False
+
+    def bad(self, line_no: int, reason: str) -> None:
+        self.skipped += 1
+        if len(self.bad_lines) < MAX_REPORTED_BAD_LINES:
+            self.bad_lines.append((line_no, reason))
+
+    def print_problems(self) -> None:
+        if not self.skipped:
+            return
+        print(f"Skipped {self.skipped} bad line(s) in '{self.filename}':")
+        for line_no, reason in self.bad_lines:
+            print(f"  line {line_no}: {reason}")
+        if self.skipped > len(self.bad_lines):
+            print(f"  ... and {self.skipped - len(self.bad_lines)} more")
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Bulk loads allocate millions of objects and nothing cyclic, so skip GC passes."""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def iter_line_blocks(filename: str, chunk_size: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """Read a data file a large chunk at a time.
+
+    Yields (line number of the first line, block), where each block holds
+    whole lines joined by newlines, without a trailing one.
+    """
+    chunk_size = chunk_size or LOAD_CHUNK_SIZE
+    line_no = 1
+    tail = ""
+    with open(filename, 'r') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            block, newline, tail = (tail + chunk).rpartition("\n")
+            if newline:
+                yield line_no, block
+                line_no += block.count("\n") + 1
+    if tail:
+        yield line_no, tail
+
+
+def split_columns(block: str, fields: int, type_codes: bool = False) -> Optional[List[Union[List[str], array]]]:
+    """Split a clean block straight into `fields` columns in a few C-level passes.
+
+    With `type_codes`, the last column must hold Standard/Disabled/EV
+    labels and comes back as an array of SpaceType codes. Returns None when
+    the block has comments, blank lines or stray whitespace mid-file, or a
+    line without exactly `fields` values (or an unknown label); the caller
+    then falls back to split_rows, which can report line numbers.
+    """
+    while block.startswith("#"):
+        block = block.partition("\n")[2]
+    block = block.strip()
+    if not block:
+        return [[] for _ in range(fields - 1)] + [array('b') if type_codes else []]
+    if "#" in block or "\r" in block or "\n\n" in block or " \n" in block or "\n " in block:
+        return None
+    # Each newline stays on the cell that ends its line. The block is aligned
+    # only if every one of them lands in the last column and the cell count
+    # is exactly fields per line; a matching total alone is not enough, as a
+    # short line and a long one would shift cells between rows.
+    lines = block.count("\n") + 1
+    cells = block.replace("\n", "\n, ").split(", ")
+    if len(cells) != fields * lines:
+        return None
+    if type_codes:
+        # Looking up "label\n" for every line but the last checks the newlines too
+        labels = cells[fields - 1::fields]
+        final = labels.pop()
+        try:
+            codes = array('b', map(_SPACE_TYPE_LINE_ENDS.__getitem__, labels))
+            codes.append(_SPACE_TYPE_CODES[final])
+        except KeyError:
+            return None
+        return [cells[i::fields] for i in range(fields - 1)] + [codes]
+    last = "".join(cells[fields - 1::fields])
+    if last.count("\n") != lines - 1:
+        return None
+    return [cells[i::fields] for i in range(fields - 1)] + [last.split("\n")]
+
+
+def split_rows(block: str, fields: int) -> List[List[str]]:
+    """Split a block line by line; blank and comment lines give empty rows."""
+    return [line.split(", ", fields - 1) if line and line[0] != "#" else []
+            for line in map(str.strip, block.split("\n"))]
+
+
+_time_cache: Dict[str, int] = {}
+# Midnight of each "YYYY-MM-DD" seen, for timestamps missing from _time_cache
+_day_cache: Dict[str, int] = {}
+
+
+def _is_canonical_time(text: str) -> bool:
+    return (len(text) == 16 and text[4] == text[7] == "-" and text[10] == " " and text[13] == ":"
+            and (text[:4] + text[5:7] + text[8:10] + text[11:13] + text[14:16]).isdecimal())
+
+
+def parse_time_minutes(text: str) -> int:
+    """to_epoch_minutes for file timestamps, memoised since sessions share minutes.
+
+    A year of history holds far more distinct minutes than the cache keeps,
+    so unseen times on a known day are built from that day's midnight
+    instead of going through strptime.
+    """
+    minutes = _time_cache.get(text)
+    if minutes is not None:
+        return minutes
+    day = _day_cache.get(text[:10])
+    if day is not None and _is_canonical_time(text) and text[11:13] < "24" and text[14:16] < "60":
+        minutes = day + int(text[11:13]) * 60 + int(text[14:16])
+    else:
+        minutes = to_epoch_minutes(text)
+        if _is_canonical_time(text):
+            if len(_day_cache) >= 1 << 16:
+                _day_cache.clear()
+            _day_cache[text[:10]] = minutes - minutes % 1440
+    if len(_time_cache) >= 1 << 16:
+        _time_cache.clear()
+    _time_cache[text] = minutes
+    return minutes
+
+
+# " HH:MM" -> minutes past midnight, for the time-of-day half of a timestamp
+_CLOCK_MINUTES = {f" {hour:02d}:{minute:02d}": hour * 60 + minute for hour in range(24) for minute in range(60)}
+_DATE_PART = itemgetter(slice(0, 10))
+_CLOCK_PART = itemgetter(slice(10, None))
+
+
+def parse_time_column(texts: List[str]) -> array:
+    """parse_time_minutes over a whole column of canonical timestamps, in C-level passes.
+
+    Each distinct date is parsed once and " HH:MM" is looked up in a table;
+    raises ValueError if any value is not a valid "YYYY-MM-DD HH:MM".
+    """
+    dates = list(map(_DATE_PART, texts))
+    distinct = set(dates)
+    if not all(map(_is_canonical_time, map("{} 00:00".format, distinct))):
+        raise ValueError("timestamps must be 'YYYY-MM-DD HH:MM'")
+    midnights = {date: to_epoch_minutes(date + " 00:00") for date in distinct}
+    try:
+        return array('q', map(add, map(midnights.__getitem__, dates),
+                              map(_CLOCK_MINUTES.__getitem__, map(_CLOCK_PART, texts))))
+    except KeyError as e:
+        raise ValueError(f"bad time of day {e}") from None
+
+
+SNAPSHOT_FILE = "carpark.snap"
+SNAPSHOT_MAGIC = b"CARPARK\x00"
+# Version 2 stores cars as a MappedCarRegistry table, served from the map
+SNAPSHOT_VERSION = 2
+# magic, version, CRC-32 of the body, body length
+_SNAPSHOT_HEADER = struct.Struct("<8sHIQ")
+_BLOB_LENGTH = struct.Struct("<Q")
+# Strings in a column are joined with the ASCII unit separator
+_FIELD_SEP = "\x1f"
+
+
+def _pack_strings(values: List[str]) -> bytes:
+    joined = _FIELD_SEP.join(values)
+    if values and joined.count(_FIELD_SEP) != len(values) - 1:
+        raise ValueError("Text fields may not contain the \\x1f separator")
+    blob = joined.encode("utf-8")
+    return _BLOB_LENGTH.pack(len(blob)) + blob
+
+
+def _car_table(records: List[bytes]) -> bytes:
+    """Offsets then records, as MappedCarRegistry reads them; `records` must be sorted by registration."""
+    offsets = array('Q', itertools.accumulate(map(len, records), initial=0))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return offsets.tobytes() + b"".join(records)
+
+
+def _pack_cars(regs: List[str], owners: List[str], contracts: List[str], entitlements: List[int]) -> bytes:
+    if any(_FIELD_SEP in "".join(column) for column in (regs, owners, contracts)):
+        raise ValueError("Text fields may not contain the \\x1f separator")
+    rows = sorted(zip([reg.encode("utf-8") for reg in regs], owners, contracts, entitlements))
+    records = [_FIELD_SEP.join((reg.decode("utf-8"), owner, contract, str(code))).encode("utf-8")
+               for reg, owner, contract, code in rows]
+    return _car_table(records)
+
+
+def _pack_array(typecode: str, values: Iterable[int]) -> bytes:
+    blob = array(typecode, values)
+    if sys.byteorder != "little":
+        blob.byteswap()
+    blob = blob.tobytes()
+    return _BLOB_LENGTH.pack(len(blob)) + blob
+
+
+def _read_blob(buffer: memoryview, offset: int) -> Tuple[memoryview, int]:
+    (length,) = _BLOB_LENGTH.unpack_from(buffer, offset)
+    start = offset + _BLOB_LENGTH.size
+    if start + length > len(buffer):
+        raise ValueError("truncated section")
+    return buffer[start:start + length], start + length
+
+
+def _read_strings(buffer: memoryview, offset: int, count: int) -> Tuple[List[str], int]:
+    blob, offset = _read_blob(buffer, offset)
+    values = str(blob, "utf-8").split(_FIELD_SEP) if count else []
+    if len(values) != count:
+        raise ValueError("column length mismatch")
+    return values, offset
+
+
+def _read_array(buffer: memoryview, offset: int, typecode: str, count: int) -> Tuple[array, int]:
+    blob, offset = _read_blob(buffer, offset)
+    values = array(typecode)
+    values.frombytes(blob)
+    if sys.byteorder != "little":
+        values.byteswap()
+    if len(values) != count:
+        raise ValueError("column length mismatch")
+    return values, offset
+
+
+def _read_car_table(buffer: memoryview, offset: int, count: int) -> Tuple[int, int]:
+    """Check the cars section; returns where its offset table starts in the body, and the next offset."""
+    blob, end = _read_blob(buffer, offset)
+    table = (count + 1) * _OFFSET.size
+    if table > len(blob) or _OFFSET.unpack_from(blob, table - _OFFSET.size)[0] != len(blob) - table:
+        raise ValueError("cars section length mismatch")
+    return end - len(blob), end
+
+
+def _decode_snapshot(mapped: mmap.mmap) -> Tuple:
+    """Check the header and checksum, then decode every column of a snapshot.
+
+    The cars are left in the map: their column is (offset of their table
+    in the file, count), for MappedCarRegistry.
+    """
+    buffer = memoryview(mapped)
+    magic, version, checksum, length = _SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"not a version {SNAPSHOT_VERSION} snapshot")
+    body = buffer[_SNAPSHOT_HEADER.size:]
+    if len(body) != length or zlib.crc32(body) != checksum:
+        raise ValueError("checksum mismatch")
+    n_spaces, n_cars, n_parked = struct.unpack_from("<QQQ", body)
+    offset = 24
+    columns = []
+    for kind, count in (("s", n_spaces), ("s", n_spaces), ("b", n_spaces), ("cars", n_cars),
+                        ("s", n_parked), ("s", n_parked), ("q", n_parked), ("q", n_parked)):
+        if kind == "cars":
+            table, offset = _read_car_table(body, offset, count)
+            column = (_SNAPSHOT_HEADER.size + table, count)
+        elif kind == "s":
+            column, offset = _read_strings(body, offset, count)
+        else:
+            column, offset = _read_array(body, offset, kind, count)
+        columns.append(column)
+    return tuple(columns)
+
+
+def snapshot_is_fresh(filename: str, sources: Iterable[str]) -> bool:
+    """ True if the snapshot exists and is newer than every source file that exists """
     
-    global spaces
-    spaces = []
     if not os.path.exists(filename):
+        return False
+    snapshot_time = os.path.getmtime(filename)
+    return all(os.path.getmtime(source) <= snapshot_time for source in sources if os.path.exists(source))
+
+
+CARS_INDEX_SUFFIX = ".idx"
+CARS_INDEX_MAGIC = b"CARSIDX\x00"
+CARS_INDEX_VERSION = 1
+# magic, version, number of cars
+_CARS_INDEX_HEADER = struct.Struct("<8sHQ")
+_OFFSET = struct.Struct("<Q")
+
+
+class MappedCarRegistry(Mapping):
+    """Read-only car registry served from a memory-mapped, reg-sorted index.
+
+    The file holds a table of record offsets followed by the records
+    ("REG\\x1fOwner\\x1fContract\\x1fcode") in registration order. Lookups
+    binary-search the table and decode only the record asked for, so
+    resident memory stays flat however long the permit list grows. A
+    binary snapshot holds the same table, and load_snapshot serves its cars
+    through from_map.
+    """
+
+    def __init__(self, index_filename: str) -> None:
+        """Map a cars index; raises ValueError if it is empty, truncated or another format."""
+        file = open(index_filename, "rb")
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            file.close()
+            raise ValueError(f"'{index_filename}' is empty") from None
+        except OSError:
+            file.close()
+            raise
+        try:
+            if len(mapped) < _CARS_INDEX_HEADER.size:
+                raise ValueError(f"'{index_filename}' is truncated")
+            magic, version, count = _CARS_INDEX_HEADER.unpack_from(mapped)
+            if magic != CARS_INDEX_MAGIC or version != CARS_INDEX_VERSION:
+                raise ValueError(f"'{index_filename}' is not a version {CARS_INDEX_VERSION} cars index")
+            self._attach(file, mapped, _CARS_INDEX_HEADER.size, count)
+        except ValueError:
+            mapped.close()
+            file.close()
+            raise
+
+    @classmethod
+    def from_map(cls, file: BinaryIO, mapped: mmap.mmap, table: int, count: int) -> "MappedCarRegistry":
+        """Serve `count` cars from a table at offset `table` of an open map; the registry then owns both."""
+        registry = cls.__new__(cls)
+        registry._attach(file, mapped, table, count)
+        return registry
+
+    @classmethod
+    def from_file(cls, filename: str, table: int, count: int) -> "MappedCarRegistry":
+        """Map a file and serve `count` cars from the table at offset `table`."""
+        file = open(filename, "rb")
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            file.close()
+            raise
+        return cls.from_map(file, mapped, table, count)
+
+    def _attach(self, file: BinaryIO, mapped: mmap.mmap, table: int, count: int) -> None:
+        self._file, self._map, self._count = file, mapped, count
+        self._table = table
+        table_end = table + (count + 1) * _OFFSET.size
+        # Checked before any view of the map exists, so a failure can still close it
+        if table_end > len(mapped) or table_end + _OFFSET.unpack_from(mapped, table_end - _OFFSET.size)[0] > len(mapped):
+            raise ValueError("cars table runs past the end of the file")
+        if sys.byteorder == "little":
+            self._offsets = memoryview(mapped)[table:table_end].cast("Q")
+        else:
+            self._offsets = array('Q', mapped[table:table_end])
+            self._offsets.byteswap()
+        self._data = table_end
+
+    def close(self) -> None:
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._map.close()
+        self._file.close()
+
+    def maps(self, filename: str) -> bool:
+        """True if the cars are served from `filename`."""
+        return os.path.abspath(self._file.name) == os.path.abspath(filename)
+
+    def table_bytes(self) -> bytes:
+        """The offset table and records exactly as mapped, for copying into a snapshot."""
+        return self._map[self._table:self._data + self._offsets[self._count]]
+
+    def _record(self, i: int) -> bytes:
+        return self._map[self._data + self._offsets[i]:self._data + self._offsets[i + 1]]
+
+    def _find(self, reg: str) -> Optional[bytes]:
+        key = reg.encode("utf-8")
+        mapped, offsets, data = self._map, self._offsets, self._data
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            start = data + offsets[mid]
+            probe = mapped[start:mapped.find(b"\x1f", start)]
+            if probe == key:
+                return self._record(mid)
+            if probe < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            record = self._record(i)
+            yield record[:record.index(b"\x1f")].decode("utf-8")
+
+    def __contains__(self, reg: object) -> bool:
+        return isinstance(reg, str) and self._find(reg) is not None
+
+    def __getitem__(self, reg: str) -> FrozenCar:
+        record = self._find(reg) if isinstance(reg, str) else None
+        if record is None:
+            raise KeyError(reg)
+        _, owner, contract, code = record.decode("utf-8").split(_FIELD_SEP)
+        return FrozenCar(owner, contract, _SPACE_TYPES_BY_CODE[int(code)])
+
+    def columns(self) -> Tuple[List[str], List[str], List[str], List[int]]:
+        """Decode every record; snapshots copy table_bytes() instead."""
+        rows = [self._record(i).decode("utf-8").split(_FIELD_SEP) for i in range(self._count)]
+        return ([row[0] for row in rows], [row[1] for row in rows],
+                [row[2] for row in rows], [int(row[3]) for row in rows])
+
+
+def build_cars_index(filename: str, index_filename: str) -> LoadReport:
+    """ Parse CARS.txt once into the sorted index read by MappedCarRegistry """
+    
+    report = LoadReport(filename)
+    records: Dict[bytes, bytes] = {}
+    codes = _SPACE_TYPE_CODES
+    with _gc_paused():
+        for first_line, block in iter_line_blocks(filename):
+            for offset, row in enumerate(split_rows(block, 4)):
+                if not row:
+                    continue
+                if len(row) != 4 or row[3] not in codes or any(_FIELD_SEP in value for value in row):
+                    report.bad(first_line + offset, f"expected 'Reg, Owner, Contact, Standard/Disabled/EV', got {', '.join(row)!r}")
+                    continue
+                reg = row[0].upper()
+                # A repeated registration keeps its latest line, as in load_cars
+                records[reg.encode("utf-8")] = _FIELD_SEP.join(
+                    (reg, row[1], row[2], str(int(codes[row[3]])))).encode("utf-8")
+        ordered = [records[key] for key in sorted(records)]
+    tmp_filename = index_filename + ".tmp"
+    with open(tmp_filename, "wb") as file:
+        file.write(_CARS_INDEX_HEADER.pack(CARS_INDEX_MAGIC, CARS_INDEX_VERSION, len(ordered)))
+        file.write(_car_table(ordered))
+    os.replace(tmp_filename, index_filename)
+    report.loaded = len(ordered)
+    return report
+
+
+HISTORY_FILE = "HISTORY.txt"
+# Entitlement column value for a car no longer in the registry
+UNKNOWN_ENTITLEMENT = -1
+
+
+class ParkingHistory:
+    """Completed parking sessions, kept as columns for analytics.
+
+    Each session is written to the history file, if one is open, as
+    "SpaceID, Reg, Entitlement, TimeIn, TimeOut". It is also appended to
+    the in-memory columns when `keep` is set. load() reads a history file
+    back into the columns. Times are held as epoch minutes.
+    """
+
+    def __init__(self, keep: bool = True) -> None:
+        self.keep = keep
+        self.space_ids: List[str] = []
+        self.regs: List[str] = []
+        self.entitlements = array('b')
+        self.times_in = array('q')
+        self.times_out = array('q')
+        self._file: Optional[TextIO] = None
+
+    def __len__(self) -> int:
+        return len(self.times_in)
+
+    def open(self, filename: str) -> None:
+        """Append every recorded session to `filename` from now on."""
+        self.close()
+        self._file = open(filename, "a")
+        if self._file.tell() == 0:
+            self._file.write("# SpaceID, Reg, Entitlement, TimeIn, TimeOut\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, record: ParkedRecord, time_out: int, entitlement_code: int) -> None:
+        if self._file is not None:
+            label = _SPACE_TYPE_LABELS.get(entitlement_code, "Unknown")
+            self._file.write(f"{record.space_id}, {record.reg}, {label}, {record.time_in}, "
+                             f"{format_epoch_minutes(time_out)}\n")
+            self._file.flush()
+        if self.keep:
+            self.extend([record.space_id], [record.reg], [entitlement_code], [record.time_in_min], [time_out])
+
+    def extend(self, space_ids: Iterable[str], regs: Iterable[str], entitlements: Iterable[int],
+               times_in: Iterable[int], times_out: Iterable[int]) -> None:
+        self.space_ids.extend(space_ids)
+        self.regs.extend(regs)
+        self.entitlements.extend(entitlements)
+        self.times_in.extend(times_in)
+        self.times_out.extend(times_out)
+
+    def load(self, filename: str) -> LoadReport:
+        """Append the sessions in a history file to the columns."""
+        report = LoadReport(filename)
+        if not os.path.exists(filename):
+            report.missing = True
+            return report
+        codes = dict(_SPACE_TYPE_CODES, Unknown=UNKNOWN_ENTITLEMENT)
+        start = len(self)
+        with _gc_paused():
+            for first_line, block in iter_line_blocks(filename):
+                columns = split_columns(block, 5)
+                if columns is not None:
+                    space_ids, regs, entitlements, times_in, times_out = columns
+                    try:
+                        new_columns = (array('b', map(codes.__getitem__, entitlements)),
+                                       parse_time_column(times_in), parse_time_column(times_out))
+                    except (KeyError, ValueError):
+                        pass
+                    else:
+                        self.extend(space_ids, regs, *new_columns)
+                        continue
+                for offset, row in enumerate(split_rows(block, 5)):
+                    if not row:
+                        continue
+                    try:
+                        space_id, reg, entitlement, time_in, time_out = row
+                        values = (codes[entitlement], parse_time_minutes(time_in), parse_time_minutes(time_out))
+                    except (KeyError, ValueError):
+                        report.bad(first_line + offset, f"expected 'SpaceID, Reg, Entitlement, TimeIn, TimeOut', got {', '.join(row)!r}")
+                        continue
+                    self.extend([space_id], [reg], [values[0]], [values[1]], [values[2]])
+        report.loaded = len(self) - start
+        return report
+
+
+PARK_DURATION_STEP = 15
+
+
+@dataclass(slots=True)
+class EventResult:
+    """Outcome of a park or leave request; `message` is fit to show the driver."""
+    ok: bool
+    message: str
+    record: Optional[ParkedRecord] = None
+
+
+@dataclass(slots=True)
+class BatchStats:
+    """Totals for one replayed event stream."""
+    events: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    seconds: float = 0.0
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+
+RESERVATIONS_FILE = "RESERVATIONS.txt"
+
+
+@dataclass(slots=True)
+class Reservation(DictView):
+    """A booking of one space from `start_min` up to (not including) `end_min`, in epoch minutes."""
+    space_id: str
+    reg: str
+    start_min: int
+    end_min: int
+    _keys: ClassVar[Tuple[str, ...]] = ("space_id", "reg", "start", "end")
+
+    @property
+    def start(self) -> str:
+        return format_epoch_minutes(self.start_min)
+
+    @property
+    def end(self) -> str:
+        return format_epoch_minutes(self.end_min)
+
+
+class ReservationBook:
+    """Advance bookings, held per space as sorted, non-overlapping intervals.
+
+    The bookings on one space never overlap, so sorted by start they are
+    sorted by end too. Whether [start, end) is clear is then one bisect on
+    the parallel list of start times, plus a step back over the bookings
+    that end after `start`: O(log k) for k bookings on the space, and O(1)
+    for the many spaces with none. `by_reg` lists each car's bookings.
+
+    CarPark holds `lock` while it adds a booking, and while it parks in a
+    space that has bookings or parks a car that holds one, so a walk-in and
+    a booking never get the same space for overlapping times. Parks in
+    spaces without bookings never touch it.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.by_space: Dict[str, List[Reservation]] = {}
+        self.by_reg: Dict[str, List[Reservation]] = {}
+        self._starts: Dict[str, List[int]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Reservation]:
+        for bookings in self.by_space.values():
+            yield from bookings
+
+    def clear(self) -> None:
+        self.by_space.clear()
+        self.by_reg.clear()
+        self._starts.clear()
+        self._count = 0
+
+    def overlapping(self, space_id: str, start: int, end: int) -> List[Reservation]:
+        """Bookings on a space that overlap [start, end), earliest first."""
+        bookings = self.by_space.get(space_id)
+        if not bookings:
+            return []
+        # Bookings [0, i) start before `end`; of those, the overlapping ones are a run at the end
+        i = j = bisect_left(self._starts[space_id], end)
+        while j > 0 and bookings[j - 1].end_min > start:
+            j -= 1
+        return bookings[j:i]
+
+    def is_clear(self, space_id: str, start: int, end: int, reg: Optional[str] = None) -> bool:
+        """True if no booking, other than `reg`'s own, overlaps [start, end) on the space."""
+        return all(booking.reg == reg for booking in self.overlapping(space_id, start, end))
+
+    def add(self, booking: Reservation) -> bool:
+        """Add a booking; returns False if it overlaps another on its space."""
+        if self.overlapping(booking.space_id, booking.start_min, booking.end_min):
+            return False
+        starts = self._starts.setdefault(booking.space_id, [])
+        i = bisect_left(starts, booking.start_min)
+        starts.insert(i, booking.start_min)
+        self.by_space.setdefault(booking.space_id, []).insert(i, booking)
+        self.by_reg.setdefault(booking.reg, []).append(booking)
+        self._count += 1
+        return True
+
+    def remove(self, booking: Reservation) -> None:
+        bookings = self.by_space[booking.space_id]
+        i = bisect_left(self._starts[booking.space_id], booking.start_min)
+        del bookings[i]
+        del self._starts[booking.space_id][i]
+        if not bookings:
+            del self.by_space[booking.space_id]
+            del self._starts[booking.space_id]
+        self.by_reg[booking.reg].remove(booking)
+        if not self.by_reg[booking.reg]:
+            del self.by_reg[booking.reg]
+        self._count -= 1
+
+    def find(self, reg: str, start: int) -> Optional[Reservation]:
+        """A car's booking starting at `start`, or None."""
+        return next((booking for booking in self.by_reg.get(reg, ()) if booking.start_min == start), None)
+
+    def arriving(self, reg: str, time_in: int) -> Optional[Reservation]:
+        """The booking a car arriving at `time_in` has come for: one running then, or starting within a step."""
+        return next((booking for booking in self.by_reg.get(reg, ())
+                     if booking.start_min - PARK_DURATION_STEP <= time_in < booking.end_min), None)
+
+    def expire(self, before: int) -> int:
+        """Drop bookings that ended by `before` (epoch minutes); returns how many."""
+        stale = [booking for booking in self if booking.end_min <= before]
+        for booking in stale:
+            self.remove(booking)
+        return len(stale)
+
+
+def _kept_columns(keep: Callable[[str], bool], keys: List[str], *columns: List[str]) -> Tuple[List[str], ...]:
+    """Rows whose key passes `keep`, column by column."""
+    mask = list(map(keep, keys))
+    return (list(itertools.compress(keys, mask)),) + tuple(list(itertools.compress(column, mask)) for column in columns)
+
+
+def write_parked_file(filename: str, records: Iterable[ParkedRecord]) -> None:
+    """Atomically rewrite a PARKED.txt snapshot holding `records`."""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as file:
+        file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
+        for record in records:
+            file.write(f"{record.space_id}, {record.reg}, {record.time_in}, {record.expected_time_out}\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class CarPark:
+    """One car park: its spaces, registered cars and active parking sessions.
+
+    Every rule lives here and reports back through return values
+    (LoadReport, EventResult) rather than print or input, so several car
+    parks can run side by side in one process; the menu below is just a
+    client of a default instance. Once loaded, park and leave may be called
+    from several threads at once.
+
+    load_spaces only parses and checks SPACES.txt; the Space objects and
+    their registry are built from its columns the first time `spaces` or
+    `space_registry` is used.
+    """
+
+    def __init__(self) -> None:
+        self._spaces: List[Space] = []
+        self.cars: Mapping = CarRegistry()
+        self._space_registry = SpaceRegistry()
+        # (ids, locations, type codes) from load_spaces, until _build_spaces turns them into spaces
+        self._pending_spaces: Optional[Tuple[List[str], List[str], array]] = None
+        self._spaces_lock = threading.Lock()
+        self.parked_index = ParkedIndex()
+        self.journal: Optional[ParkedJournal] = None
+        self.history: Optional[ParkingHistory] = None
+        self.reservations = ReservationBook()
+        # Bookings file rewritten after every change, once load_reservations(autosave=True) names it
+        self.reservations_file: Optional[str] = None
+        self._reservations_save_lock = threading.Lock()
+
+    @property
+    def spaces(self) -> List[Space]:
+        if self._pending_spaces is not None:
+            self._build_spaces()
+        return self._spaces
+
+    @spaces.setter
+    def spaces(self, spaces: List[Space]) -> None:
+        self._pending_spaces = None
+        self._spaces = spaces
+
+    @property
+    def space_registry(self) -> SpaceRegistry:
+        if self._pending_spaces is not None:
+            self._build_spaces()
+        return self._space_registry
+
+    def _build_spaces(self) -> None:
+        with self._spaces_lock:
+            pending = self._pending_spaces
+            if pending is None:
+                return
+            ids, locations, codes = pending
+            with _gc_paused():
+                spaces = list(map(Space, ids, locations, map(_SPACE_TYPES_BY_CODE.__getitem__, codes)))
+                self._space_registry.add_many(spaces)
+            self._spaces = spaces
+            self._pending_spaces = None
+
+    @property
+    def parked(self) -> List[ParkedRecord]:
+        return self.parked_index.records
+
+    def set_policy(self, policy: Optional[AllocationPolicy]) -> None:
+        """Choose how park picks a space when none is given; see AllocationPolicy."""
+        self.space_registry.set_policy(policy)
+
+    # -- loading and saving ---------------------------------------------------
+
+    def load_spaces(self, filename: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+        """Replace the spaces with those in a SPACES.txt file, or only those whose ID passes `keep`."""
+        if is_sqlite_path(filename):
+            import carpark_sqlite
+            return carpark_sqlite.load_spaces(self, filename, keep)
+        self.spaces = []
+        self._space_registry.clear()
+        report = LoadReport(filename)
+        if not os.path.exists(filename):
+            report.missing = True
+            return report
+        codes = _SPACE_TYPE_CODES
+        ids: List[str] = []
+        locations: List[str] = []
+        space_types = array('b')
+        seen = set()
+        for first_line, block in iter_line_blocks(filename):
+            columns = split_columns(block, 3, type_codes=True)
+            if columns is not None:
+                block_ids, block_locations, block_types = columns
+                if keep is not None:
+                    block_ids, block_locations, block_types = _kept_columns(keep, block_ids, block_locations,
+                                                                            block_types)
+                seen.update(block_ids)
+                if len(seen) == len(ids) + len(block_ids):
+                    ids += block_ids
+                    locations += block_locations
+                    space_types.extend(block_types)
+                    continue
+                # A repeated ID: forget this block's and let the rows below report it
+                seen = set(ids)
+            for offset, row in enumerate(split_rows(block, 3)):
+                # Lines outside `keep` are not checked, so each bad line is reported by one shard
+                if not row or (keep is not None and not keep(row[0])):
+                    continue
+                if len(row) != 3 or row[2] not in codes:
+                    report.bad(first_line + offset, f"expected 'ID, Location, Standard/Disabled/EV', got {', '.join(row)!r}")
+                    continue
+                if row[0] in seen:
+                    report.bad(first_line + offset, f"duplicate space ID '{row[0]}'")
+                    continue
+                seen.add(row[0])
+                ids.append(row[0])
+                locations.append(row[1])
+                space_types.append(codes[row[2]])
+        self._pending_spaces = (ids, locations, space_types)
+        report.loaded = len(ids)
+        return report
+
+    def load_cars(self, filename: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+        """Replace the car registry with a CARS.txt file, or only the registrations that pass `keep`."""
+        if is_sqlite_path(filename):
+            import carpark_sqlite
+            return carpark_sqlite.load_cars(self, filename, keep)
+        cars = CarRegistry()
+        self._replace_cars(cars)
+        report = LoadReport(filename)
+        if not os.path.exists(filename):
+            report.missing = True
+            return report
+        codes = _SPACE_TYPE_CODES
+        for first_line, block in iter_line_blocks(filename):
+            columns = split_columns(block, 4, type_codes=True)
+            if columns is not None:
+                regs, owners, contracts, entitlements = columns
+                regs = list(map(str.upper, regs))
+                if keep is not None:
+                    regs, owners, contracts, entitlements = _kept_columns(keep, regs, owners, contracts, entitlements)
+                cars.extend(regs, owners, contracts, entitlements)
+                continue
+            for offset, row in enumerate(split_rows(block, 4)):
+                if not row or (keep is not None and not keep(row[0].upper())):
+                    continue
+                if len(row) != 4 or row[3] not in codes:
+                    report.bad(first_line + offset, f"expected 'Reg, Owner, Contact, Standard/Disabled/EV', got {', '.join(row)!r}")
+                    continue
+                cars.add(row[0].upper(), Car(row[1], row[2], codes[row[3]]))
+        report.loaded = len(cars)
+        return report
+
+    def _replace_cars(self, cars: Mapping) -> None:
+        """Swap in a new car registry, closing the map of the one it replaces."""
+        old, self.cars = self.cars, cars
+        if isinstance(old, MappedCarRegistry) and old is not cars:
+            old.close()
+
+    def load_cars_mapped(self, filename: str) -> LoadReport:
+        """Serve cars from a memory-mapped index of CARS.txt, rebuilding it if stale."""
+        if not os.path.exists(filename):
+            self._replace_cars(CarRegistry())
+            return LoadReport(filename, missing=True)
+        index_filename = filename + CARS_INDEX_SUFFIX
+        report = LoadReport(filename)
+        if not snapshot_is_fresh(index_filename, [filename]):
+            report = build_cars_index(filename, index_filename)
+        try:
+            cars = MappedCarRegistry(index_filename)
+        except ValueError:
+            report = build_cars_index(filename, index_filename)
+            cars = MappedCarRegistry(index_filename)
+        self._replace_cars(cars)
+        report.loaded = len(self.cars)
+        return report
+
+    def load_parked(self, filename: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+        """Replace the active sessions with PARKED.txt plus its journal, marking spaces occupied.
+
+        With `keep`, only sessions in spaces whose ID passes it are loaded.
+        """
+        if is_sqlite_path(filename):
+            import carpark_sqlite
+            return carpark_sqlite.load_parked(self, filename, keep)
+        parked_index, space_registry = self.parked_index, self.space_registry
+        space_registry.release_many(map(attrgetter("space_id"), parked_index.records))
+        parked_index.clear()
+        report = LoadReport(filename)
+        if not os.path.exists(filename):
+            report.missing = True
+            return report
+        with _gc_paused():
+            for first_line, block in iter_line_blocks(filename):
+                columns = split_columns(block, 4)
+                if columns is not None:
+                    space_ids, regs, times_in, times_out = columns
+                    try:
+                        records = list(map(ParkedRecord, space_ids, map(str.upper, regs),
+                                           parse_time_column(times_in), parse_time_column(times_out)))
+                    except ValueError:
+                        pass
+                    else:
+                        if keep is not None:
+                            mask = list(map(keep, space_ids))
+                            space_ids = list(itertools.compress(space_ids, mask))
+                            records = list(itertools.compress(records, mask))
+                        if parked_index.add_many(records):
+                            space_registry.occupy_many(space_ids)
+                            continue
+                for offset, row in enumerate(split_rows(block, 4)):
+                    if not row or (keep is not None and not keep(row[0])):
+                        continue
+                    try:
+                        spaces_id, reg, time_in, expected_time_out = row
+                        record = ParkedRecord(spaces_id, reg.upper(), parse_time_minutes(time_in),
+                                              parse_time_minutes(expected_time_out))
+                    except ValueError:
+                        report.bad(first_line + offset, f"expected 'SpaceID, Reg, TimeIn, ExpectedTimeOut', got {', '.join(row)!r}")
+                        continue
+                    if not parked_index.add(record):
+                        report.bad(first_line + offset, f"duplicate parking record for '{record.reg}' in space '{spaces_id}'")
+                        continue
+                    # Mark space as occupied
+                    space_registry.occupy(spaces_id)
+        if os.path.exists(filename + JOURNAL_SUFFIX):
+            self._replay_journal(filename + JOURNAL_SUFFIX, report, keep)
+        report.loaded = len(parked_index.records)
+        return report
+
+    def _replay_journal(self, path: str, report: LoadReport, keep: Optional[Callable[[str], bool]] = None) -> None:
+        """Apply journalled events on top of a freshly loaded PARKED.txt."""
+        with open(path, 'r') as file:
+            for line_no, line in enumerate(file, start=1):
+                parts = line.strip().split(", ")
+                # Events are kept by space ID; a line too short for one by its first field
+                if keep is not None and not keep(parts[1] if len(parts) > 1 else parts[0]):
+                    continue
+                try:
+                    if parts[0] == "P" and len(parts) == 5:
+                        record = ParkedRecord(parts[1], parts[2], to_epoch_minutes(parts[3]),
+                                              to_epoch_minutes(parts[4]))
+                        if self.parked_index.add(record):
+                            self.space_registry.occupy(record.space_id)
+                    elif parts[0] == "L" and len(parts) == 3:
+                        record = self.parked_index.by_space.get(parts[1])
+                        if record is not None and record.reg == parts[2]:
+                            self.parked_index.remove(record)
+                            self.space_registry.release(record.space_id)
+                    elif parts != [""]:
+                        raise ValueError(line.strip())
+                except ValueError:
+                    # A line torn by a crash mid-write also ends up here.
+                    report.bad(line_no, f"unreadable journal entry {line.strip()!r} in '{path}'")
+
+    def write_parked_snapshot(self, filename: str) -> None:
+        """Atomically rewrite a PARKED.txt snapshot from the current records."""
+        write_parked_file(filename, self.parked)
+
+    def save_parked(self, filename: str = "PARKED.txt") -> None:
+        """Save the active sessions, folding in the journal if it belongs to this file."""
+        with self.parked_index.lock:
+            if self.journal is not None and self.journal.snapshot == filename:
+                self.journal.compact()
+            elif is_sqlite_path(filename):
+                import carpark_sqlite
+                carpark_sqlite.save_parked(self, filename)
+            else:
+                self.write_parked_snapshot(filename)
+
+    def open_journal(self, filename: str = "PARKED.txt", sync_every: int = 16,
+                     compact_every: int = 1000) -> ParkedJournal:
+        """Start journalling park/leave events against the given PARKED.txt snapshot.
+
+        For a database the events go straight into its parked table instead.
+        """
+        self.close_journal()
+        if is_sqlite_path(filename):
+            import carpark_sqlite
+            self.journal = carpark_sqlite.SqliteJournal(filename, sync_every)
+        else:
+            self.journal = ParkedJournal(filename, self.write_parked_snapshot, sync_every, compact_every)
+        return self.journal
+
+    def close_journal(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def open_history(self, filename: str = HISTORY_FILE, keep: bool = False) -> ParkingHistory:
+        """Log each completed session to a history file, and keep it in memory too if `keep`."""
+        self.close_history()
+        self.history = ParkingHistory(keep)
+        self.history.open(filename)
+        return self.history
+
+    def close_history(self) -> None:
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+
+    def save_snapshot(self, filename: str = SNAPSHOT_FILE) -> None:
+        """Write spaces, cars and active sessions to a versioned binary snapshot.
+
+        Mapped cars are copied across as they are, without decoding them.
+        If they are mapped from `filename` itself, that map is closed while
+        the file is replaced (Windows cannot replace a mapped file) and
+        the cars are then served from the new file.
+        """
+        spaces, parked, cars = self.spaces, self.parked, self.cars
+        if isinstance(cars, MappedCarRegistry):
+            cars_table = cars.table_bytes()
+        else:
+            cars_table = _pack_cars(*cars.columns())
+        sections = [
+            struct.pack("<QQQ", len(spaces), len(cars), len(parked)),
+            _pack_strings([space.id for space in spaces]),
+            _pack_strings([space.location for space in spaces]),
+            _pack_array('b', [space.type_code for space in spaces]),
+            _BLOB_LENGTH.pack(len(cars_table)) + cars_table,
+            _pack_strings([record.space_id for record in parked]),
+            _pack_strings([record.reg for record in parked]),
+            _pack_array('q', [record.time_in_min for record in parked]),
+            _pack_array('q', [record.expected_out_min for record in parked]),
+        ]
+        body = b"".join(sections)
+        header = _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(body), len(body))
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as file:
+            file.write(header)
+            file.write(body)
+            file.flush()
+            os.fsync(file.fileno())
+        if not (isinstance(cars, MappedCarRegistry) and cars.maps(filename)):
+            os.replace(tmp_filename, filename)
+            return
+        table, count = cars._table, len(cars)
+        cars.close()
+        try:
+            os.replace(tmp_filename, filename)
+            table = len(header) + sum(map(len, sections[:4])) + _BLOB_LENGTH.size
+        finally:
+            self.cars = MappedCarRegistry.from_file(filename, table, count)
+
+    def load_snapshot(self, filename: str = SNAPSHOT_FILE) -> None:
+        """Replace all state from a binary snapshot.
+
+        Spaces and sessions are decoded; cars stay in the memory-mapped
+        file and are served read-only from it, as by load_cars_mapped, so
+        the load takes time in proportion to the spaces and sessions only,
+        however many cars are registered. Raises OSError or ValueError,
+        changing nothing, if the file is missing, corrupt or from another
+        format version.
+        """
+        file = open(filename, "rb")
+        error = None
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                columns = _decode_snapshot(mapped)
+            except (ValueError, struct.error) as e:
+                # Keep the message only, so no views into the map outlive it
+                error = str(e)
+        except (OSError, ValueError):
+            file.close()
+            raise
+        if error is not None:
+            mapped.close()
+            file.close()
+            raise ValueError(error)
+        (space_ids, locations, space_types, (cars_table, n_cars),
+         parked_spaces, parked_regs, times_in, times_out) = columns
+        
+        with _gc_paused():
+            occupied = set(parked_spaces)
+            self.spaces = list(map(Space, space_ids, locations, map(_SPACE_TYPES_BY_CODE.__getitem__, space_types),
+                                   map(occupied.__contains__, space_ids)))
+            self.space_registry.clear()
+            self.space_registry.add_many(self.spaces)
+            self._replace_cars(MappedCarRegistry.from_map(file, mapped, cars_table, n_cars))
+            self.parked_index.clear()
+            self.parked_index.add_many(list(map(ParkedRecord, parked_spaces, parked_regs, times_in, times_out)))
+
+    # -- availability ---------------------------------------------------------
+
+    def available_spaces(self, required_type: Union[str, SpaceType] = "Standard",
+                         level: Optional[int] = None) -> List[Space]:
+        return self.space_registry.free_list(required_type, level=level)
+
+    def count_available(self, required_type: Union[str, SpaceType] = "Standard", level: Optional[int] = None) -> int:
+        return self.space_registry.count_free(required_type, level)
+
+    def first_available(self, required_type: Union[str, SpaceType] = "Standard",
+                        level: Optional[int] = None) -> Optional[Space]:
+        return self.space_registry.first_free(required_type, level)
+
+    def iter_available(self, required_type: Union[str, SpaceType] = "Standard", page: int = 0,
+                       page_size: int = 20, level: Optional[int] = None) -> Iterator[Space]:
+        """One page of the free spaces an entitlement may use, on one level if given."""
+        if page < 0 or page_size <= 0:
+            raise ValueError("page must be >= 0 and page_size must be positive")
+        return self.space_registry.iter_free(required_type, page * page_size, page_size, level)
+
+    # -- parking and leaving --------------------------------------------------
+
+    def check_can_park(self, reg: str) -> Optional[str]:
+        """Why `reg` may not park right now, or None if it may."""
+        if reg not in self.cars:
+            return f"Car with registration '{reg}' is not registered in this car park."
+        if reg in self.parked_index.by_reg:
+            return f"Car '{reg}' is already parked in space '{self.parked_index.by_reg[reg].space_id}'."
+        return None
+
+    @staticmethod
+    def check_duration(duration: int) -> Optional[str]:
+        if duration <= 0 or duration % PARK_DURATION_STEP != 0:
+            return f"Invalid duration. Please enter a positive multiple of {PARK_DURATION_STEP}."
+        return None
+
+    def park(self, reg: str, duration: int, space_id: Optional[str] = None,
+             time_in: Optional[int] = None, level: Optional[int] = None,
+             entitlement: Union[str, SpaceType, None] = None) -> EventResult:
+        """Park a registered car for `duration` minutes.
+
+        Uses `space_id` if given, otherwise the best free space the car's
+        entitlement allows, on `level` if given; `time_in` is in epoch
+        minutes and defaults to now. Pass `entitlement` for a car that is
+        registered elsewhere (another shard), to skip the registry lookup.
+
+        A car arriving for its booking gets the booked space. No car is
+        given a space booked by another car for any part of its stay.
+        """
+        reg = reg.upper()
+        if entitlement is None:
+            error = self.check_can_park(reg) or self.check_duration(duration)
+            if error:
+                return EventResult(False, error)
+            entitlement = self.cars[reg].entitlement_code
+        else:
+            entitlement = SpaceType.from_label(entitlement)
+            existing = self.parked_index.by_reg.get(reg)
+            error = (f"Car '{reg}' is already parked in space '{existing.space_id}'." if existing is not None
+                     else self.check_duration(duration))
+            if error:
+                return EventResult(False, error)
+        if time_in is None:
+            time_in = to_epoch_minutes(datetime.datetime.now())
+        space, error = self._claim_space(entitlement, space_id, level)
+        book = self.reservations
+        used = 0
+        # Only a space with bookings, or a car holding one, needs the lock. A booking
+        # added to the space after this check finds it occupied, and reserve backs out.
+        candidate = space.id if space is not None else space_id
+        if book and (candidate in book.by_space or reg in book.by_reg):
+            # Recheck under the lock, so a booking made while claiming is seen
+            with book.lock:
+                if space is not None and not book.is_clear(space.id, time_in, time_in + duration, reg):
+                    self.space_registry.release(space.id)
+                    space = None
+                if space is None or book.by_reg.get(reg):
+                    before = len(book)
+                    space, error = self._claim_around_bookings(reg, entitlement, space_id, level, time_in,
+                                                               time_in + duration, space)
+                    used = before - len(book)
+            if used:
+                self._reservations_changed()
+        if space is None:
+            return EventResult(False, error)
+        
+        #parking record
+        record = ParkedRecord(space.id, reg, time_in, time_in + duration)
+        with self.parked_index.lock:
+            added = self.parked_index.add(record)
+            # Journal under the same lock so events land in the order they happened
+            if added and self.journal is not None:
+                self.journal.record_park(record)
+        if not added:
+            # The same car was parked by another caller since the check above
+            self.space_registry.release(space.id)
+            return EventResult(False, self.check_can_park(reg) or f"Car '{reg}' could not be parked.")
+        return EventResult(True, f"Car '{reg}' parked in space '{space.id}' until {record.expected_time_out}.", record)
+
+    def _claim_space(self, entitlement: SpaceType, space_id: Optional[str],
+                     level: Optional[int]) -> Tuple[Optional[Space], Optional[str]]:
+        """Occupy `space_id`, or the best free space for the entitlement; (space, None) or (None, why not)."""
+        if space_id is None:
+            space = self.space_registry.claim_first(entitlement, level)
+            if space is None:
+                where = "" if level is None else f" on level {level}"
+                return None, f"No available parking spaces{where} for entitlement '{entitlement.label}'."
+            return space, None
+        space = self.space_registry.get(space_id)
+        if space is None:
+            return None, f"Space '{space_id}' does not exist."
+        if space.type_code not in self.space_registry.space_types(entitlement):
+            return None, f"Space '{space_id}' is a {space.type} space, not usable with entitlement '{entitlement.label}'."
+        # Claiming is atomic, so of two callers racing for a space only one gets it
+        if not self.space_registry.occupy(space.id):
+            return None, f"Space '{space_id}' is already occupied."
+        return space, None
+
+    def _claim_around_bookings(self, reg: str, entitlement: SpaceType, space_id: Optional[str], level: Optional[int],
+                               time_in: int, time_out: int,
+                               claimed: Optional[Space]) -> Tuple[Optional[Space], Optional[str]]:
+        """_claim_space for a car park with bookings; call with reservations.lock held.
+
+        `claimed` is a space already taken for the car and clear of other
+        bookings, kept unless the car has come for a booking of its own.
+        The bookings the car parks against are used up.
+        """
+        book = self.reservations
+        booking = book.arriving(reg, time_in) if space_id is None else None
+        if booking is not None and booking.space_id != getattr(claimed, "id", None) \
+                and book.is_clear(booking.space_id, time_in, time_out, reg) \
+                and self.space_registry.occupy(booking.space_id):
+            if claimed is not None:
+                self.space_registry.release(claimed.id)
+            claimed = self.space_registry.get(booking.space_id)
+        if claimed is None:
+            if space_id is not None:
+                clash = next((b for b in book.overlapping(space_id, time_in, time_out) if b.reg != reg), None)
+                if clash is not None:
+                    return None, f"Space '{space_id}' is reserved from {clash.start} to {clash.end}."
+            # Set aside spaces booked by other cars until one is clear for the whole stay
+            skipped = []
+            try:
+                while True:
+                    claimed, error = self._claim_space(entitlement, space_id, level)
+                    if claimed is None or book.is_clear(claimed.id, time_in, time_out, reg):
+                        break
+                    skipped.append(claimed)
+            finally:
+                for space in skipped:
+                    self.space_registry.release(space.id)
+            if claimed is None:
+                return None, error
+        for booking in book.overlapping(claimed.id, time_in, time_out):
+            book.remove(booking)
+        return claimed, None
+
+    def leave(self, identifier: str, time_out: Optional[int] = None) -> EventResult:
+        """Remove a car, found by registration or space ID.
+
+        `time_out` (epoch minutes, default now) is only used for the history.
+        """
+        identifier = identifier.upper()
+        with self.parked_index.lock:
+            record = self.parked_index.find(identifier)
+            if record is None:
+                return EventResult(False, f"Car '{identifier}' not found in the car park.")
+            self.parked_index.remove(record)
+            if self.journal is not None:
+                self.journal.record_leave(record)
+            if self.history is not None:
+                if time_out is None:
+                    time_out = to_epoch_minutes(datetime.datetime.now())
+                car = self.cars.get(record.reg)
+                self.history.record(record, time_out, car.entitlement_code if car else UNKNOWN_ENTITLEMENT)
+        # Free the space last, so its next park is journalled after this leave
+        self.space_registry.release(record.space_id)
+        return EventResult(True, f"Car '{identifier}' has left the car park from space '{record.space_id}'.", record)
+
+    def overdue(self, now: Optional[int] = None) -> List[ParkedRecord]:
+        """Cars past their expected time out at `now` (epoch minutes, default now), longest overdue first."""
+        if now is None:
+            now = to_epoch_minutes(datetime.datetime.now())
+        with self.parked_index.lock:
+            return self.parked_index.due_before(now)
+
+    def leaving_within(self, minutes: int, now: Optional[int] = None) -> List[ParkedRecord]:
+        """Cars not yet overdue whose expected time out falls in the next `minutes`, soonest first."""
+        if now is None:
+            now = to_epoch_minutes(datetime.datetime.now())
+        with self.parked_index.lock:
+            return self.parked_index.due_before(now + minutes, now)
+
+    def iter_parked(self, level: Optional[int] = None, space_type: Union[str, SpaceType, None] = None,
+                    owner: Optional[str] = None, overdue_at: Optional[int] = None) -> Iterator[ParkedRecord]:
+        """Lazily yield the parked records that pass every filter given.
+
+        `owner` matches any part of the owner's name, ignoring case.
+        `overdue_at` (epoch minutes) keeps only cars past their expected
+        time out by then, longest overdue first.
+        """
+        if overdue_at is not None:
+            records = self.overdue(overdue_at)
+        else:
+            # Walk a copy, so parks and leaves meanwhile cannot skip or repeat a record
+            with self.parked_index.lock:
+                records = list(self.parked_index.records)
+        if space_type is not None:
+            space_type = SpaceType.from_label(space_type)
+        if owner is not None:
+            owner = owner.casefold()
+        get_space = self.space_registry.get
+        for record in records:
+            if level is not None or space_type is not None:
+                space = get_space(record.space_id)
+                if space is None or (level is not None and space.level != level) \
+                        or (space_type is not None and space.type_code != space_type):
+                    continue
+            if owner is not None:
+                car = self.cars.get(record.reg)
+                if car is None or owner not in car.owner.casefold():
+                    continue
+            yield record
+
+    # -- reservations ---------------------------------------------------------
+
+    def _clear_of_walk_ins(self, space: Space, start: int) -> bool:
+        """True if nobody parked in `space` is expected to stay past `start`."""
+        if not space.occupied:
+            return True
+        # Occupied but not yet recorded means a park is in progress; its end is unknown
+        record = self.parked_index.by_space.get(space.id)
+        return record is not None and record.expected_out_min <= start
+
+    def is_free_over(self, space_id: str, start: int, end: int) -> bool:
+        """True if a space has no booking in [start, end) and its current car is due out by `start`."""
+        space = self.space_registry.get(space_id)
+        return (space is not None and self.reservations.is_clear(space_id, start, end)
+                and self._clear_of_walk_ins(space, start))
+
+    def find_free_over(self, required_type: Union[str, SpaceType], start: int, end: int,
+                       level: Optional[int] = None) -> Optional[Space]:
+        """The first space an entitlement may use that is free over [start, end), or None.
+
+        Free spaces come first, in claim order, then those whose car is due
+        out by `start`. Spaces without bookings are accepted on sight.
+        """
+        book = self.reservations
+        for space in self.space_registry.free_list(required_type, level=level):
+            if book.is_clear(space.id, start, end):
+                return space
+        allowed = self.space_registry.space_types(required_type)
+        with self.parked_index.lock:
+            leaving = self.parked_index.due_before(start + 1)
+        for record in leaving:
+            space = self.space_registry.get(record.space_id)
+            if (space is not None and space.type_code in allowed and (level is None or space.level == level)
+                    and book.is_clear(space.id, start, end)):
+                return space
+        return None
+
+    def reserve(self, reg: str, start: int, end: int, space_id: Optional[str] = None,
+                level: Optional[int] = None) -> EventResult:
+        """Book a space for a registered car from `start` up to `end` (epoch minutes).
+
+        Both times must fall on a PARK_DURATION_STEP boundary. Uses
+        `space_id` if given, otherwise find_free_over for the car's
+        entitlement, on `level` if given. A car may hold several bookings,
+        but not overlapping ones.
+        """
+        reg = reg.upper()
+        car = self.cars.get(reg)
+        if car is None:
+            return EventResult(False, f"Car with registration '{reg}' is not registered in this car park.")
+        if end <= start or start % PARK_DURATION_STEP or end % PARK_DURATION_STEP:
+            return EventResult(False, f"Invalid booking. Start and end must fall on {PARK_DURATION_STEP}-minute "
+                                      f"boundaries, with the end after the start.")
+        book = self.reservations
+        with book.lock:
+            own = next((b for b in book.by_reg.get(reg, ()) if b.start_min < end and start < b.end_min), None)
+            if own is not None:
+                return EventResult(False, f"Car '{reg}' already has space '{own.space_id}' booked from "
+                                          f"{own.start} to {own.end}.")
+            if space_id is None:
+                space = self.find_free_over(car.entitlement_code, start, end, level)
+                if space is None:
+                    where = "" if level is None else f" on level {level}"
+                    return EventResult(False, f"No parking spaces{where} for entitlement '{car.entitlement}' are free "
+                                              f"from {format_epoch_minutes(start)} to {format_epoch_minutes(end)}.")
+            else:
+                space = self.space_registry.get(space_id)
+                if space is None:
+                    return EventResult(False, f"Space '{space_id}' does not exist.")
+                if space.type_code not in self.space_registry.space_types(car.entitlement_code):
+                    return EventResult(False, f"Space '{space_id}' is a {space.type} space, not usable with "
+                                              f"entitlement '{car.entitlement}'.")
+                if not self.is_free_over(space_id, start, end):
+                    return EventResult(False, f"Space '{space_id}' is not free from {format_epoch_minutes(start)} "
+                                              f"to {format_epoch_minutes(end)}.")
+            booking = Reservation(space.id, reg, start, end)
+            book.add(booking)
+            # A walk-in that claimed the space before the booking was added has not seen it
+            if not self._clear_of_walk_ins(space, start):
+                book.remove(booking)
+                return EventResult(False, f"Space '{space.id}' was taken while booking; please try again.")
+        self._reservations_changed()
+        return EventResult(True, f"Space '{space.id}' reserved for '{reg}' from {booking.start} to {booking.end}.")
+
+    def cancel_reservation(self, reg: str, start: int) -> EventResult:
+        """Cancel a car's booking starting at `start` (epoch minutes)."""
+        reg = reg.upper()
+        book = self.reservations
+        with book.lock:
+            booking = book.find(reg, start)
+            if booking is None:
+                return EventResult(False, f"Car '{reg}' has no booking starting {format_epoch_minutes(start)}.")
+            book.remove(booking)
+        self._reservations_changed()
+        return EventResult(True, f"Booking of space '{booking.space_id}' for '{reg}' from {booking.start} cancelled.")
+
+    def load_reservations(self, filename: str = RESERVATIONS_FILE, autosave: bool = False) -> LoadReport:
+        """Replace the bookings with those in a "SpaceID, Reg, Start, End" file.
+
+        With `autosave`, every later booking, cancellation or booking used
+        up by a park rewrites the file before the call returns, so a crash
+        loses none of them.
+        """
+        book = self.reservations
+        book.clear()
+        self.reservations_file = filename if autosave else None
+        report = LoadReport(filename)
+        if not os.path.exists(filename):
+            report.missing = True
+            return report
+        for first_line, block in iter_line_blocks(filename):
+            for offset, row in enumerate(split_rows(block, 4)):
+                if not row:
+                    continue
+                try:
+                    space_id, reg, start, end = row
+                    booking = Reservation(space_id, reg.upper(), parse_time_minutes(start), parse_time_minutes(end))
+                except ValueError:
+                    report.bad(first_line + offset, f"expected 'SpaceID, Reg, Start, End', got {', '.join(row)!r}")
+                    continue
+                if space_id not in self.space_registry.by_id or booking.end_min <= booking.start_min:
+                    report.bad(first_line + offset, f"booking of unknown space '{space_id}' or with no length")
+                elif not book.add(booking):
+                    report.bad(first_line + offset, f"booking of space '{space_id}' overlaps another")
+        report.loaded = len(book)
+        return report
+
+    def save_reservations(self, filename: str = RESERVATIONS_FILE) -> None:
+        """Atomically rewrite the bookings file, earliest booking first."""
+        # One save at a time, so a later change is never overwritten by an earlier copy
+        with self._reservations_save_lock:
+            with self.reservations.lock:
+                bookings = sorted(self.reservations, key=attrgetter("start_min", "space_id"))
+            tmp_filename = filename + ".tmp"
+            with open(tmp_filename, "w") as file:
+                file.write("# SpaceID, Reg, Start, End\n")
+                for booking in bookings:
+                    file.write(f"{booking.space_id}, {booking.reg}, {booking.start}, {booking.end}\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_filename, filename)
+
+    def _reservations_changed(self) -> None:
+        if self.reservations_file is not None:
+            self.save_reservations(self.reservations_file)
+
+    def apply_event(self, line: str) -> EventResult:
+        """Apply "PARK, YYYY-MM-DD HH:MM, REG, MINUTES[, SPACE]" or "LEAVE, YYYY-MM-DD HH:MM, REG-OR-SPACE"."""
+        parts = line.split(", ")
+        kind = parts[0].upper()
+        try:
+            if kind == "PARK" and len(parts) in (4, 5):
+                space_id = parts[4] if len(parts) == 5 else None
+                return self.park(parts[2], int(parts[3]), space_id, parse_time_minutes(parts[1]))
+            if kind == "LEAVE" and len(parts) == 3:
+                return self.leave(parts[2], parse_time_minutes(parts[1]))
+        except ValueError:
+            pass
+        return EventResult(False, f"Malformed event {line!r}.")
+
+
+class OverstayMonitor:
+    """Background sweep raising an event for each car that overstays.
+
+    Every `interval` seconds the car park's overdue list is checked and
+    `on_overstay(record, minutes_over)` is called once for each car newly
+    past its expected time out. check() runs one sweep by hand.
+    """
+
+    def __init__(self, car_park: CarPark, interval: float = 60.0,
+                 on_overstay: Optional[Callable[[ParkedRecord, int], None]] = None,
+                 clock: Optional[Callable[[], int]] = None) -> None:
+        self.car_park = car_park
+        self.interval = interval
+        self.on_overstay = on_overstay or self._print_overstay
+        self.clock = clock or (lambda: to_epoch_minutes(datetime.datetime.now()))
+        self._reported: set = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _print_overstay(record: ParkedRecord, minutes_over: int) -> None:
+        print(f"Overstay: car '{record.reg}' in space '{record.space_id}' was due out at "
+              f"{record.expected_time_out} ({minutes_over} min over).")
+
+    def check(self) -> List[ParkedRecord]:
+        """Run one sweep, returning the records newly reported as overdue."""
+        now = self.clock()
+        overdue = self.car_park.overdue(now)
+        keys = [(record.reg, record.space_id, record.time_in_min, record.expected_out_min) for record in overdue]
+        fresh = [record for record, key in zip(overdue, keys) if key not in self._reported]
+        # Keep only the current overdue set, so cars that left are forgotten
+        self._reported = set(keys)
+        for record in fresh:
+            self.on_overstay(record, now - record.expected_out_min)
+        return fresh
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="overstay-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
+# The console menu and the module-level functions below drive this instance.
+default_car_park = CarPark()
+
+
+def __getattr__(name: str):
+    # spaces, cars, parked etc. read through to the default car park
+    if name in ("spaces", "cars", "parked", "space_registry", "parked_index", "journal"):
+        return getattr(default_car_park, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_spaces(filename: str, car_park: Optional[CarPark] = None) -> LoadReport:
+    '''Load parking spaces from a spaces file.'''
+    
+    report = (car_park or default_car_park).load_spaces(filename)
+    if report.missing:
         print(f"Spaces file '{filename}' not found.")
-        return
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                spaces_id, location, space_type = line.split(", ", 2)
-                spaces.append({
-                    "id": spaces_id,
-                    "location": location,
-                    "type": space_type,
-                    "occupied": False
-                })
+    report.print_problems()
+    return report
                 
-def load_cars(filename: str) -> None:
+def load_cars(filename: str, car_park: Optional[CarPark] = None) -> LoadReport:
     '''Load registration cars from CARS.txt file'''
-    global cars
-    cars = {}
-    if not os.path.exists(filename):
+    report = (car_park or default_car_park).load_cars(filename)
+    if report.missing:
         print(f"Cars file '{filename}' not found.")
-        return
+    report.print_problems()
+    return report
+
+def load_cars_mapped(filename: str, car_park: Optional[CarPark] = None) -> LoadReport:
+    """ Serve cars from a memory-mapped index of CARS.txt, rebuilding it if stale """
     
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                reg, name, contract, entitlement = line.split(", ", 3)
-                cars[reg.upper()] = {
-                    "owner": name,
-                    "contract": contract,
-                    "entitlement": entitlement
-                }
+    report = (car_park or default_car_park).load_cars_mapped(filename)
+    if report.missing:
+        print(f"Cars file '{filename}' not found.")
+    report.print_problems()
+    return report
                 
-def load_parked(filename: str) -> None:
+def load_parked(filename: str, car_park: Optional[CarPark] = None) -> LoadReport:
     """ load current parked cars and mark spaces as occupied """
     
-    global parked
-    parked = []
-    if not os.path.exists(filename):
+    report = (car_park or default_car_park).load_parked(filename)
+    if report.missing:
         print(f"Parked file '{filename}' not found.")
-        return
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                spaces_id, reg, time_in, expected_time_out = line.split(", ", 3)
-                parked.append({
-                    "space_id": spaces_id,
-                    "reg": reg.upper(),
-                    "time_in": time_in,
-                    "expected_time_out": expected_time_out
-                })
-                # Mark space as occupied
-                for space in spaces:
-                    if space["id"] == spaces_id:
-                        space["occupied"] = True
-                        break
-                    
-def save_parked(filename: str = "PARKED.txt") -> None:
+    report.print_problems()
+    return report
+
+def save_parked(filename: str = "PARKED.txt", car_park: Optional[CarPark] = None) -> None:
     """ Save current parked cars to PARKED.txt file """
     
-    with open(filename, "w") as file:
-        file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
-        for record in parked:
-            file.write(f"{record['space_id']}, {record['reg']}, {record['time_in']}, {record['expected_time_out']}\n")
-            
+    (car_park or default_car_park).save_parked(filename)
     print(f" Parked cars saved successfully to '{filename}'")
+
+def save_snapshot(filename: str = SNAPSHOT_FILE, car_park: Optional[CarPark] = None) -> None:
+    """ Write spaces, cars and active sessions to a versioned binary snapshot """
     
+    (car_park or default_car_park).save_snapshot(filename)
+
+def load_snapshot(filename: str = SNAPSHOT_FILE, car_park: Optional[CarPark] = None) -> bool:
+    """ Load state from a binary snapshot; returns False, changing nothing, if it is unusable """
     
-def get_available_spaces(required_type: str = "Standard") -> List[Dict[str, str]]:
+    try:
+        (car_park or default_car_park).load_snapshot(filename)
+    except (OSError, ValueError) as e:
+        print(f"Snapshot '{filename}' not used: {e}")
+        return False
+    return True
+
+def open_journal(filename: str = "PARKED.txt", sync_every: int = 16, compact_every: int = 1000) -> ParkedJournal:
+    """Start journalling park/leave events against the given PARKED.txt snapshot."""
+    return default_car_park.open_journal(filename, sync_every, compact_every)
+
+def close_journal() -> None:
+    default_car_park.close_journal()
+
+def get_available_spaces(required_type: str = "Standard", level: Optional[int] = None) -> List[Space]:
     """ Get a list of available parking spaces of a specific type """
     
-    available = []
-    for space in spaces:
-        if not space["occupied"]:
-            if space["type"] == required_type or \
-                (required_type == "Disabled" and space["type"] == "Standard"):
-                    available.append(space)
-            elif required_type == "Standard" and space["type"] in ["Standard", "Disabled", "EV"]:
-                if space["type"] == "Standard":
-                    available.append(space)
-            elif required_type == "EV" and space["type"] in ["EV" ]:
-                available.append(space)
-    return available
-def park_car() -> None:
+    return default_car_park.available_spaces(required_type, level)
+
+def count_available_spaces(required_type: str = "Standard", level: Optional[int] = None) -> int:
+    """ Count available parking spaces for an entitlement without listing them """
+    
+    return default_car_park.count_available(required_type, level)
+
+def first_available_space(required_type: str = "Standard", level: Optional[int] = None) -> Optional[Space]:
+    """ Return the first available parking space for an entitlement, or None """
+    
+    return default_car_park.first_available(required_type, level)
+
+def iter_available_spaces(required_type: str = "Standard", page: int = 0,
+                          page_size: int = 20, level: Optional[int] = None) -> Iterator[Space]:
+    """ Iterate one page of available parking spaces for an entitlement """
+    
+    return default_car_park.iter_available(required_type, page, page_size, level)
+
+def park_vehicle(reg: str, duration: int, space_id: Optional[str] = None,
+                 time_in: Optional[int] = None, level: Optional[int] = None) -> EventResult:
+    """ Park a car in the default car park; see CarPark.park """
+    return default_car_park.park(reg, duration, space_id, time_in, level)
+
+def remove_vehicle(identifier: str) -> EventResult:
+    """ Remove a car from the default car park; see CarPark.leave """
+    return default_car_park.leave(identifier)
+
+def apply_event(line: str) -> EventResult:
+    """ Apply one event line to the default car park; see CarPark.apply_event """
+    return default_car_park.apply_event(line)
+
+def park_car(car_park: Optional[CarPark] = None) -> None:
     """Main function to park a car"""
+    car_park = car_park or default_car_park
     try:
         reg = input("\nEnter car registration number: ").strip().upper()
-        if reg not in cars:
-            print(f" Car with registration '{reg}' is not registered in this car park.")
+        error = car_park.check_can_park(reg)
+        if error:
+            print(f" {error}")
             return
         
-        car = cars[reg]
-        entitlement = car["entitlement"]
-        duration_str = input("Enter expected parking duration in minutes (multiple of 15): ").strip()
+        car = car_park.cars[reg]
+        duration_str = input(f"Enter expected parking duration in minutes (multiple of {PARK_DURATION_STEP}): ").strip()
         duration = int(duration_str)
         
-        if duration <= 0 or duration % 15 != 0:
-            print(" Invalid duration. Please enter a positive multiple of 15.")
+        error = car_park.check_duration(duration)
+        if error:
+            print(f" {error}")
             return
         
-        # calculate expected time out
-        now = datetime.datetime.now()
-        time_in_str = now.strftime("%Y-%m-%d %H:%M")
-        expected_time_out = now + datetime.timedelta(minutes=duration)
-        expected_time_out_str = expected_time_out.strftime("%Y-%m-%d %H:%M")
+        if input("Choose the space yourself? (y/N): ").strip().lower() != "y":
+            result = car_park.park(reg, duration)
+            print(f"\n{result.message}" if result.ok else f" {result.message}")
+            return
         
         # find available space
-        available_spaces = get_available_spaces(entitlement)
+        available_spaces = car_park.available_spaces(car.entitlement_code)
         if not available_spaces:
-            print(f" No available parking spaces for entitlement '{entitlement}'.")
+            print(f" No available parking spaces for entitlement '{car.entitlement}'.")
             return
         print("\nAvailable parking spaces:")
         for idx, space in enumerate(available_spaces, start=1):
-            print(f" {idx}. ID: {space['id']}, Location: {space['location']}, Type: {space['type']}")
+            print(f" {idx}. ID: {space.id}, Location: {space.location}, Type: {space.type}")
         
         choice = int(input("Select a parking space by number: ").strip())
         if choice < 1 or choice > len(available_spaces):
             print(" Invalid choice.")
             return
         
-        chosen_space = available_spaces[choice - 1]
-        
-        #parking record
-        parked.append({
-            "space_id": chosen_space["id"],
-            "reg": reg,
-            "time_in": time_in_str,
-            "expected_time_out": expected_time_out_str
-        })
-        # mark space as occupied
-        for space in spaces:
-            if space["id"] == chosen_space["id"]:
-                space["occupied"] = True
-                break
-        print(f"\nCar '{reg}' parked in space '{chosen_space['id']}' until {expected_time_out_str}.")
+        result = car_park.park(reg, duration, available_spaces[choice - 1].id)
+        print(f"\n{result.message}" if result.ok else f" {result.message}")
     except ValueError:
         print(" Invalid input. Please try again.")
     except Exception as e:
         print(f" An error occurred: {e}")
         
-def leave_car() -> None:
+def reserve_space(car_park: Optional[CarPark] = None) -> None:
+    """Book a space for a car ahead of time"""
+    car_park = car_park or default_car_park
+    try:
+        reg = input("\nEnter car registration number: ").strip().upper()
+        start = parse_time_minutes(input("Enter the arrival time (YYYY-MM-DD HH:MM): ").strip())
+        duration = int(input(f"Enter the booking length in minutes (multiple of {PARK_DURATION_STEP}): ").strip())
+        error = car_park.check_duration(duration)
+        if error:
+            print(f" {error}")
+            return
+        result = car_park.reserve(reg, start, start + duration)
+        print(f"\n{result.message}" if result.ok else f" {result.message}")
+    except ValueError:
+        print(" Invalid input. Please try again.")
+
+def save_reservations(filename: str = RESERVATIONS_FILE, car_park: Optional[CarPark] = None) -> None:
+    """ Save bookings still to come to RESERVATIONS.txt, if there are or were any """
+    
+    car_park = car_park or default_car_park
+    if not car_park.reservations and not os.path.exists(filename):
+        return
+    with car_park.reservations.lock:
+        car_park.reservations.expire(to_epoch_minutes(datetime.datetime.now()))
+    car_park.save_reservations(filename)
+    print(f" Bookings saved successfully to '{filename}'")
+
+def leave_car(car_park: Optional[CarPark] = None) -> None:
     '''remove a car from the car park'''
     identifier = input("\nEnter car registration number to leave: ").strip().upper()
     
-    for record in parked:
-        if record["reg"] == identifier or record["space_id"] == identifier:
-            
-            for space in spaces:
-                if space["id"] == record["space_id"]:
-                    space["occupied"] = False
-                    break
-            parked.remove(record)
-            print(f"\nCar '{identifier}' has left the car park from space '{record['space_id']}'.")
-            return
-    print(f"\nCar '{identifier}' not found in the car park.")
+    result = (car_park or default_car_park).leave(identifier)
+    print(f"\n{result.message}")
+
+def replay_events(lines: Iterable[str], out: TextIO = sys.stdout, flush: bool = False,
+                  car_park: Optional[CarPark] = None) -> BatchStats:
+    """ Apply a stream of park/leave events, writing "LINE, OK|REJECTED, message" as each one lands
     
-def view_parked_cars() -> None:
-    """Display all currently parked cars"""
-    if not parked:
-        print("\nThe car park is empty.")
-        return
+    Pass flush=True for live feeds so each result is pushed out straight away.
+    """
+    
+    apply = (car_park or default_car_park).apply_event
+    stats = BatchStats()
+    start = time.perf_counter()
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        result = apply(line)
+        stats.events += 1
+        if result.ok:
+            stats.accepted += 1
+        else:
+            stats.rejected += 1
+        out.write(f"{line_no}, {'OK' if result.ok else 'REJECTED'}, {result.message}\n")
+        if flush:
+            out.flush()
+    stats.seconds = time.perf_counter() - start
+    return stats
 
-    print("\n" + "="*80)
-    print(f"{'Space':<8} {'Registration':<12} {'Owner':<20} {'Time In':<16} {'Expected Out':<16}")
-    print("="*80)
-    for record in parked:
-        reg = record["reg"]
-        owner = cars.get(reg, {}).get("owner", "Unknown")
-        print(f"{record['space_id']:<8} {reg:<12} {owner:<20} {record['time_in']:<16} {record['expected_time_out']:<16}")
-    print("="*80)
-    
-def view_free_spaces() -> None:
-    """Show all free parking spaces"""
-    free = [s for s in spaces if not s["occupied"]]
-    if not free:
-        print("\nNo free spaces - car park is full!")
-        return
+def run_batch(source: str, car_park: Optional[CarPark] = None) -> BatchStats:
+    """ Replay an event file, or stdin for '-', and report throughput on stderr """
+    
+    if source == "-":
+        stats = replay_events(sys.stdin, flush=True, car_park=car_park)
+    else:
+        with open(source, 'r') as file:
+            stats = replay_events(file, car_park=car_park)
+    sys.stdout.flush()
+    print(f"Replayed {stats.events} events ({stats.accepted} accepted, {stats.rejected} rejected) "
+          f"in {stats.seconds:.3f}s: {stats.events_per_second:,.0f} events/sec", file=sys.stderr)
+    return stats
+
+# Rows shown per page by the menu views
+VIEW_PAGE_SIZE = 20
+EXPORT_FORMATS = ("csv", "jsonl")
+PARKED_FIELDS = ("space_id", "level", "reg", "owner", "time_in", "expected_time_out")
+FREE_SPACE_FIELDS = ("id", "location", "level", "bay", "type")
+
+def _pages(rows: Iterable, page_size: Optional[int]) -> Iterator[Tuple[List, bool]]:
+    """ Split rows into pages, each flagged with whether more follow; reads one page ahead """
+    rows = iter(rows)
+    page = list(itertools.islice(rows, page_size))
+    while page:
+        following = list(itertools.islice(rows, page_size))
+        yield page, bool(following)
+        page = following
+
+def _next_page() -> bool:
+    return input("Enter for the next page, q to stop: ").strip().lower() != "q"
+
+def _level_or_none(level: int) -> Optional[int]:
+    return None if level == UNKNOWN_COORDINATE else level
+
+def parked_rows(car_park: Optional[CarPark] = None, **filters) -> Iterator[Dict[str, object]]:
+    """ Parked cars as PARKED_FIELDS dicts; filters are those of CarPark.iter_parked """
+    car_park = car_park or default_car_park
+    for record in car_park.iter_parked(**filters):
+        car = car_park.cars.get(record.reg)
+        space = car_park.space_registry.get(record.space_id)
+        yield {"space_id": record.space_id, "level": _level_or_none(space.level) if space else None,
+               "reg": record.reg, "owner": car.owner if car else None,
+               "time_in": record.time_in, "expected_time_out": record.expected_time_out}
+
+def free_space_rows(car_park: Optional[CarPark] = None, level: Optional[int] = None,
+                    space_type: Optional[str] = None) -> Iterator[Dict[str, object]]:
+    """ Free spaces as FREE_SPACE_FIELDS dicts, level by level """
+    for space in (car_park or default_car_park).space_registry.iter_free_by_level(level, space_type):
+        yield {"id": space.id, "location": space.location, "level": _level_or_none(space.level),
+               "bay": _level_or_none(space.bay), "type": space.type}
+
+def write_rows(rows: Iterable[Dict[str, object]], fields: Tuple[str, ...], out: TextIO = sys.stdout,
+               fmt: str = "csv") -> int:
+    """ Stream rows to `out` as CSV with a header line, or as JSON lines; returns the rows written """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fields, lineterminator="\n")
+        writer.writeheader()
+        for count, row in enumerate(rows, start=1):
+            writer.writerow(row)
+    else:
+        for count, row in enumerate(rows, start=1):
+            out.write(json.dumps(row) + "\n")
+    return count
+
+def view_parked_cars(car_park: Optional[CarPark] = None, page_size: Optional[int] = VIEW_PAGE_SIZE,
+                     **filters) -> None:
+    """Display parked cars a page at a time; filters are those of CarPark.iter_parked"""
+    car_park = car_park or default_car_park
+    shown = 0
+    for rows, more in _pages(car_park.iter_parked(**filters), page_size):
+        print("\n" + "="*80)
+        print(f"{'Space':<8} {'Registration':<12} {'Owner':<20} {'Time In':<16} {'Expected Out':<16}")
+        print("="*80)
+        for record in rows:
+            car = car_park.cars.get(record.reg)
+            owner = car.owner if car else "Unknown"
+            print(f"{record.space_id:<8} {record.reg:<12} {owner:<20} {record.time_in:<16} {record.expected_time_out:<16}")
+        print("="*80)
+        shown += len(rows)
+        if more and not _next_page():
+            return
+    if not shown:
+        print("\nNo parked cars match." if any(v is not None for v in filters.values()) else "\nThe car park is empty.")
+    
+def view_free_spaces(car_park: Optional[CarPark] = None, level: Optional[int] = None,
+                     space_type: Optional[str] = None, page_size: Optional[int] = VIEW_PAGE_SIZE) -> None:
+    """Show free parking spaces level by level, a page at a time"""
+    registry = (car_park or default_car_park).space_registry
+    current = None
+    for rows, more in _pages(registry.iter_free_by_level(level, space_type), page_size):
+        for space in rows:
+            if space.level != current:
+                current = space.level
+                free = registry.free_on_level(current)
+                count = sum(free.values()) if space_type is None else free[SpaceType.from_label(space_type)]
+                name = "Unknown level" if current == UNKNOWN_COORDINATE else f"Level {current}"
+                print(f"\n{name}: {count} of {registry.level_sizes[current]} spaces free")
+                print(f"{'Space ID':<8} {'Location':<25} {'Type'}")
+                print("-" * 50)
+            print(f"{space.id:<8} {space.location:<25} {space.type}")
+        if more and not _next_page():
+            return
+    if current is None:
+        print("\nNo free spaces - car park is full!" if level is None else f"\nNo free spaces on level {level}.")
 
-    print("\nFree spaces:")
-    print(f"{'Space ID':<8} {'Location':<25} {'Type'}")
-    print("-" * 50)
-    for space in free:
-        print(f"{space['id']:<8} {space['location']:<25} {space['type']}")
+def ask_view_filters(allowed: Tuple[str, ...]) -> Dict[str, object]:
+    """ Ask for filters such as "level=2 type=EV owner=patel overdue"; raises ValueError on bad ones """
+    answer = input(f"Filter by {', '.join(allowed)} (Enter for all): ").strip()
+    filters: Dict[str, object] = {}
+    for item in answer.replace(",", " ").split():
+        key, _, value = item.partition("=")
+        key = key.lower()
+        if key not in allowed:
+            raise ValueError(f"Unknown filter '{key}'")
+        if key == "level":
+            filters["level"] = int(value)
+        elif key == "type":
+            labels = {t.label.lower(): t.label for t in SpaceType}
+            if value.lower() not in labels:
+                raise ValueError(f"Unknown space type '{value}'")
+            filters["space_type"] = labels[value.lower()]
+        elif key == "owner":
+            filters["owner"] = value
+        elif key == "overdue":
+            filters["overdue_at"] = to_epoch_minutes(datetime.datetime.now())
+    return filters
         
+def load_state(car_park: Optional[CarPark] = None, mapped_cars: bool = False, database: Optional[str] = None) -> CarPark:
+    """ Load SPACES/CARS/PARKED.txt (or a fresh snapshot, or a database) and start the journal and history """
+    
+    car_park = car_park or default_car_park
+    print("Loading data...")
+    sources = ["SPACES.txt", "CARS.txt", "PARKED.txt", "PARKED.txt" + JOURNAL_SUFFIX]
+    if database:
+        load_spaces(database, car_park)
+        load_cars(database, car_park)
+        load_parked(database, car_park)
+    elif mapped_cars:
+        # The snapshot holds the whole car registry, so bypass it here
+        load_spaces("SPACES.txt", car_park)
+        load_cars_mapped("CARS.txt", car_park)
+        load_parked("PARKED.txt", car_park)
+    elif not (snapshot_is_fresh(SNAPSHOT_FILE, sources) and load_snapshot(SNAPSHOT_FILE, car_park)):
+        load_spaces("SPACES.txt", car_park)
+        load_cars("CARS.txt", car_park)
+        load_parked("PARKED.txt", car_park)
+    car_park.load_reservations(RESERVATIONS_FILE, autosave=True).print_problems()
+    car_park.open_journal(database or "PARKED.txt")
+    car_park.open_history(HISTORY_FILE)
+    print(f"Loaded {len(car_park.spaces)} spaces, {len(car_park.cars)} registered cars, "
+          f"{len(car_park.parked)} currently parked.")
+    if car_park.reservations:
+        print(f"Loaded {len(car_park.reservations)} bookings.")
+    return car_park
+
 def display_menu() -> None:
     print("\n" + "="*50)
     print("     Car park management system")
@@ -206,39 +2816,121 @@ def display_menu() -> None:
     print("2. Car leaving")
     print("3. View currently parked cars")
     print("4. View free spaces")
-    print("5. Exit")
+    print("5. Reserve a space")
+    print("6. Exit")
     print("="*50)   
     
-def main() -> None:
-    print("Loading data...")
-    load_spaces("SPACES.txt")
-    load_cars("CARS.txt")
-    load_parked("PARKED.txt")
-    print(f"Loaded {len(spaces)} spaces, {len(cars)} registered cars, {len(parked)} currently parked.")
-
-    while True:
-        display_menu()
-        choice = input("Enter your choice (1-5): ").strip()
-
-        if choice == "1":
-            park_car()
-        elif choice == "2":
-            leave_car()
-        elif choice == "3":
-            view_parked_cars()
-        elif choice == "4":
-            view_free_spaces()
-        elif choice == "5":
-            save_parked()
-            print("Thank you for using the Car Park Management System. Goodbye!")
-            break
-        else:
-            print("Invalid choice - please enter 1-5.")   
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Car park management system")
+    parser.add_argument("--mapped-cars", action="store_true",
+                        help="look cars up in a memory-mapped index of CARS.txt instead of loading them all")
+    parser.add_argument("--batch", metavar="EVENTS",
+                        help="apply park/leave events from a file ('-' for stdin) instead of showing the menu")
+    parser.add_argument("--export", choices=("parked", "free"),
+                        help="stream parked cars or free spaces to stdout instead of showing the menu")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="format for --export")
+    parser.add_argument("--level", type=int, help="only export this level")
+    parser.add_argument("--type", dest="space_type", choices=[t.label for t in SpaceType],
+                        help="only export spaces of this type")
+    parser.add_argument("--owner", help="only export parked cars whose owner's name contains this")
+    parser.add_argument("--overdue", action="store_true", help="only export parked cars that are overdue now")
+    parser.add_argument("--db", metavar="DATABASE",
+                        help="keep spaces, cars and sessions in a SQLite database (see carpark_sqlite.py)")
+    parser.add_argument("--policy", choices=sorted(ALLOCATION_POLICIES),
+                        help="how to pick a space when none is chosen (default: first free in file order)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time loads, saves, parks and leaves and write Prometheus metrics to FILE on exit")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="also serve the metrics at http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the session: collapsed stacks to FILE, slowest functions on exit")
+    parser.add_argument("--profile-top", type=int, default=15, metavar="N", help="functions listed by --profile")
+    args = parser.parse_args(argv)
+    profiler = None
+    if args.profile:
+        import carpark_profile
+        profiler = carpark_profile.SessionProfiler(args.profile, args.profile_top)
+        profiler.start()
+    if args.policy:
+        default_car_park.set_policy(ALLOCATION_POLICIES[args.policy]())
+    metrics = metrics_server = None
+    if args.metrics or args.metrics_port:
+        import carpark_metrics
+        metrics = carpark_metrics.instrument(default_car_park)
+        if args.metrics_port:
+            metrics_server = carpark_metrics.serve(metrics, args.metrics_port)
+    
+    # In batch and export modes stdout carries the results, so chatter goes to stderr
+    log = sys.stderr if args.batch or args.export else sys.stdout
+    with redirect_stdout(log):
+        load_state(mapped_cars=args.mapped_cars, database=args.db)
+    parked_file = args.db or "PARKED.txt"
+    # A database is its own snapshot
+    keep_snapshot = not (args.mapped_cars or args.db)
+
+    try:
+        if args.export == "parked":
+            overdue_at = to_epoch_minutes(datetime.datetime.now()) if args.overdue else None
+            write_rows(parked_rows(level=args.level, space_type=args.space_type, owner=args.owner,
+                                   overdue_at=overdue_at), PARKED_FIELDS, sys.stdout, args.format)
+            return
+        if args.export == "free":
+            write_rows(free_space_rows(level=args.level, space_type=args.space_type), FREE_SPACE_FIELDS,
+                       sys.stdout, args.format)
+            return
+        if args.batch:
+            run_batch(args.batch)
+            with redirect_stdout(log):
+                save_parked(parked_file)
+                save_reservations()
+                if keep_snapshot:
+                    save_snapshot()
+            return
+        while True:
+            display_menu()
+            choice = input("Enter your choice (1-6): ").strip()
+
+            if choice == "1":
+                park_car()
+            elif choice == "2":
+                leave_car()
+            elif choice == "3":
+                try:
+                    view_parked_cars(**ask_view_filters(("level", "type", "owner", "overdue")))
+                except ValueError as e:
+                    print(f" {e}")
+            elif choice == "4":
+                try:
+                    view_free_spaces(**ask_view_filters(("level", "type")))
+                except ValueError as e:
+                    print(f" {e}")
+            elif choice == "5":
+                reserve_space()
+            elif choice == "6":
+                save_parked(parked_file)
+                save_reservations()
+                if keep_snapshot:
+                    save_snapshot()
+                print("Thank you for using the Car Park Management System. Goodbye!")
+                break
+            else:
+                print("Invalid choice - please enter 1-6.")
+    finally:
+        close_journal()
+        default_car_park.close_history()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if args.metrics:
+            metrics.write(args.metrics)
+        if profiler is not None:
+            profiler.stop()
     
 if __name__ == "__main__":
+    # Let modules that import carpark (carpark_sqlite) share this copy rather than load a second
+    sys.modules.setdefault("carpark", sys.modules[__name__])
     try:
         main()
     except KeyboardInterrupt:
         print("\nProgram terminated by user.")
     except Exception as e:
-        print(f"Unexpected error: {e}")
\ No newline at end of file
+        print(f"Unexpected error: {e}")
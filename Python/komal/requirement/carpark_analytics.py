@@ -0,0 +1,240 @@
+"""
+Occupancy and dwell-time analytics over the parking history.
+
+Works on the columns of a carpark.ParkingHistory: hourly or daily
+occupancy curves by level, space type or entitlement, peak detection
+and stay-length statistics per entitlement. NumPy is used when installed
+to vectorise the aggregation; without it the same results come from
+pure-Python loops, only more slowly.
+
+Usage: python carpark_analytics.py [--history HISTORY.txt] [--spaces SPACES.txt]
+                                   [--bucket hour|day] [--by level|type|entitlement]
+"""
+import argparse
+import statistics
+from collections import Counter
+from dataclasses import dataclass
+from itertools import accumulate, compress, repeat
+from operator import add, floordiv, lt, mul, sub
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import carpark
+from carpark import ParkingHistory, Space
+
+try:
+    import numpy as np
+except ImportError:  # analytics fall back to pure Python
+    np = None
+
+BUCKETS = {"hour": 60, "day": 24 * 60}
+GROUPINGS = ("level", "type", "entitlement")
+
+
+@dataclass
+class OccupancyCurve:
+    """Average number of cars parked in each time bucket, per group."""
+    start: int
+    bucket: int
+    series: Dict[str, List[float]]
+
+    def bucket_start(self, i: int) -> str:
+        return carpark.format_epoch_minutes(self.start + i * self.bucket)
+
+
+@dataclass
+class DwellStats:
+    """Stay lengths, in minutes, for one group of sessions."""
+    sessions: int
+    mean: float
+    median: float
+    p90: float
+
+
+def session_groups(history: ParkingHistory, spaces: Iterable[Space], by: Optional[str]) -> Tuple[List[str], List[int]]:
+    """Group labels, and each session's index into them, for a grouping in GROUPINGS (None for one group)."""
+    if by is None:
+        return ["All"], [0] * len(history)
+    if by == "entitlement":
+        labels = [code.label for code in carpark.SpaceType] + ["Unknown"]
+        return labels, [code if code >= 0 else len(labels) - 1 for code in history.entitlements]
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping '{by}'")
+    if by == "type":
+        labels = [code.label for code in carpark.SpaceType] + ["Unknown"]
+        group_of = {space.id: int(space.type_code) for space in spaces}
+    else:
+        spaces = list(spaces)
+        levels = sorted({space.level for space in spaces} - {carpark.UNKNOWN_COORDINATE})
+        labels = [f"Level {level}" for level in levels] + ["Unknown"]
+        index = {level: i for i, level in enumerate(levels)}
+        group_of = {space.id: index.get(space.level, len(levels)) for space in spaces}
+    return labels, list(map(group_of.get, history.space_ids, repeat(len(labels) - 1)))
+
+
+def sessions_on_level(history: ParkingHistory, spaces: Iterable[Space], level: int) -> ParkingHistory:
+    """The sessions held in spaces on one level, as a history of their own."""
+    on_level = {space.id for space in spaces if space.level == level}
+    keep = list(map(on_level.__contains__, history.space_ids))
+    chosen = ParkingHistory()
+    chosen.extend(compress(history.space_ids, keep), compress(history.regs, keep),
+                  compress(history.entitlements, keep), compress(history.times_in, keep),
+                  compress(history.times_out, keep))
+    return chosen
+
+
+def occupancy(history: ParkingHistory, spaces: Iterable[Space] = (), bucket: int = 60, by: Optional[str] = None,
+              start: Optional[int] = None, end: Optional[int] = None, level: Optional[int] = None) -> OccupancyCurve:
+    """Average occupancy per `bucket` minutes between `start` and `end` (epoch minutes).
+
+    Defaults cover the whole history, aligned to whole buckets. Groups that
+    never appear are left out. With `level`, only sessions on that level count.
+    """
+    if level is not None:
+        spaces = list(spaces)
+        history = sessions_on_level(history, spaces, level)
+    if not len(history):
+        return OccupancyCurve(start or 0, bucket, {})
+    labels, groups = session_groups(history, spaces, by)
+    if start is None:
+        start = min(history.times_in)
+    start -= start % bucket
+    if end is None:
+        end = max(history.times_out)
+    end = max(end, start + 1)
+    end += -end % bucket
+    span = end - start
+    if np is not None:
+        rows = _occupancy_numpy(history, groups, len(labels), start, span, bucket)
+    else:
+        rows = _occupancy_python(history, groups, len(labels), start, span, bucket)
+    return OccupancyCurve(start, bucket, {label: row for label, row in zip(labels, rows) if any(row)})
+
+
+def _occupancy_numpy(history, groups, n_groups, start, span, bucket) -> List[List[float]]:
+    times_in = np.frombuffer(history.times_in, dtype=np.int64)
+    times_out = np.frombuffer(history.times_out, dtype=np.int64)
+    arrive = np.clip(times_in, start, start + span) - start
+    depart = np.clip(np.maximum(times_out, times_in), start, start + span) - start
+    offset = np.asarray(groups, dtype=np.int64) * (span + 1)
+    # +1 when a car arrives and -1 when it leaves; a running sum gives cars present each minute
+    size = n_groups * (span + 1)
+    change = np.bincount(offset + arrive, minlength=size) - np.bincount(offset + depart, minlength=size)
+    per_minute = change.reshape(n_groups, span + 1)[:, :span].cumsum(axis=1)
+    return per_minute.reshape(n_groups, span // bucket, bucket).mean(axis=2).tolist()
+
+
+def _occupancy_python(history, groups, n_groups, start, span, bucket) -> List[List[float]]:
+    # Same running-sum method as the NumPy path, kept to C-level map/Counter passes
+    end = start + span
+    times_in, times_out = history.times_in, history.times_out
+    offsets = list(map(mul, groups, repeat(span + 1)))
+    if any(map(lt, times_out, times_in)):
+        times_out = list(map(max, times_out, times_in))
+    # Clipping to the window costs more than the rest, so skip it when nothing falls outside
+    if start > min(times_in) or end < max(times_out):
+        times_in = map(min, map(max, times_in, repeat(start)), repeat(end))
+        times_out = map(min, map(max, times_out, repeat(start)), repeat(end))
+    arrive = map(sub, times_in, repeat(start))
+    depart = map(sub, times_out, repeat(start))
+    change = [0] * (n_groups * (span + 1))
+    for index, count in Counter(map(add, offsets, arrive)).items():
+        change[index] += count
+    for index, count in Counter(map(add, offsets, depart)).items():
+        change[index] -= count
+    rows = []
+    for group in range(n_groups):
+        per_minute = accumulate(change[group * (span + 1):group * (span + 1) + span])
+        rows.append([total / bucket for total in map(sum, zip(*[per_minute] * bucket))])
+    return rows
+
+
+def peaks(values: Sequence[float], top: int = 5) -> List[Tuple[int, float]]:
+    """The `top` highest local maxima of a curve as (index, value), highest first."""
+    if np is not None and len(values) > 2:
+        series = np.asarray(values, dtype=float)
+        padded = np.concatenate(([-np.inf], series, [-np.inf]))
+        is_peak = (series > padded[:-2]) & (series >= padded[2:]) & (series > 0)
+        found = np.flatnonzero(is_peak)
+        ranked = found[np.argsort(-series[found], kind="stable")][:top]
+        return [(int(i), float(series[i])) for i in ranked]
+    found = [(i, value) for i, value in enumerate(values)
+             if value > 0 and (i == 0 or value > values[i - 1]) and (i == len(values) - 1 or value >= values[i + 1])]
+    return sorted(found, key=lambda peak: -peak[1])[:top]
+
+
+def dwell_minutes(history: ParkingHistory) -> Sequence[int]:
+    """Length of each session in minutes (negative stays count as zero)."""
+    if np is not None:
+        stays = np.frombuffer(history.times_out, dtype=np.int64) - np.frombuffer(history.times_in, dtype=np.int64)
+        return np.maximum(stays, 0)
+    return list(map(max, map(sub, history.times_out, history.times_in), repeat(0)))
+
+
+def dwell_by_entitlement(history: ParkingHistory) -> Dict[str, DwellStats]:
+    """Stay-length statistics for each entitlement seen in the history."""
+    labels, groups = session_groups(history, (), "entitlement")
+    stays = dwell_minutes(history)
+    results = {}
+    if np is not None:
+        groups = np.asarray(groups)
+        for i, label in enumerate(labels):
+            chosen = stays[groups == i]
+            if len(chosen):
+                results[label] = DwellStats(len(chosen), float(chosen.mean()), float(np.median(chosen)),
+                                            float(np.percentile(chosen, 90)))
+        return results
+    for i, label in enumerate(labels):
+        chosen = sorted(compress(stays, map(i.__eq__, groups)))
+        if chosen:
+            p90 = statistics.quantiles(chosen, n=10, method="inclusive")[-1] if len(chosen) > 1 else chosen[0]
+            results[label] = DwellStats(len(chosen), statistics.fmean(chosen), statistics.median(chosen), p90)
+    return results
+
+
+def dwell_histogram(history: ParkingHistory, bin_minutes: int = carpark.PARK_DURATION_STEP) -> Dict[int, int]:
+    """Number of sessions per stay length, in `bin_minutes` bins keyed by each bin's lower bound."""
+    stays = dwell_minutes(history)
+    if np is not None:
+        counts = np.bincount(np.asarray(stays) // bin_minutes)
+        return {int(i) * bin_minutes: int(count) for i, count in enumerate(counts) if count}
+    counts = Counter(map(floordiv, stays, repeat(bin_minutes)))
+    return {bin_ * bin_minutes: counts[bin_] for bin_ in sorted(counts)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Car park occupancy and dwell-time analytics")
+    parser.add_argument("--history", default=carpark.HISTORY_FILE)
+    parser.add_argument("--spaces", default="SPACES.txt")
+    parser.add_argument("--bucket", choices=sorted(BUCKETS), default="hour")
+    parser.add_argument("--by", choices=GROUPINGS, default="level")
+    parser.add_argument("--level", type=int, help="only count sessions on this level")
+    parser.add_argument("--top", type=int, default=5, help="peaks to list per group")
+    args = parser.parse_args(argv)
+
+    site = carpark.CarPark()
+    carpark.load_spaces(args.spaces, site)
+    history = ParkingHistory()
+    report = history.load(args.history)
+    if report.missing:
+        print(f"History file '{args.history}' not found.")
+        return
+    report.print_problems()
+    print(f"{len(history)} sessions ({'NumPy' if np is not None else 'pure Python'} aggregation)")
+    if not len(history):
+        return
+
+    curve = occupancy(history, site.spaces, BUCKETS[args.bucket], args.by, level=args.level)
+    print(f"\nOccupancy by {args.by}, per {args.bucket}, from {curve.bucket_start(0)}:")
+    for label, values in curve.series.items():
+        print(f"  {label:<12} average {sum(values) / len(values):8.2f}   peak {max(values):8.2f}")
+        for i, value in peaks(values, args.top):
+            print(f"      {curve.bucket_start(i)}  {value:8.2f}")
+
+    print("\nStay length by entitlement (minutes):")
+    for label, stats in dwell_by_entitlement(history).items():
+        print(f"  {label:<12} {stats.sessions:>8} sessions   mean {stats.mean:7.1f}   "
+              f"median {stats.median:7.1f}   p90 {stats.p90:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
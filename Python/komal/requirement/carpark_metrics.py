@@ -0,0 +1,172 @@
+"""
+Opt-in metrics for a CarPark, in the Prometheus text format.
+
+    metrics = instrument(car_park)        # wraps this instance's hot paths
+    print(metrics.render())               # or metrics.write("carpark.prom"), or serve(metrics, 9108)
+
+instrument() replaces load_spaces, load_cars, load_parked, save_parked,
+available_spaces (behind get_available_spaces), park and leave (behind
+park_car, leave_car, --batch and the TCP service) on that one instance
+with timed wrappers; the class is untouched, so a car park that is never
+instrumented pays nothing. Each call adds to a counter and a latency
+histogram. Occupancy gauges are read from the free-space indexes when
+the metrics are rendered, not kept up to date on every park.
+
+    python carpark.py --metrics carpark.prom --metrics-port 9108
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from carpark import CarPark, EventResult, LoadReport, SpaceType
+
+# Histogram upper bounds in seconds, from a dict lookup to a million-row load
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INSTRUMENTED = ("load_spaces", "load_cars", "load_parked", "save_parked", "available_spaces", "park", "leave")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    """Counters and latency histograms per operation, plus gauges read from a car park.
+
+    observe() is called from park/leave on several threads at once, so
+    updates share one lock; it is held only to bump a few integers.
+    """
+
+    def __init__(self, car_park: Optional[CarPark] = None) -> None:
+        self.car_park = car_park
+        self._lock = threading.Lock()
+        self.outcomes: Counter = Counter()
+        self.rows_loaded: Counter = Counter()
+        self.lines_skipped: Counter = Counter()
+        self._buckets: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._space_totals: Tuple[int, Dict[SpaceType, int]] = (-1, {})
+
+    def observe(self, operation: str, seconds: float, result: object = None) -> None:
+        """Record one call and what it returned."""
+        with self._lock:
+            buckets = self._buckets.get(operation)
+            if buckets is None:
+                buckets = self._buckets[operation] = [0] * (len(BUCKETS) + 1)
+                self._sums[operation] = 0.0
+            buckets[bisect_left(BUCKETS, seconds)] += 1
+            self._sums[operation] += seconds
+            if isinstance(result, EventResult):
+                self.outcomes[operation, "ok" if result.ok else "rejected"] += 1
+            elif isinstance(result, LoadReport):
+                self.rows_loaded[operation] += result.loaded
+                self.lines_skipped[operation] += result.skipped
+
+    def count(self, operation: str) -> int:
+        """Calls recorded for an operation."""
+        return sum(self._buckets.get(operation, ()))
+
+    def _totals_by_type(self) -> Dict[SpaceType, int]:
+        # Spaces only change on load, so recount only when the registry size changes
+        by_id = self.car_park.space_registry.by_id
+        size, totals = self._space_totals
+        if size != len(by_id):
+            totals = Counter(space.type_code for space in list(by_id.values()))
+            self._space_totals = (len(by_id), totals)
+        return totals
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            buckets = {operation: list(counts) for operation, counts in self._buckets.items()}
+            sums = dict(self._sums)
+            outcomes, rows, skipped = dict(self.outcomes), dict(self.rows_loaded), dict(self.lines_skipped)
+        lines = ["# HELP carpark_operation_seconds Time taken by car park operations.",
+                 "# TYPE carpark_operation_seconds histogram"]
+        for operation in sorted(buckets):
+            running = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), buckets[operation]):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'carpark_operation_seconds_bucket{{operation="{operation}",le="{le}"}} {running}')
+            lines.append(f'carpark_operation_seconds_sum{{operation="{operation}"}} {sums[operation]!r}')
+            lines.append(f'carpark_operation_seconds_count{{operation="{operation}"}} {running}')
+        lines += ["# HELP carpark_operations_total Park and leave requests by outcome.",
+                  "# TYPE carpark_operations_total counter"]
+        lines += [f'carpark_operations_total{{operation="{operation}",outcome="{outcome}"}} {count}'
+                  for (operation, outcome), count in sorted(outcomes.items())]
+        lines += ["# HELP carpark_rows_loaded_total Rows kept by the loaders.",
+                  "# TYPE carpark_rows_loaded_total counter"]
+        lines += [f'carpark_rows_loaded_total{{operation="{operation}"}} {count}' for operation, count in sorted(rows.items())]
+        lines += ["# HELP carpark_lines_skipped_total Malformed lines skipped by the loaders.",
+                  "# TYPE carpark_lines_skipped_total counter"]
+        lines += [f'carpark_lines_skipped_total{{operation="{operation}"}} {count}'
+                  for operation, count in sorted(skipped.items())]
+        if self.car_park is not None:
+            registry = self.car_park.space_registry
+            totals = self._totals_by_type()
+            lines += ["# HELP carpark_spaces Spaces of each type.", "# TYPE carpark_spaces gauge"]
+            lines += [f'carpark_spaces{{type="{t.label}"}} {totals.get(t, 0)}' for t in SpaceType]
+            lines += ["# HELP carpark_spaces_free Free spaces of each type.", "# TYPE carpark_spaces_free gauge"]
+            lines += [f'carpark_spaces_free{{type="{t.label}"}} {len(registry.free_by_type[t])}' for t in SpaceType]
+            lines += ["# HELP carpark_parked_cars Cars parked now.", "# TYPE carpark_parked_cars gauge",
+                      f"carpark_parked_cars {len(self.car_park.parked)}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str) -> None:
+        """Atomically dump render() to a file, e.g. for a node_exporter textfile collector."""
+        temp = f"{filename}.tmp"
+        with open(temp, "w") as file:
+            file.write(self.render())
+        os.replace(temp, filename)
+
+
+def _timed(metrics: Metrics, operation: str, method: Callable) -> Callable:
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        metrics.observe(operation, time.perf_counter() - start, result)
+        return result
+    return timed
+
+
+def instrument(car_park: CarPark, metrics: Optional[Metrics] = None) -> Metrics:
+    """Time this car park's hot paths into `metrics` (a new one by default) and return it."""
+    metrics = metrics or Metrics(car_park)
+    metrics.car_park = metrics.car_park or car_park
+    uninstrument(car_park)
+    for operation in INSTRUMENTED:
+        setattr(car_park, operation, _timed(metrics, operation, getattr(car_park, operation)))
+    return metrics
+
+
+def uninstrument(car_park: CarPark) -> None:
+    """Put back the plain methods, removing all overhead."""
+    for operation in INSTRUMENTED:
+        car_park.__dict__.pop(operation, None)
+
+
+def serve(metrics: Metrics, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve render() at http://host:port/metrics from a daemon thread; shutdown() the result to stop."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="carpark-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,142 @@
+"""
+Profiling for a whole car park session (menu or --batch).
+
+    python carpark.py --profile session.folded [--profile-top 20]
+
+Two profilers run side by side:
+
+- A sampling thread records the main thread's Python stack every
+  `interval` seconds. Each sample is weighted by the CPU time that thread
+  used since the previous one, so time spent waiting at a menu prompt is
+  left out. The stacks are written as collapsed stacks, one "outer;inner;leaf
+  microseconds" line each, ready for flamegraph.pl or speedscope.
+- cProfile measures on the CPU clock. On exit it prints the top N
+  functions from the carpark modules by cumulative time.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Callable, List, Optional, TextIO, Tuple
+
+SAMPLE_INTERVAL = 0.001
+TOP_N = 15
+
+
+def frame_label(code: CodeType) -> str:
+    """module:function as shown on a flame graph."""
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """Collapsed stacks of one thread, sampled from a background thread.
+
+    The samples are weighted by the thread's CPU microseconds (the whole
+    process's where per-thread clocks are unavailable). A sample is
+    skipped when the thread was idle since the last one, for example
+    while blocked in input().
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = SAMPLE_INTERVAL) -> None:
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="carpark-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _cpu_clock(self) -> Callable[[], float]:
+        try:
+            clock_id = time.pthread_getcpuclockid(self.thread_id)
+        except (AttributeError, OSError):
+            return time.process_time
+        return lambda: time.clock_gettime(clock_id)
+
+    def _run(self) -> None:
+        cpu_time = self._cpu_clock()
+        last = cpu_time()
+        while not self._stop.wait(self.interval):
+            now = cpu_time()
+            spent, last = now - last, now
+            if spent < self.interval / 10:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += round(spent * 1_000_000)
+
+    def write_collapsed(self, filename: str) -> int:
+        """Write "stack count" lines, heaviest first; returns the number of stacks."""
+        with open(filename, "w") as file:
+            for stack, weight in self.stacks.most_common():
+                file.write(f"{stack} {weight}\n")
+        return len(self.stacks)
+
+
+def carpark_summary(profile: cProfile.Profile, top: int = TOP_N) -> List[Tuple[str, int, float, float]]:
+    """(function, calls, own seconds, cumulative seconds) for the carpark modules' functions, slowest first."""
+    stats = pstats.Stats(profile).stats
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.items():
+        module = os.path.splitext(os.path.basename(filename))[0]
+        if module.startswith("carpark") and module != "carpark_profile":
+            rows.append((f"{module}:{name}:{line}", calls, own, cumulative))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:top]
+
+
+class SessionProfiler:
+    """cProfile plus a StackSampler over the calling thread, from start() to stop().
+
+    stop() writes the collapsed stacks to `collapsed_file` and prints the
+    carpark top-N summary to `out`.
+    """
+
+    def __init__(self, collapsed_file: str, top: int = TOP_N, interval: float = SAMPLE_INTERVAL,
+                 out: TextIO = sys.stderr) -> None:
+        self.collapsed_file = collapsed_file
+        self.top = top
+        self.out = out
+        self.profile = cProfile.Profile(time.process_time)
+        self.sampler = StackSampler(interval=interval)
+
+    def start(self) -> None:
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self) -> List[Tuple[str, int, float, float]]:
+        self.profile.disable()
+        self.sampler.stop()
+        stacks = self.sampler.write_collapsed(self.collapsed_file)
+        summary = carpark_summary(self.profile, self.top)
+        print(f"Profile: {stacks} distinct stacks written to '{self.collapsed_file}'.", file=self.out)
+        print(f"Top {len(summary)} carpark functions by CPU time (cumulative):", file=self.out)
+        print(f"{'Calls':>10} {'Own s':>9} {'Cumul. s':>9}  Function", file=self.out)
+        for function, calls, own, cumulative in summary:
+            print(f"{calls:>10,} {own:>9.4f} {cumulative:>9.4f}  {function}", file=self.out)
+        return summary
+
+    def __enter__(self) -> "SessionProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,190 @@
+"""
+Asyncio TCP service letting many entry and exit barriers share one car park.
+
+Each request is one line, in the comma-separated style of the data files:
+
+    PARK, REG, MINUTES[, SPACE]
+    LEAVE, REG-OR-SPACE
+    FREE[, Standard|Disabled|EV[, LEVEL]]
+    PARKED
+    OVERDUE
+    DUE, MINUTES
+
+and is answered by one JSON line, e.g. {"ok": true, "message": "..."}.
+
+Every request goes through a single writer task that owns the CarPark, so
+two barriers can never both win the same bay however the connections
+interleave.
+
+Usage: python carpark_server.py [--host HOST] [--port PORT] [--mapped-cars]
+"""
+import argparse
+import asyncio
+import json
+import signal
+from typing import Dict, List, Optional, Tuple
+
+import carpark
+from carpark import CarPark
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Free spaces listed in a FREE reply; the count always covers them all
+FREE_LIST_LIMIT = 20
+
+
+class CarParkServer:
+    """Serves one CarPark over TCP, applying requests strictly one at a time.
+
+    Connection handlers only parse lines and queue them; the writer task
+    pops each request, runs it against the car park and resolves the
+    handler's future, so no two requests ever see the car park half-way
+    through a change.
+    """
+
+    def __init__(self, car_park: CarPark, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 backlog: int = 4096) -> None:
+        self.car_park = car_park
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.requests = 0
+        self._queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def handle(self, line: str) -> Dict:
+        """Apply one request line to the car park; only the writer task calls this."""
+        parts = [part.strip() for part in line.split(",")]
+        command = parts[0].upper()
+        try:
+            if command == "PARK" and len(parts) in (3, 4):
+                space_id = parts[3] if len(parts) == 4 else None
+                return self._result(self.car_park.park(parts[1], int(parts[2]), space_id))
+            if command == "LEAVE" and len(parts) == 2:
+                return self._result(self.car_park.leave(parts[1]))
+            if command == "FREE" and len(parts) <= 3:
+                required_type = parts[1] if len(parts) >= 2 else "Standard"
+                level = int(parts[2]) if len(parts) == 3 else None
+                carpark.SpaceType.from_label(required_type)
+                spaces = self.car_park.iter_available(required_type, 0, FREE_LIST_LIMIT, level)
+                reply = {"ok": True, "type": required_type, "count": self.car_park.count_available(required_type, level),
+                         "spaces": [space.id for space in spaces]}
+                if level is not None:
+                    reply["level"] = level
+                return reply
+            if command == "PARKED" and len(parts) == 1:
+                return {"ok": True, "parked": self._rows(self.car_park.parked)}
+            if command == "OVERDUE" and len(parts) == 1:
+                return {"ok": True, "parked": self._rows(self.car_park.overdue())}
+            if command == "DUE" and len(parts) == 2:
+                return {"ok": True, "parked": self._rows(self.car_park.leaving_within(int(parts[1])))}
+        except ValueError:
+            pass
+        return {"ok": False, "message": f"Malformed request {line!r}."}
+
+    @staticmethod
+    def _rows(records: List[carpark.ParkedRecord]) -> List[List[str]]:
+        return [[record.space_id, record.reg, record.time_in, record.expected_time_out] for record in records]
+
+    @staticmethod
+    def _result(result: carpark.EventResult) -> Dict:
+        reply = {"ok": result.ok, "message": result.message}
+        if result.record is not None:
+            reply["space"] = result.record.space_id
+        return reply
+
+    async def _write_loop(self) -> None:
+        queue = self._queue
+        while True:
+            line, future = await queue.get()
+            self.requests += 1
+            try:
+                reply = self.handle(line)
+            except Exception as e:
+                reply = {"ok": False, "message": f"Server error: {e}"}
+            if not future.cancelled():
+                future.set_result(reply)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", "replace").strip()
+                if not line:
+                    continue
+                future = loop.create_future()
+                await self._queue.put((line, future))
+                reply = await future
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> asyncio.AbstractServer:
+        """Start listening; with port 0 the chosen port is stored back in `port`."""
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port, backlog=self.backlog)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str) -> Dict:
+    """Send one request line on an open connection and wait for its reply."""
+    writer.write(line.encode("utf-8") + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def serve(host: str, port: int, mapped_cars: bool = False) -> None:
+    car_park = carpark.load_state(CarPark(), mapped_cars=mapped_cars)
+    server = CarParkServer(car_park, host, port)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    monitor = carpark.OverstayMonitor(car_park)
+    try:
+        await server.start()
+        monitor.start()
+        print(f"Serving car park on {server.host}:{server.port}", flush=True)
+        await stopping.wait()
+    finally:
+        monitor.stop()
+        await server.stop()
+        car_park.save_parked()
+        carpark.save_reservations(car_park=car_park)
+        car_park.close_journal()
+        car_park.close_history()
+        print(f"Handled {server.requests} requests; parked cars and bookings saved.")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Car park network service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--mapped-cars", action="store_true",
+                        help="look cars up in a memory-mapped index of CARS.txt instead of loading them all")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.mapped_cars))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+Sharded car park: cars and spaces split across a pool of worker processes.
+
+Each worker owns the cars whose registration hashes to it and the spaces
+whose ID hashes to it, and loads only those rows, so a national-scale
+CARS.txt is parsed and held in parallel. A session lives with its space.
+The coordinator routes each request to the owning shard:
+
+    PARK (no space)     -> the car's shard, which parks it in one of its own
+                           spaces; if that shard is full, the car's
+                           entitlement is looked up and another shard tried
+    PARK (with space)   -> the space's shard
+    LEAVE by reg        -> wherever the car is parked
+    LEAVE by space ID   -> the space's shard
+
+Event batches are split per shard and replayed by all workers at once;
+only events that cross shards, and parks a full shard hands back, are
+applied one at a time, in order.
+
+Single-process CarPark remains the default everywhere else.
+
+Usage: python carpark_shards.py EVENTS [--workers N] [--spaces SPACES.txt] [--cars CARS.txt] [--parked PARKED.txt]
+"""
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+import carpark
+from carpark import BatchStats, CarPark, EventResult, LoadReport, ParkedRecord
+
+# Events sent to the workers per round of a batch replay
+REPLAY_BATCH_SIZE = 20_000
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Shard owning a registration or space ID; stable across processes, unlike hash()."""
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+def _full_for(car_park: CarPark, reg: str) -> Optional[int]:
+    """The entitlement of a car registered here and not parked, if every space it may use here is taken."""
+    car = car_park.cars.get(reg)
+    if car is None or reg in car_park.parked_index.by_reg or car_park.count_available(car.entitlement_code):
+        return None
+    return car.entitlement_code
+
+
+def _park_here(car_park: CarPark, reg: str, duration: int, space_id: Optional[str], time_in: Optional[int],
+               entitlement: Optional[int]) -> Tuple[EventResult, Optional[int]]:
+    """Park on this shard; with a failed result, also the car's entitlement if only a free space was missing."""
+    result = car_park.park(reg, duration, space_id, time_in, entitlement=entitlement)
+    if result.ok or space_id is not None or entitlement is not None:
+        return result, None
+    return result, _full_for(car_park, reg.upper())
+
+
+def _replay_here(car_park: CarPark, events: List[Tuple[int, str]], want_results: bool
+                 ) -> Tuple[BatchStats, List[Tuple[str, bool]], List[Tuple[int, bool, str]], List[Tuple[int, str]]]:
+    """Replay numbered event lines.
+
+    Returns stats, each accepted (reg, now parked) change, optionally every
+    result, and the events handed back unapplied: a PARK without a space
+    that failed only because this shard is full, and every later event
+    naming that car, for the coordinator to place on another shard.
+    """
+    stats = BatchStats()
+    changes = []
+    results = []
+    handed_back = []
+    deferred = set()
+    for line_no, line in events:
+        parts = line.split(", ", 4)
+        reg = parts[2].upper() if len(parts) > 2 else ""
+        if reg in deferred:
+            handed_back.append((line_no, line))
+            continue
+        result = car_park.apply_event(line)
+        if (not result.ok and len(parts) == 4 and parts[0].upper() == "PARK"
+                and _full_for(car_park, reg) is not None):
+            deferred.add(reg)
+            handed_back.append((line_no, line))
+            continue
+        stats.events += 1
+        if result.ok:
+            stats.accepted += 1
+            changes.append((result.record.reg, line[:4].upper() == "PARK"))
+        else:
+            stats.rejected += 1
+        if want_results:
+            results.append((line_no, result.ok, result.message))
+    return stats, changes, results, handed_back
+
+
+def _serve_shard(conn, shard: int, shards: int, spaces_file: str, cars_file: str, parked_file: str) -> None:
+    """Worker loop: load this shard's rows, then answer (command, args) messages until told to stop."""
+    car_park = CarPark()
+
+    def keep(key: str) -> bool:
+        return shard_of(key, shards) == shard
+
+    conn.send([car_park.load_spaces(spaces_file, keep), car_park.load_cars(cars_file, keep),
+               car_park.load_parked(parked_file, keep), [record.reg for record in car_park.parked]])
+    commands = {
+        "park": lambda *args: _park_here(car_park, *args),
+        "leave": car_park.leave,
+        "entitlement": lambda reg: car_park.cars[reg].entitlement_code if reg in car_park.cars else None,
+        "count_free": car_park.count_available,
+        "replay": lambda events, want_results: _replay_here(car_park, events, want_results),
+        "parked": lambda: list(car_park.parked),
+        "sizes": lambda: (len(car_park.spaces), len(car_park.cars), len(car_park.parked)),
+    }
+    while True:
+        command, args = conn.recv()
+        if command == "stop":
+            break
+        try:
+            conn.send((True, commands[command](*args)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+class ShardedCarPark:
+    """Coordinator for a pool of shard worker processes.
+
+    Requests from several threads are serialised here; the parallelism is
+    in loading and in batch replay, where every shard works at once.
+    `parked_at` maps each parked registration to its shard, so memory in
+    this process grows with active sessions only.
+    """
+
+    def __init__(self, workers: int = 4) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.parked_at: Dict[str, int] = {}
+        self._conns = []
+        self._processes = []
+        self._lock = threading.Lock()
+
+    # -- pool -----------------------------------------------------------------
+
+    def start(self, spaces_file: str = "SPACES.txt", cars_file: str = "CARS.txt",
+              parked_file: str = "PARKED.txt") -> List[LoadReport]:
+        """Start the workers and load every shard in parallel; returns one merged report per file."""
+        for shard in range(self.workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, daemon=True,
+                                              args=(child, shard, self.workers, spaces_file, cars_file, parked_file))
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+        loaded = [conn.recv() for conn in self._conns]
+        for shard, (_, _, _, regs) in enumerate(loaded):
+            self.parked_at.update(dict.fromkeys(regs, shard))
+        # Each worker reads every line but reports only the bad lines in its own shard
+        reports = loaded[0][:3]
+        for report_index, report in enumerate(reports):
+            shard_reports = [shard_loaded[report_index] for shard_loaded in loaded]
+            report.loaded = sum(shard_report.loaded for shard_report in shard_reports)
+            report.skipped = sum(shard_report.skipped for shard_report in shard_reports)
+            bad_lines = sorted(line for shard_report in shard_reports for line in shard_report.bad_lines)
+            report.bad_lines = bad_lines[:carpark.MAX_REPORTED_BAD_LINES]
+        return reports
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.send(("stop", ()))
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns, self._processes = [], []
+
+    def __enter__(self) -> "ShardedCarPark":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _call(self, shard: int, command: str, *args):
+        conn = self._conns[shard]
+        conn.send((command, args))
+        ok, value = conn.recv()
+        if not ok:
+            raise value
+        return value
+
+    def _call_all(self, command: str, per_shard_args: Optional[List[tuple]] = None) -> List:
+        """Send a command to every shard before waiting on any, so they run side by side."""
+        for shard, conn in enumerate(self._conns):
+            conn.send((command, per_shard_args[shard] if per_shard_args is not None else ()))
+        replies = [conn.recv() for conn in self._conns]
+        for ok, value in replies:
+            if not ok:
+                raise value
+        return [value for _, value in replies]
+
+    # -- requests -------------------------------------------------------------
+
+    def park(self, reg: str, duration: int, space_id: Optional[str] = None,
+             time_in: Optional[int] = None) -> EventResult:
+        """Park a car on the shard owning it or its space; see CarPark.park."""
+        with self._lock:
+            return self._park(reg.upper(), duration, space_id, time_in)
+
+    def _park(self, reg: str, duration: int, space_id: Optional[str], time_in: Optional[int]) -> EventResult:
+        if reg in self.parked_at:
+            return EventResult(False, f"Car '{reg}' is already parked.")
+        home = shard_of(reg, self.workers)
+        if space_id is not None and shard_of(space_id, self.workers) != home:
+            entitlement = self._call(home, "entitlement", reg)
+            if entitlement is None:
+                return EventResult(False, f"Car with registration '{reg}' is not registered in this car park.")
+            target = shard_of(space_id, self.workers)
+            result, _ = self._call(target, "park", reg, duration, space_id, time_in, entitlement)
+        else:
+            target = home
+            result, entitlement = self._call(home, "park", reg, duration, space_id, time_in, None)
+            # The car's own shard is full: try the others as a guest with its entitlement
+            for target in range(self.workers) if entitlement is not None else ():
+                if target != home:
+                    result, _ = self._call(target, "park", reg, duration, None, time_in, entitlement)
+                    if result.ok:
+                        break
+        if result.ok:
+            self.parked_at[reg] = target
+        return result
+
+    def leave(self, identifier: str, time_out: Optional[int] = None) -> EventResult:
+        """Remove a car, found by registration or space ID."""
+        with self._lock:
+            return self._leave(identifier.upper(), time_out)
+
+    def _leave(self, identifier: str, time_out: Optional[int]) -> EventResult:
+        shard = self.parked_at.get(identifier, shard_of(identifier, self.workers))
+        result = self._call(shard, "leave", identifier, time_out)
+        if result.ok:
+            self.parked_at.pop(result.record.reg, None)
+        return result
+
+    def count_available(self, required_type: str = "Standard", level: Optional[int] = None) -> int:
+        with self._lock:
+            return sum(self._call_all("count_free", [(required_type, level)] * self.workers))
+
+    def parked(self) -> List[ParkedRecord]:
+        """Every active session, gathered from all shards."""
+        with self._lock:
+            return [record for records in self._call_all("parked") for record in records]
+
+    def save_parked(self, filename: str = "PARKED.txt") -> None:
+        carpark.write_parked_file(filename, self.parked())
+
+    def sizes(self) -> List[Tuple[int, int, int]]:
+        """(spaces, cars, parked) held by each shard."""
+        with self._lock:
+            return self._call_all("sizes")
+
+    # -- batches --------------------------------------------------------------
+
+    def _apply_event(self, line: str) -> EventResult:
+        parts = line.split(", ")
+        kind = parts[0].upper()
+        try:
+            if kind == "PARK" and len(parts) in (4, 5):
+                space_id = parts[4] if len(parts) == 5 else None
+                return self._park(parts[2].upper(), int(parts[3]), space_id, carpark.parse_time_minutes(parts[1]))
+            if kind == "LEAVE" and len(parts) == 3:
+                return self._leave(parts[2].upper(), carpark.parse_time_minutes(parts[1]))
+        except ValueError:
+            pass
+        return EventResult(False, f"Malformed event {line!r}.")
+
+    def _batch_shard(self, line: str) -> Optional[int]:
+        """Shard that can apply an event on its own, or None if it spans shards."""
+        parts = line.split(", ")
+        kind = parts[0].upper()
+        if kind == "PARK" and len(parts) in (4, 5):
+            reg = parts[2].upper()
+            home = shard_of(reg, self.workers)
+            if self.parked_at.get(reg, home) != home:
+                return None
+            if len(parts) == 5 and shard_of(parts[4], self.workers) != home:
+                return None
+            return home
+        if kind == "LEAVE" and len(parts) == 3:
+            identifier = parts[2].upper()
+            return self.parked_at.get(identifier, shard_of(identifier, self.workers))
+        # Malformed: any shard will reject it
+        return 0
+
+    def replay(self, lines: Iterable[str], out: Optional[TextIO] = None) -> BatchStats:
+        """Apply a stream of park/leave events, as replay_events does, with every shard working at once.
+
+        A car whose own shard is full is handed back and parked on another
+        shard, as park() does. That happens once the round of batches is in,
+        so the other shards are seen as they stand up to REPLAY_BATCH_SIZE
+        events later than the arrival. With `out`, results are written in
+        input order.
+        """
+        stats = BatchStats()
+        start = time.perf_counter()
+        batches: List[List[Tuple[int, str]]] = [[] for _ in range(self.workers)]
+        pending = 0
+        results: List[Tuple[int, bool, str]] = []
+
+        def apply_across(line_no: int, line: str) -> None:
+            result = self._apply_event(line)
+            stats.events += 1
+            stats.accepted += result.ok
+            stats.rejected += not result.ok
+            results.append((line_no, result.ok, result.message))
+
+        def flush() -> None:
+            nonlocal pending
+            if pending:
+                replies = self._call_all("replay", [(batch, out is not None) for batch in batches])
+                handed_back = []
+                for shard, (shard_stats, changes, shard_results, shard_handed_back) in enumerate(replies):
+                    stats.events += shard_stats.events
+                    stats.accepted += shard_stats.accepted
+                    stats.rejected += shard_stats.rejected
+                    for reg, parked in changes:
+                        if parked:
+                            self.parked_at[reg] = shard
+                        else:
+                            self.parked_at.pop(reg, None)
+                    results.extend(shard_results)
+                    handed_back.extend(shard_handed_back)
+                for batch in batches:
+                    batch.clear()
+                pending = 0
+                for line_no, line in sorted(handed_back):
+                    apply_across(line_no, line)
+            if out is not None:
+                results.sort()
+                for line_no, ok, message in results:
+                    out.write(f"{line_no}, {'OK' if ok else 'REJECTED'}, {message}\n")
+                results.clear()
+
+        with self._lock:
+            for line_no, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                shard = self._batch_shard(line)
+                if shard is None:
+                    flush()
+                    apply_across(line_no, line)
+                    continue
+                batches[shard].append((line_no, line))
+                pending += 1
+                if pending >= REPLAY_BATCH_SIZE:
+                    flush()
+            flush()
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay park/leave events across sharded worker processes")
+    parser.add_argument("events", help="event file, or '-' for stdin")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--spaces", default="SPACES.txt")
+    parser.add_argument("--cars", default="CARS.txt")
+    parser.add_argument("--parked", default="PARKED.txt")
+    parser.add_argument("--save", action="store_true", help="write the resulting sessions back to --parked")
+    args = parser.parse_args(argv)
+
+    with ShardedCarPark(args.workers) as shards:
+        for report in shards.start(args.spaces, args.cars, args.parked):
+            report.print_problems()
+        if args.events == "-":
+            stats = shards.replay(sys.stdin, sys.stdout)
+        else:
+            with open(args.events) as file:
+                stats = shards.replay(file, sys.stdout)
+        sys.stdout.flush()
+        print(f"Replayed {stats.events} events ({stats.accepted} accepted, {stats.rejected} rejected) on "
+              f"{args.workers} shards in {stats.seconds:.3f}s: {stats.events_per_second:,.0f} events/sec",
+              file=sys.stderr)
+        if args.save:
+            shards.save_parked(args.parked)
+
+
+if __name__ == "__main__":
+    main()
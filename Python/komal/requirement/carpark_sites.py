@@ -0,0 +1,217 @@
+"""
+Many car parks (sites) in one process, sharing one car registry.
+
+A campus folder holds the shared CARS.txt and one sub-folder per site
+with that site's SPACES.txt and PARKED.txt:
+
+    campus/CARS.txt
+    campus/north/SPACES.txt
+    campus/north/PARKED.txt
+    campus/south/SPACES.txt
+    ...
+
+Every site's CarPark points at the same registry object, so memory grows
+with spaces and active sessions, not with sites x registered cars. A
+registration may only be parked at one site at a time.
+
+Usage: python carpark_sites.py CAMPUS [--find Standard|Disabled|EV] [--locate REG] [--mapped-cars]
+"""
+import argparse
+import heapq
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import carpark
+from carpark import CarPark, EventResult, LoadReport, ParkedRecord, Space
+
+
+class Campus:
+    """Named CarPark sites sharing one read-only car registry.
+
+    `site_of` maps each parked registration to its site, so cross-site
+    lookups are O(1) and a car cannot be parked at two sites at once.
+    Per-site questions go straight to that site's own indexes; campus-wide
+    ones visit each site once.
+    """
+
+    def __init__(self) -> None:
+        self.cars = carpark.CarRegistry()
+        self.sites: Dict[str, CarPark] = {}
+        self.folders: Dict[str, str] = {}
+        self.site_of: Dict[str, str] = {}
+
+    def load_cars(self, filename: str, mapped: bool = False) -> LoadReport:
+        """Load the shared registry, from a memory-mapped index if `mapped`, and hand it to every site."""
+        loader = CarPark()
+        report = loader.load_cars_mapped(filename) if mapped else loader.load_cars(filename)
+        self.cars = loader.cars
+        for car_park in self.sites.values():
+            car_park.cars = self.cars
+        return report
+
+    def add_site(self, name: str, car_park: Optional[CarPark] = None) -> CarPark:
+        """Register a site, replacing its car registry with the shared one."""
+        if name in self.sites:
+            raise ValueError(f"Site '{name}' already exists")
+        car_park = car_park or CarPark()
+        car_park.cars = self.cars
+        self.sites[name] = car_park
+        for record in car_park.parked:
+            self.site_of.setdefault(record.reg, name)
+        return car_park
+
+    def load_site(self, name: str, folder: str) -> List[LoadReport]:
+        """Add a site from a folder holding its SPACES.txt and PARKED.txt.
+
+        A car already parked at another site keeps that site in `site_of`;
+        it can still leave from both.
+        """
+        car_park = CarPark()
+        reports = [car_park.load_spaces(os.path.join(folder, "SPACES.txt")),
+                   car_park.load_parked(os.path.join(folder, "PARKED.txt"))]
+        self.add_site(name, car_park)
+        self.folders[name] = folder
+        return reports
+
+    def load(self, folder: str, mapped_cars: bool = False) -> List[LoadReport]:
+        """Load a campus folder: the shared CARS.txt, then every sub-folder with a SPACES.txt as a site."""
+        reports = [self.load_cars(os.path.join(folder, "CARS.txt"), mapped_cars)]
+        for name in sorted(os.listdir(folder)):
+            site_folder = os.path.join(folder, name)
+            if os.path.isfile(os.path.join(site_folder, "SPACES.txt")):
+                reports.extend(self.load_site(name, site_folder))
+        return reports
+
+    def site(self, name: str) -> CarPark:
+        try:
+            return self.sites[name]
+        except KeyError:
+            raise ValueError(f"Unknown site '{name}'") from None
+
+    def open_journals(self) -> None:
+        """Journal each loaded site's events against its own PARKED.txt."""
+        for name, folder in self.folders.items():
+            self.sites[name].open_journal(os.path.join(folder, "PARKED.txt"))
+
+    def save_parked(self) -> None:
+        """Save each loaded site's active sessions to its own PARKED.txt."""
+        for name, folder in self.folders.items():
+            self.sites[name].save_parked(os.path.join(folder, "PARKED.txt"))
+
+    def close(self) -> None:
+        for car_park in self.sites.values():
+            car_park.close_journal()
+            car_park.close_history()
+
+    # -- parking and leaving --------------------------------------------------
+
+    def park(self, site: str, reg: str, duration: int, space_id: Optional[str] = None,
+             time_in: Optional[int] = None, level: Optional[int] = None) -> EventResult:
+        """Park a car at one site; see CarPark.park."""
+        reg = reg.upper()
+        car_park = self.site(site)
+        holder = self.site_of.setdefault(reg, site)
+        if holder != site:
+            return EventResult(False, f"Car '{reg}' is already parked at site '{holder}'.")
+        result = car_park.park(reg, duration, space_id, time_in, level)
+        if not result.ok and reg not in car_park.parked_index.by_reg:
+            self.site_of.pop(reg, None)
+        return result
+
+    def park_anywhere(self, reg: str, duration: int, sites: Optional[Iterable[str]] = None,
+                      time_in: Optional[int] = None) -> Tuple[Optional[str], EventResult]:
+        """Park at the first site, in `sites` order (default: all), with room for the car's entitlement.
+
+        Returns the site the car ended up at, or None; a car already parked
+        is refused with the site holding it.
+        """
+        reg = reg.upper()
+        car = self.cars.get(reg)
+        if car is None:
+            return None, EventResult(False, f"Car with registration '{reg}' is not registered on this campus.")
+        holder = self.site_of.get(reg)
+        if holder is not None:
+            return holder, EventResult(False, f"Car '{reg}' is already parked at site '{holder}'.")
+        for name in (self.sites if sites is None else sites):
+            if self.site(name).count_available(car.entitlement_code):
+                result = self.park(name, reg, duration, time_in=time_in)
+                if result.ok:
+                    return name, result
+                holder = self.site_of.get(reg)
+                if holder is not None:
+                    return holder, result
+        return None, EventResult(False, f"No site has a free space for entitlement '{car.entitlement}'.")
+
+    def leave(self, identifier: str, site: Optional[str] = None, time_out: Optional[int] = None) -> EventResult:
+        """Remove a car by registration, or by space ID when `site` is given."""
+        identifier = identifier.upper()
+        if site is None:
+            site = self.site_of.get(identifier)
+            if site is None:
+                return EventResult(False, f"Car '{identifier}' is not parked at any site.")
+        result = self.site(site).leave(identifier, time_out)
+        if result.ok and self.site_of.get(result.record.reg) == site:
+            del self.site_of[result.record.reg]
+        return result
+
+    # -- campus-wide queries --------------------------------------------------
+
+    def locate(self, reg: str) -> Optional[Tuple[str, ParkedRecord]]:
+        """The site and session of a parked car, or None."""
+        reg = reg.upper()
+        site = self.site_of.get(reg)
+        if site is None:
+            return None
+        record = self.sites[site].parked_index.find(reg)
+        return (site, record) if record is not None else None
+
+    def free_counts(self, required_type: str = "Standard", level: Optional[int] = None) -> Dict[str, int]:
+        """Free spaces an entitlement may use at each site."""
+        return {name: car_park.count_available(required_type, level) for name, car_park in self.sites.items()}
+
+    def find_free(self, required_type: str = "Standard", sites: Optional[Iterable[str]] = None,
+                  level: Optional[int] = None) -> Optional[Tuple[str, Space]]:
+        """The first free space an entitlement may use at any site (in `sites` order), or None."""
+        for name in (self.sites if sites is None else sites):
+            space = self.site(name).first_available(required_type, level)
+            if space is not None:
+                return name, space
+        return None
+
+    def overdue(self, now: Optional[int] = None) -> List[Tuple[str, ParkedRecord]]:
+        """Overdue cars at every site, longest overdue first."""
+        per_site = [[(record.expected_out_min, name, record) for record in car_park.overdue(now)]
+                    for name, car_park in self.sites.items()]
+        return [(name, record) for _, name, record in heapq.merge(*per_site, key=lambda entry: entry[:2])]
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Campus of car parks sharing one car registry")
+    parser.add_argument("campus", help="folder with CARS.txt and one sub-folder per site")
+    parser.add_argument("--find", metavar="TYPE", help="show the first free space for this entitlement")
+    parser.add_argument("--locate", metavar="REG", help="show where a car is parked")
+    parser.add_argument("--mapped-cars", action="store_true",
+                        help="look cars up in a memory-mapped index of CARS.txt instead of loading them all")
+    args = parser.parse_args(argv)
+
+    campus = Campus()
+    for report in campus.load(args.campus, args.mapped_cars):
+        report.print_problems()
+    print(f"{len(campus)} sites sharing {len(campus.cars)} registered cars, {len(campus.site_of)} parked.")
+    for name, car_park in campus.sites.items():
+        print(f"  {name:<16} {len(car_park.spaces):>8} spaces {len(car_park.parked):>8} parked")
+    if args.find:
+        found = campus.find_free(args.find)
+        print(f"First free space for '{args.find}': " + (f"{found[1].id} ({found[1].location}) at {found[0]}"
+                                                         if found else "none on this campus"))
+    if args.locate:
+        found = campus.locate(args.locate)
+        print(f"'{args.locate.upper()}': " + (f"space {found[1].space_id} at {found[0]} until {found[1].expected_time_out}"
+                                              if found else "not parked on this campus"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+SQLite storage for spaces, cars and parking sessions, standard library only.
+
+CarPark.load_spaces/load_cars/load_parked/save_parked and open_journal
+hand any filename ending in .db, .sqlite or .sqlite3 to this module, so a
+database is used exactly like the text files:
+
+    car_park.load_spaces("carpark.db")
+    car_park.open_journal("carpark.db")     # parks and leaves go straight to the parked table
+
+The database runs in WAL mode, so readers (reports, other tools) never
+block the writer, and writes are grouped into transactions of many rows.
+Times are stored as epoch minutes.
+
+Usage: python carpark_sqlite.py DATABASE [--spaces SPACES.txt] [--cars CARS.txt] [--parked PARKED.txt]
+       imports the text files into DATABASE, replacing its contents.
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+from typing import Callable, Iterable, List, Optional
+
+import carpark
+from carpark import CarPark, LoadReport, ParkedRecord, Space, SpaceType
+
+SCHEMA_VERSION = 1
+# Rows per transaction when importing or saving
+BATCH_SIZE = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spaces (
+    id       TEXT    NOT NULL UNIQUE,
+    location TEXT    NOT NULL,
+    type     INTEGER NOT NULL,
+    level    INTEGER NOT NULL,
+    bay      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spaces_type ON spaces (type);
+CREATE TABLE IF NOT EXISTS cars (
+    reg         TEXT    NOT NULL UNIQUE,
+    owner       TEXT    NOT NULL,
+    contract    TEXT    NOT NULL,
+    entitlement INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parked (
+    space_id     TEXT    NOT NULL UNIQUE,
+    reg          TEXT    NOT NULL UNIQUE,
+    time_in      INTEGER NOT NULL,
+    expected_out INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS parked_expected_out ON parked (expected_out);
+"""
+
+_SPACE_TYPES = list(SpaceType)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open (creating if needed) a car park database in WAL mode with the schema in place."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with conn:
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return conn
+
+
+def _write_batches(conn: sqlite3.Connection, sql: str, rows: Iterable[tuple], batch_size: int = BATCH_SIZE,
+                   commit: bool = True) -> int:
+    """executemany `batch_size` rows at a time; returns the number written.
+
+    Each batch is its own transaction, unless `commit` is False and the
+    caller's open transaction takes them all.
+    """
+    rows = iter(rows)
+    written = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        if commit:
+            with conn:
+                conn.executemany(sql, batch)
+        else:
+            conn.executemany(sql, batch)
+        written += len(batch)
+
+
+def _open_existing(path: str, report: LoadReport) -> Optional[sqlite3.Connection]:
+    if not os.path.exists(path):
+        report.missing = True
+        return None
+    return connect(path)
+
+
+def load_spaces(car_park: CarPark, path: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+    """CarPark.load_spaces from the spaces table, in insertion order."""
+    car_park.spaces = spaces = []
+    car_park.space_registry.clear()
+    report = LoadReport(path)
+    conn = _open_existing(path, report)
+    if conn is None:
+        return report
+    try:
+        for rowid, space_id, location, code, level, bay in conn.execute(
+                "SELECT rowid, id, location, type, level, bay FROM spaces ORDER BY rowid"):
+            if keep is not None and not keep(space_id):
+                continue
+            if not 0 <= code < len(_SPACE_TYPES):
+                report.bad(rowid, f"space '{space_id}' has unknown type code {code}")
+                continue
+            spaces.append(Space(space_id, location, _SPACE_TYPES[code], False, level, bay))
+    finally:
+        conn.close()
+    car_park.space_registry.add_many(spaces)
+    report.loaded = len(spaces)
+    return report
+
+
+def load_cars(car_park: CarPark, path: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+    """CarPark.load_cars from the cars table."""
+    car_park.cars = cars = carpark.CarRegistry()
+    report = LoadReport(path)
+    conn = _open_existing(path, report)
+    if conn is None:
+        return report
+    try:
+        cursor = conn.execute("SELECT reg, owner, contract, entitlement FROM cars "
+                              "WHERE entitlement BETWEEN 0 AND ? ORDER BY rowid", (len(_SPACE_TYPES) - 1,))
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            if keep is not None:
+                rows = [row for row in rows if keep(row[0])]
+            if rows:
+                cars.extend(*zip(*rows))
+        bad = conn.execute("SELECT rowid, reg, entitlement FROM cars WHERE entitlement NOT BETWEEN 0 AND ?",
+                           (len(_SPACE_TYPES) - 1,))
+        for rowid, reg, code in bad:
+            if keep is None or keep(reg):
+                report.bad(rowid, f"car '{reg}' has unknown entitlement code {code}")
+    finally:
+        conn.close()
+    report.loaded = len(cars)
+    return report
+
+
+def load_parked(car_park: CarPark, path: str, keep: Optional[Callable[[str], bool]] = None) -> LoadReport:
+    """CarPark.load_parked from the parked table, marking spaces occupied."""
+    parked_index, space_registry = car_park.parked_index, car_park.space_registry
+    for record in parked_index.records:
+        space_registry.release(record.space_id)
+    parked_index.clear()
+    report = LoadReport(path)
+    conn = _open_existing(path, report)
+    if conn is None:
+        return report
+    try:
+        rows = conn.execute("SELECT rowid, space_id, reg, time_in, expected_out FROM parked ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+    for rowid, space_id, reg, time_in, expected_out in rows:
+        if keep is not None and not keep(space_id):
+            continue
+        if not parked_index.add(ParkedRecord(space_id, reg, time_in, expected_out)):
+            report.bad(rowid, f"duplicate parking record for '{reg}' in space '{space_id}'")
+            continue
+        space_registry.occupy(space_id)
+    report.loaded = len(parked_index.records)
+    return report
+
+
+def save_parked(car_park: CarPark, path: str) -> None:
+    """Replace the parked table with the active sessions in one transaction."""
+    conn = connect(path)
+    try:
+        rows = [(r.space_id, r.reg, r.time_in_min, r.expected_out_min) for r in car_park.parked]
+        with conn:
+            conn.execute("DELETE FROM parked")
+            conn.executemany("INSERT INTO parked VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+
+
+class SqliteJournal:
+    """Park/leave events applied to the parked table as they happen.
+
+    Stands in for ParkedJournal when the snapshot is a database: each event
+    is one row change, committed in transactions of `sync_every` events,
+    and the table always holds the whole state, so compaction only commits.
+    """
+
+    def __init__(self, path: str, sync_every: int = 16) -> None:
+        self.snapshot = path
+        self.sync_every = sync_every
+        self._conn = connect(path)
+        self._unsynced = 0
+
+    def record_park(self, record: ParkedRecord) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO parked VALUES (?, ?, ?, ?)",
+                           (record.space_id, record.reg, record.time_in_min, record.expected_out_min))
+        self._count()
+
+    def record_leave(self, record: ParkedRecord) -> None:
+        self._conn.execute("DELETE FROM parked WHERE space_id = ? AND reg = ?", (record.space_id, record.reg))
+        self._count()
+
+    def _count(self) -> None:
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            self._conn.commit()
+            self._unsynced = 0
+
+    def compact(self) -> None:
+        self.sync()
+
+    def close(self) -> None:
+        self.sync()
+        self._conn.close()
+
+
+def import_text(path: str, spaces_file: str = "SPACES.txt", cars_file: str = "CARS.txt",
+                parked_file: str = "PARKED.txt", batch_size: int = BATCH_SIZE) -> List[LoadReport]:
+    """Replace a database's contents with the text files, validated by the usual loaders.
+
+    The whole replacement is one transaction, so readers see the old
+    contents or the new, and a failed import leaves the old in place.
+    """
+    source = CarPark()
+    reports = [source.load_spaces(spaces_file), source.load_cars(cars_file), source.load_parked(parked_file)]
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM spaces")
+            conn.execute("DELETE FROM cars")
+            conn.execute("DELETE FROM parked")
+            _write_batches(conn, "INSERT INTO spaces VALUES (?, ?, ?, ?, ?)",
+                           ((s.id, s.location, int(s.type_code), s.level, s.bay) for s in source.spaces),
+                           batch_size, commit=False)
+            _write_batches(conn, "INSERT INTO cars VALUES (?, ?, ?, ?)",
+                           ((reg, car.owner, car.contract, int(car.entitlement_code))
+                            for reg, car in source.cars.items()), batch_size, commit=False)
+            _write_batches(conn, "INSERT INTO parked VALUES (?, ?, ?, ?)",
+                           ((r.space_id, r.reg, r.time_in_min, r.expected_out_min) for r in source.parked),
+                           batch_size, commit=False)
+    finally:
+        conn.close()
+    return reports
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import the car park text files into a SQLite database")
+    parser.add_argument("database")
+    parser.add_argument("--spaces", default="SPACES.txt")
+    parser.add_argument("--cars", default="CARS.txt")
+    parser.add_argument("--parked", default="PARKED.txt")
+    args = parser.parse_args(argv)
+    reports = import_text(args.database, args.spaces, args.cars, args.parked)
+    for report in reports:
+        report.print_problems()
+    print(f"Imported {reports[0].loaded} spaces, {reports[1].loaded} cars and {reports[2].loaded} "
+          f"parked records into '{args.database}'.")
+
+
+if __name__ == "__main__":
+    main()
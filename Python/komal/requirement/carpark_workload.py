@@ -0,0 +1,214 @@
+"""
+Seedable synthetic workloads in the car park file formats.
+
+Generates a SPACES.txt layout (levels of numbered bays, Disabled bays by
+each level's entrance and EV bays at the far end), a CARS.txt permit list
+with the same Standard/Disabled/EV mix, and a time-ordered stream of
+park/leave events for --batch replay:
+
+    PARK, 2025-10-06 08:12, KX47RTA, 540
+    LEAVE, 2025-10-06 17:14, KX47RTA
+
+Arrivals follow an hourly profile with a morning commuter peak and a
+smaller lunchtime one. Stays are whole 15-minute multiples: long for
+morning arrivals, short otherwise, and a share of cars overstay. Drivers
+are turned away when no space they may use is free, so a replay against
+the generated layout is accepted in full. The same seed always gives the
+same files.
+
+Usage: python carpark_workload.py FOLDER [--levels N] [--bays N] [--cars N] [--days N] [--seed N]
+"""
+import argparse
+import heapq
+import os
+import random
+import string
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import carpark
+from carpark import SpaceType
+
+# Share of spaces, and of permits, of each type
+DEFAULT_MIX: Dict[SpaceType, float] = {SpaceType.STANDARD: 0.85, SpaceType.DISABLED: 0.05, SpaceType.EV: 0.10}
+# Relative arrivals in each hour of the day, 00:00 to 23:00
+ARRIVALS_BY_HOUR = (1, 1, 1, 1, 1, 3, 8, 30, 40, 22, 10, 9, 12, 11, 8, 7, 6, 6, 4, 3, 2, 2, 1, 1)
+# Arrivals in these hours are mostly commuters staying the working day
+COMMUTER_HOURS = range(6, 10)
+STAY_STEP = carpark.PARK_DURATION_STEP
+OVERSTAY_SHARE = 0.08
+
+_FIRST_NAMES = ("Aarav", "Priya", "Rahul", "Neha", "Vikram", "Olivia", "James", "Amelia", "Noah", "Isla",
+                "Mohammed", "Sofia", "Liam", "Grace", "Ethan", "Chloe", "Arjun", "Mia", "Oscar", "Zara")
+_LAST_NAMES = ("Sharma", "Singh", "Verma", "Patel", "Das", "Smith", "Jones", "Taylor", "Brown", "Wilson",
+               "Evans", "Khan", "Thomas", "Roberts", "Walker", "Wright", "Hughes", "Green", "Hall", "Wood")
+
+
+def _type_counts(total: int, mix: Dict[SpaceType, float]) -> Dict[SpaceType, int]:
+    """Split `total` by `mix`, giving the rounding remainder to Standard."""
+    counts = {space_type: int(total * share) for space_type, share in mix.items()}
+    counts[SpaceType.STANDARD] = total - sum(n for t, n in counts.items() if t != SpaceType.STANDARD)
+    return counts
+
+
+def generate_spaces(levels: int, bays_per_level: int,
+                    mix: Dict[SpaceType, float] = DEFAULT_MIX) -> Iterator[Tuple[str, str, SpaceType]]:
+    """(space_id, location, type) for every bay, level by level.
+
+    Each level gets its share of Disabled bays nearest the entrance (the
+    lowest bay numbers) and of EV bays at the far end, by the chargers.
+    """
+    counts = _type_counts(bays_per_level, mix)
+    disabled, ev = counts.get(SpaceType.DISABLED, 0), counts.get(SpaceType.EV, 0)
+    width = len(str(levels * bays_per_level))
+    bay_width = max(2, len(str(bays_per_level)))
+    number = 0
+    for level in range(1, levels + 1):
+        for bay in range(1, bays_per_level + 1):
+            number += 1
+            if bay <= disabled:
+                space_type = SpaceType.DISABLED
+            elif bay > bays_per_level - ev:
+                space_type = SpaceType.EV
+            else:
+                space_type = SpaceType.STANDARD
+            yield f"S{number:0{width}d}", f"Level {level} - Bay {bay:0{bay_width}d}", space_type
+
+
+def _registration(rng: random.Random) -> str:
+    """A UK-style registration, e.g. KX47RTA."""
+    letters = string.ascii_uppercase
+    return (rng.choice(letters) + rng.choice(letters) + f"{rng.randrange(100):02d}"
+            + "".join(rng.choice(letters) for _ in range(3)))
+
+
+def generate_cars(count: int, mix: Dict[SpaceType, float] = DEFAULT_MIX,
+                  seed: int = 1) -> List[Tuple[str, str, str, SpaceType]]:
+    """`count` permits as (reg, owner, contact, entitlement), with unique registrations."""
+    rng = random.Random(seed)
+    entitlements = [space_type for space_type, n in _type_counts(count, mix).items() for _ in range(n)]
+    rng.shuffle(entitlements)
+    seen = set()
+    cars = []
+    for i, entitlement in enumerate(entitlements):
+        reg = _registration(rng)
+        while reg in seen:
+            reg = _registration(rng)
+        seen.add(reg)
+        first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+        cars.append((reg, f"{first} {last}", f"{first}.{last}{i}@email.com".lower(), entitlement))
+    return cars
+
+
+def _stay_minutes(rng: random.Random, hour: int) -> int:
+    """Booked stay for an arrival in `hour`, a whole number of STAY_STEP minutes."""
+    if hour in COMMUTER_HOURS and rng.random() < 0.8:
+        minutes = rng.gauss(8.5 * 60, 45)
+    else:
+        minutes = rng.expovariate(1 / 90) + 30
+    return max(STAY_STEP, min(12 * 60, round(minutes / STAY_STEP) * STAY_STEP))
+
+
+def generate_events(cars: List[Tuple[str, str, str, SpaceType]], spaces: Dict[SpaceType, int],
+                    days: int = 1, start: str = "2025-10-06 00:00", turnover: float = 1.5,
+                    seed: int = 1) -> Iterator[str]:
+    """Time-ordered PARK/LEAVE event lines over `days` days.
+
+    About `turnover` x the number of spaces arrive each day, spread over
+    ARRIVALS_BY_HOUR. A car is never parked twice at once, and is turned
+    away (no event) when every space type its entitlement allows is taken,
+    tracked per type the way CarPark allocates. Leaves at the same minute
+    come before parks, and every car still parked leaves after the last day.
+    """
+    rng = random.Random(seed)
+    free = {space_type: spaces.get(space_type, 0) for space_type in SpaceType}
+    idle = list(range(len(cars)))
+    departures: List[Tuple[int, int, SpaceType]] = []
+    origin = carpark.to_epoch_minutes(start)
+    weights = sum(ARRIVALS_BY_HOUR)
+    daily = turnover * sum(free.values())
+
+    def leave_until(minute: int) -> Iterator[str]:
+        while departures and departures[0][0] <= minute:
+            time_out, car, space_type = heapq.heappop(departures)
+            free[space_type] += 1
+            idle.append(car)
+            yield f"LEAVE, {carpark.format_epoch_minutes(time_out)}, {cars[car][0]}"
+
+    for day in range(days):
+        arrivals = []
+        for hour, weight in enumerate(ARRIVALS_BY_HOUR):
+            base = origin + day * 24 * 60 + hour * 60
+            expected = daily * weight / weights
+            count = int(expected) + (rng.random() < expected % 1)
+            arrivals.extend(base + rng.randrange(60) for _ in range(count))
+        arrivals.sort()
+        for minute in arrivals:
+            yield from leave_until(minute)
+            if not idle:
+                continue
+            slot = rng.randrange(len(idle))
+            car = idle[slot]
+            space_type = next((t for t in carpark.allowed_space_types(cars[car][3]) if free[t]), None)
+            if space_type is None:
+                continue
+            idle[slot] = idle[-1]
+            idle.pop()
+            free[space_type] -= 1
+            hour = (minute - origin) // 60 % 24
+            stay = _stay_minutes(rng, hour)
+            actual = stay
+            if rng.random() < OVERSTAY_SHARE:
+                actual += rng.choice((15, 30, 45, 60, 90))
+            else:
+                actual -= rng.randrange(min(stay, 30))
+            heapq.heappush(departures, (minute + max(1, actual), car, space_type))
+            yield f"PARK, {carpark.format_epoch_minutes(minute)}, {cars[car][0]}, {stay}"
+    yield from leave_until(float("inf"))
+
+
+def write_workload(folder: str, levels: int = 10, bays_per_level: int = 100, cars: Optional[int] = None,
+                   days: int = 1, seed: int = 1, mix: Dict[SpaceType, float] = DEFAULT_MIX) -> Dict[str, str]:
+    """Write SPACES.txt, CARS.txt, an empty PARKED.txt and EVENTS.txt into `folder`.
+
+    `cars` defaults to twice the number of spaces. Returns the paths by file name.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = {name: os.path.join(folder, name) for name in ("SPACES.txt", "CARS.txt", "PARKED.txt", "EVENTS.txt")}
+    spaces = {space_type: 0 for space_type in SpaceType}
+    with open(paths["SPACES.txt"], "w") as file:
+        file.write("# Space ID, Location, Type e.g., Standard/Disabled/EV.\n")
+        for space_id, location, space_type in generate_spaces(levels, bays_per_level, mix):
+            spaces[space_type] += 1
+            file.write(f"{space_id}, {location}, {space_type.label}\n")
+    permits = generate_cars(cars if cars is not None else 2 * levels * bays_per_level, mix, seed)
+    with open(paths["CARS.txt"], "w") as file:
+        file.write("# Registration, Owner Name, Contact, Entitlement\n")
+        file.writelines(f"{reg}, {owner}, {contact}, {entitlement.label}\n"
+                        for reg, owner, contact, entitlement in permits)
+    with open(paths["PARKED.txt"], "w") as file:
+        file.write("# SpaceID, Reg, TimeIn, ExpectedTimeOut\n")
+    with open(paths["EVENTS.txt"], "w") as file:
+        file.write("# Event, Time, Registration[, Minutes]\n")
+        file.writelines(line + "\n" for line in generate_events(permits, spaces, days, seed=seed))
+    return paths
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Write a synthetic car park workload")
+    parser.add_argument("folder")
+    parser.add_argument("--levels", type=int, default=10)
+    parser.add_argument("--bays", type=int, default=100, help="bays per level")
+    parser.add_argument("--cars", type=int, help="registered cars (default: twice the spaces)")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    paths = write_workload(args.folder, args.levels, args.bays, args.cars, args.days, args.seed)
+    with open(paths["EVENTS.txt"]) as file:
+        events = sum(1 for line in file) - 1
+    print(f"Wrote {args.levels * args.bays} spaces, {args.cars or 2 * args.levels * args.bays} cars and "
+          f"{events} events to '{args.folder}'.")
+    print(f"Replay them from that folder with: python carpark.py --batch EVENTS.txt")
+
+
+if __name__ == "__main__":
+    main()
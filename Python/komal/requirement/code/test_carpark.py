@@ -2,9 +2,13 @@
 Test cases for Car Park Management System
 """
 import os
+import shutil
 import sys
+import tempfile
+import time
 from io import StringIO
 from datetime import datetime
+from unittest import mock
 
 # Import the carpark module
 import carpark
@@ -187,6 +191,1197 @@ def test_free_spaces_count():
     
     print("✓ TEST 10 PASSED")
 
+def test_space_registry():
+    """Test 11: Space registry lookup, occupy and release"""
+    print("\n" + "="*60)
+    print("TEST 11: Space Registry")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_parked("PARKED.txt")
+    registry = carpark.space_registry
+    
+    assert registry.get("S002")["location"] == "Level 1 - Bay 02"
+    assert registry.get("NOPE") is None
+    assert "S001" not in registry.free_by_type[carpark.SpaceType.STANDARD], "S001 is parked in"
+    
+    assert registry.occupy("S002")
+    assert not registry.occupy("S002"), "Cannot occupy a taken space twice"
+    assert "S002" not in registry.free_by_type[carpark.SpaceType.STANDARD]
+    assert registry.release("S002")
+    assert not registry.release("S002"), "Cannot release a free space twice"
+    assert "S002" in registry.free_by_type[carpark.SpaceType.STANDARD]
+    print("✓ Lookup, occupy and release keep the free sets in step")
+    
+    print("✓ TEST 11 PASSED")
+
+def test_availability_queries():
+    """Test 12: Count, first-free and paged availability queries"""
+    print("\n" + "="*60)
+    print("TEST 12: Availability Queries")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_parked("PARKED.txt")
+    
+    for entitlement in ("Standard", "Disabled", "EV"):
+        count = carpark.count_available_spaces(entitlement)
+        print(f"  {entitlement}: {count} available")
+        assert count == len(carpark.get_available_spaces(entitlement))
+    
+    # Disabled drivers prefer Disabled bays but may fall back to Standard
+    assert carpark.first_available_space("Disabled")["id"] == "S003"
+    assert carpark.count_available_spaces("Disabled") == 4
+    assert carpark.first_available_space("EV") is None, "S004 is the only EV bay"
+    
+    pages = [[s["id"] for s in carpark.iter_available_spaces("Disabled", page, 3)] for page in range(3)]
+    print(f"  Disabled pages of 3: {pages}")
+    assert pages == [["S003", "S002", "S005"], ["S006"], []]
+    
+    print("✓ TEST 12 PASSED")
+
+def test_leave_by_index():
+    """Test 13: Departures go through the reg and space indexes"""
+    print("\n" + "="*60)
+    print("TEST 13: Leave via Indexes")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_cars("CARS.txt")
+    carpark.load_parked("PARKED.txt")
+    index = carpark.parked_index
+    assert index.find("AB12CDE") is index.find("S001"), "Reg and space lookups should agree"
+    
+    with mock.patch("builtins.input", return_value="ab12cde"), mock.patch("sys.stdout", new=StringIO()):
+        carpark.leave_car()
+    assert index.find("AB12CDE") is None and index.find("S001") is None
+    assert [r["reg"] for r in carpark.parked] == ["EV99CAR"]
+    assert not carpark.space_registry.get("S001")["occupied"]
+    print("✓ Left by registration")
+    
+    with mock.patch("builtins.input", return_value="S004"), mock.patch("sys.stdout", new=StringIO()):
+        carpark.leave_car()
+    assert carpark.parked == [] and index.by_reg == {} and index.by_space == {}
+    print("✓ Left by space ID")
+    
+    print("✓ TEST 13 PASSED")
+
+def test_compact_records():
+    """Test 14: Slotted records keep dict-style access"""
+    print("\n" + "="*60)
+    print("TEST 14: Compact Records")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_cars("CARS.txt")
+    carpark.load_parked("PARKED.txt")
+    
+    record = carpark.parked_index.find("AB12CDE")
+    assert not hasattr(record, "__dict__"), "Records should use __slots__"
+    assert record.time_in_min == carpark.to_epoch_minutes("2025-09-30 09:15")
+    assert record["time_in"] == "2025-09-30 09:15"
+    assert record.expected_out_min - record.time_in_min == 7 * 60 + 45
+    print(f"✓ {record['reg']} stored as minutes {record.time_in_min}..{record.expected_out_min}")
+    
+    space = carpark.space_registry.get("S004")
+    assert space.type_code == carpark.SpaceType.EV and space["type"] == "EV"
+    # Writes through the dict view would leave the registry's free sets behind
+    free_space = carpark.space_registry.get("S002")
+    for key, value in (("occupied", True), ("type", "EV")):
+        try:
+            free_space[key] = value
+            assert False, f"Setting space['{key}'] should raise"
+        except TypeError:
+            pass
+    try:
+        free_space.type = "EV"
+        assert False, "A space's type should be read-only"
+    except AttributeError:
+        pass
+    assert not free_space.occupied and free_space.type_code == carpark.SpaceType.STANDARD
+    assert free_space in carpark.space_registry.iter_free("Standard")
+    result = carpark.park_vehicle("XY34ZRT", 15, "S002")
+    assert not result.ok and "Standard space" in result.message, "The EV car is still turned away cleanly"
+    print("✓ Spaces refuse dict-style writes that would bypass the registry")
+    assert carpark.cars["EV99CAR"]["entitlement"] == "Disabled"
+    assert carpark.cars["EV99CAR"].entitlement_code == carpark.SpaceType.DISABLED
+    carpark.cars["DD22BBB"]["entitlement"] = "EV"
+    carpark.cars["DD22BBB"].owner = "Vikram Das Jr"
+    assert carpark.cars["DD22BBB"]["entitlement"] == "EV" and carpark.cars["DD22BBB"]["owner"] == "Vikram Das Jr"
+    assert carpark.cars.columns()[3][-1] == carpark.SpaceType.EV, "Writes land in the registry's columns"
+    carpark.load_cars("CARS.txt")
+    
+    record["expected_time_out"] = "2025-09-30 18:30"
+    assert record.expected_out_min == carpark.to_epoch_minutes("2025-09-30 18:30")
+    try:
+        record["colour"]
+        assert False, "Unknown keys should raise KeyError"
+    except KeyError:
+        pass
+    print("✓ Dict-style reads and writes map onto the typed fields")
+    
+    print("✓ TEST 14 PASSED")
+
+def test_parked_journal():
+    """Test 15: Park/leave events survive a crash via the journal"""
+    print("\n" + "="*60)
+    print("TEST 15: Parked Journal")
+    print("="*60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "PARKED.txt")
+        shutil.copy("PARKED.txt", snapshot)
+        carpark.load_spaces("SPACES.txt")
+        carpark.load_cars("CARS.txt")
+        carpark.load_parked(snapshot)
+        carpark.open_journal(snapshot, sync_every=2)
+        
+        answers = iter(["S004", "ZZ11AAA", "45", "y", "1"])
+        with mock.patch("builtins.input", lambda prompt: next(answers)), mock.patch("sys.stdout", new=StringIO()):
+            carpark.leave_car()
+            carpark.park_car()
+        parked_in = carpark.parked_index.find("ZZ11AAA").space_id
+        # Simulate a crash: the snapshot is never rewritten
+        carpark.close_journal()
+        
+        with open(snapshot) as file:
+            assert "EV99CAR" in file.read(), "Snapshot untouched until compaction"
+        carpark.load_spaces("SPACES.txt")
+        carpark.load_parked(snapshot)
+        assert carpark.parked_index.find("EV99CAR") is None
+        assert carpark.parked_index.find("ZZ11AAA").space_id == parked_in
+        assert carpark.space_registry.get(parked_in).occupied
+        print(f"✓ Replayed leave of EV99CAR and park of ZZ11AAA in {parked_in}")
+        
+        carpark.open_journal(snapshot)
+        with mock.patch("sys.stdout", new=StringIO()):
+            carpark.save_parked(snapshot)
+        carpark.close_journal()
+        assert os.path.getsize(snapshot + carpark.JOURNAL_SUFFIX) == 0, "Compaction empties the journal"
+        carpark.load_parked(snapshot)
+        assert sorted(r.reg for r in carpark.parked) == ["AB12CDE", "ZZ11AAA"]
+        print("✓ Compaction folded the journal into the snapshot")
+    
+    print("✓ TEST 15 PASSED")
+
+def test_bad_lines_reported():
+    """Test 16: Malformed lines are reported, not fatal"""
+    print("\n" + "="*60)
+    print("TEST 16: Bad Line Reporting")
+    print("="*60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cars_file = os.path.join(tmp, "CARS.txt")
+        with open(cars_file, "w") as file:
+            file.write("# Registration, Owner Name, Contact, Entitlement\n")
+            file.write("AB12CDE, Aarav Sharma, aarav.sharma@email.com, Standard\n")
+            file.write("BROKEN LINE\n")
+            file.write("\n")
+            file.write("XY34ZRT, Priya Singh, priya.singh@email.com, Hover\n")
+            file.write("EV99CAR, Rahul Verma, rahul.verma@email.com, Disabled")
+        with mock.patch("sys.stdout", new=StringIO()) as out:
+            report = carpark.load_cars(cars_file)
+        print(out.getvalue().rstrip())
+        assert report.loaded == 2 and sorted(carpark.cars) == ["AB12CDE", "EV99CAR"]
+        assert [line_no for line_no, _ in report.bad_lines] == [3, 5]
+        
+        # A clean file takes the column fast path, even across several chunks
+        with open(cars_file, "w") as file:
+            file.write("# Registration, Owner Name, Contact, Entitlement\n")
+            for i in range(500):
+                file.write(f"CP{i:05d}, Owner {i}, owner{i}@email.com, EV\n")
+        with mock.patch.object(carpark, "LOAD_CHUNK_SIZE", 1000):
+            report = carpark.load_cars(cars_file)
+        assert report.loaded == 500 and report.skipped == 0
+        assert carpark.cars["CP00499"]["owner"] == "Owner 499"
+        
+        # Lines misaligned in opposite directions keep the total cell count, but not the rows
+        spaces_file = os.path.join(tmp, "SPACES.txt")
+        with open(spaces_file, "w") as file:
+            file.write("S1, Level 1 - Bay 01, EV, Standard\nS2, Standard\nS3, Level 1 - Bay 03, EV\n")
+        report = carpark.CarPark().load_spaces(spaces_file)
+        assert report.loaded == 1 and report.skipped == 2
+        with open(cars_file, "w") as file:
+            file.write("R1, Owner, Standard, Standard, x\ny, z, Standard\n")
+        site = carpark.CarPark()
+        report = site.load_cars(cars_file)
+        assert report.skipped == 2 and "Y" not in site.cars and "X" not in site.cars
+        assert carpark.split_columns("a, b\nc, d, e\nf", 2) is None
+        columns = carpark.split_columns("S1, L1, EV\nS2, L2, Disabled", 3, type_codes=True)
+        assert columns[:2] == [["S1", "S2"], ["L1", "L2"]] and list(columns[2]) == [2, 1]
+        assert carpark.split_columns("S1, L1, Roof\nS2, L2, EV", 3, type_codes=True) is None
+        
+        # A repeated ID is reported whether it repeats within a chunk or across chunks
+        with open(spaces_file, "w") as file:
+            file.write("S1, Level 1 - Bay 01, EV\nS2, Level 1 - Bay 02, EV\nS1, Level 1 - Bay 03, EV\n")
+        site = carpark.CarPark()
+        report = site.load_spaces(spaces_file)
+        assert report.loaded == 2 and report.bad_lines == [(3, "duplicate space ID 'S1'")]
+        with mock.patch.object(carpark, "LOAD_CHUNK_SIZE", 30):
+            report = site.load_spaces(spaces_file)
+        assert report.loaded == 2 and report.skipped == 1
+        assert [space.location for space in site.spaces] == ["Level 1 - Bay 01", "Level 1 - Bay 02"]
+    print("✓ Bad lines skipped with line numbers; clean files load in full")
+    
+    print("✓ TEST 16 PASSED")
+
+def test_binary_snapshot():
+    """Test 17: Binary snapshot round trip and corruption fallback"""
+    print("\n" + "="*60)
+    print("TEST 17: Binary Snapshot")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_cars("CARS.txt")
+    carpark.load_parked("PARKED.txt")
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "carpark.snap")
+        carpark.save_snapshot(snapshot)
+        assert carpark.snapshot_is_fresh(snapshot, ["SPACES.txt", "CARS.txt", "PARKED.txt"])
+        
+        carpark.load_spaces(os.path.join(tmp, "missing.txt"))
+        assert carpark.load_snapshot(snapshot)
+        assert len(carpark.spaces) == 6 and len(carpark.cars) == 5 and len(carpark.parked) == 2
+        assert carpark.cars["XY34ZRT"]["entitlement"] == "EV"
+        assert isinstance(carpark.cars, carpark.MappedCarRegistry), "Cars are served from the mapped snapshot"
+        assert "ZZ99ZZZ" not in carpark.cars and list(carpark.cars) == sorted(carpark.cars)
+        served = carpark.cars
+        with mock.patch.object(carpark.MappedCarRegistry, "columns", side_effect=AssertionError("decoded")):
+            carpark.save_snapshot(snapshot)
+        assert served._map.closed, "The map is closed before its file is replaced"
+        assert carpark.cars is not served and carpark.cars["XY34ZRT"]["entitlement"] == "EV"
+        served = carpark.cars
+        assert carpark.load_snapshot(snapshot) and len(carpark.cars) == 5, "Resaved from its own map"
+        assert served._map.closed, "Reloading closes the registry it replaces"
+        assert carpark.parked_index.find("S004")["time_in"] == "2025-09-30 08:45"
+        assert carpark.space_registry.get("S004").occupied
+        assert carpark.count_available_spaces("Standard") == 3
+        print("✓ Spaces, cars and sessions restored from the snapshot")
+        
+        with open(snapshot, "r+b") as file:
+            file.seek(40)
+            byte = file.read(1)
+            file.seek(40)
+            file.write(bytes([byte[0] ^ 0xFF]))
+        with mock.patch("sys.stdout", new=StringIO()) as out:
+            assert not carpark.load_snapshot(snapshot)
+        assert "checksum" in out.getvalue()
+        assert len(carpark.parked) == 2, "A rejected snapshot leaves state alone"
+        print("✓ Corrupt snapshot rejected by its checksum")
+    
+    print("✓ TEST 17 PASSED")
+
+def test_mapped_car_registry():
+    """Test 18: Memory-mapped CARS.txt index"""
+    print("\n" + "="*60)
+    print("TEST 18: Mapped Car Registry")
+    print("="*60)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cars_file = os.path.join(tmp, "CARS.txt")
+        shutil.copy("CARS.txt", cars_file)
+        carpark.load_cars_mapped(cars_file)
+        registry = carpark.cars
+        assert isinstance(registry, carpark.MappedCarRegistry)
+        assert len(registry) == 5 and sorted(registry) == list(registry)
+        assert registry["XY34ZRT"]["owner"] == "Priya Singh"
+        assert registry["EV99CAR"].entitlement_code == carpark.SpaceType.DISABLED
+        assert "FAKE123" not in registry and registry.get("FAKE123") is None
+        for write in (lambda car: car.__setitem__("entitlement", "EV"), lambda car: setattr(car, "owner", "X")):
+            try:
+                write(registry["XY34ZRT"])
+                assert False, "Writes to a read-only registry should raise"
+            except (TypeError, AttributeError):
+                pass
+        print(f"✓ {len(registry)} cars served from {os.path.basename(cars_file + carpark.CARS_INDEX_SUFFIX)}")
+        
+        # Editing CARS.txt makes the index stale, so it is rebuilt
+        with open(cars_file, "a") as file:
+            file.write("\nNEW1CAR, New Owner, new@email.com, EV\n")
+        later = os.path.getmtime(cars_file + carpark.CARS_INDEX_SUFFIX) + 5
+        os.utime(cars_file, (later, later))
+        registry.close()
+        carpark.load_cars_mapped(cars_file)
+        assert carpark.cars["NEW1CAR"]["entitlement"] == "EV" and len(carpark.cars) == 6
+        carpark.cars.close()
+        print("✓ Stale index rebuilt after CARS.txt changed")
+        
+        # An index cut short, even one still newer than CARS.txt, is rebuilt too
+        index_file = cars_file + carpark.CARS_INDEX_SUFFIX
+        for size in (0, 10, carpark._CARS_INDEX_HEADER.size + 12, os.path.getsize(index_file) - 1):
+            with open(index_file, "r+b") as file:
+                file.truncate(size)
+            os.utime(index_file, (later + 5, later + 5))
+            assert carpark.snapshot_is_fresh(index_file, [cars_file])
+            report = carpark.load_cars_mapped(cars_file)
+            assert report.loaded == 6 and carpark.cars["NEW1CAR"]["owner"] == "New Owner"
+            carpark.cars.close()
+        print("✓ Truncated index rebuilt instead of failing")
+    
+    carpark.load_cars("CARS.txt")
+    print("✓ TEST 18 PASSED")
+
+def test_batch_replay():
+    """Test 19: Batch replay of park/leave events"""
+    print("\n" + "="*60)
+    print("TEST 19: Batch Event Replay")
+    print("="*60)
+    
+    carpark.load_spaces("SPACES.txt")
+    carpark.load_cars("CARS.txt")
+    carpark.load_parked("PARKED.txt")
+    events = [
+        "# time-ordered ANPR events",
+        "PARK, 2025-10-01 08:00, ZZ11AAA, 50",
+        "PARK, 2025-10-01 08:00, ZZ11AAA, 45, S003",
+        "PARK, 2025-10-01 08:01, ZZ11AAA, 45",
+        "LEAVE, 2025-10-01 08:30, S004",
+        "PARK, 2025-10-01 08:31, XY34ZRT, 120",
+        "LEAVE, 2025-10-01 09:00, NOPE",
+        "PARK, yesterday, DD22BBB, 15",
+    ]
+    out = StringIO()
+    stats = carpark.replay_events(events, out)
+    lines = out.getvalue().splitlines()
+    for line in lines:
+        print(f"  {line}")
+    
+    assert [line.split(", ")[1] for line in lines] == ["REJECTED", "REJECTED", "OK", "OK", "OK", "REJECTED", "REJECTED"]
+    assert lines[0].startswith("2, "), "Results carry the event's line number"
+    assert (stats.events, stats.accepted, stats.rejected) == (7, 3, 4)
+    record = carpark.parked_index.find("XY34ZRT")
+    assert record.space_id == "S004" and record.time_in == "2025-10-01 08:31"
+    assert record.expected_time_out == "2025-10-01 10:31"
+    print(f"✓ {stats.events} events applied at {stats.events_per_second:,.0f} events/sec")
+    
+    print("✓ TEST 19 PASSED")
+
+def test_independent_car_parks():
+    """Test 20: Several CarPark engines in one process"""
+    print("\n" + "="*60)
+    print("TEST 20: Independent Car Parks")
+    print("="*60)
+    
+    north, south = carpark.CarPark(), carpark.CarPark()
+    for site in (north, south):
+        assert not site.load_spaces("SPACES.txt").skipped
+        site.load_cars("CARS.txt")
+    report = north.load_parked("PARKED.txt")
+    assert report.loaded == 2 and not report.missing
+    assert south.load_parked("NO_SUCH_FILE.txt").missing
+    
+    time_in = carpark.to_epoch_minutes("2025-10-01 08:00")
+    result = south.park("zz11aaa", 45, time_in=time_in)
+    assert result.ok and result.record.reg == "ZZ11AAA" and result.record.space_id == "S001"
+    assert result.record.expected_time_out == "2025-10-01 08:45"
+    assert south.parked_index.find("ZZ11AAA") and north.parked_index.find("ZZ11AAA") is None
+    assert north.parked_index.find("S001").reg == "AB12CDE"
+    assert north.count_available("Standard") == 3 and south.count_available("Standard") == 3
+    print(f"✓ {result.message}")
+    
+    assert not north.park("ZZ11AAA", 45, "S004").ok, "S004 is taken in the north car park only"
+    assert not south.park("ZZ11AAA", 45).ok, "Already parked"
+    assert not south.park("FAKE123", 45).ok and not south.park("AB12CDE", 50).ok
+    
+    result = north.leave("S004")
+    assert result.ok and result.record.reg == "EV99CAR"
+    assert not south.leave("EV99CAR").ok
+    assert len(north.parked) == 1 and len(south.parked) == 1
+    assert carpark.default_car_park not in (north, south)
+    print("✓ Park and leave in one car park leave the other untouched")
+    
+    print("✓ TEST 20 PASSED")
+
+def test_network_service():
+    """Test 21: Concurrent barriers over the asyncio service"""
+    print("\n" + "="*60)
+    print("TEST 21: Network Service")
+    print("="*60)
+    import asyncio
+    from carpark_server import CarParkServer, request
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    
+    async def scenario():
+        server = CarParkServer(site, port=0)
+        await server.start()
+        try:
+            regs = ["AB12CDE", "ZZ11AAA", "DD22BBB", "EV99CAR"]
+            connections = await asyncio.gather(*(asyncio.open_connection(server.host, server.port) for _ in regs))
+            replies = await asyncio.gather(*(request(reader, writer, f"PARK, {reg}, 30, S002")
+                                             for (reader, writer), reg in zip(connections, regs)))
+            reader, writer = connections[0]
+            free = await request(reader, writer, "FREE, Standard")
+            listing = await request(reader, writer, "PARKED")
+            bad = await request(reader, writer, "PARK, AB12CDE, soon")
+            left = await request(reader, writer, "LEAVE, S002")
+            for _, writer in connections:
+                writer.close()
+            return replies, free, listing, bad, left
+        finally:
+            await server.stop()
+    
+    replies, free, listing, bad, left = asyncio.run(scenario())
+    winners = [reply for reply in replies if reply["ok"]]
+    assert len(winners) == 1 and winners[0]["space"] == "S002", "Exactly one barrier wins the bay"
+    print(f"✓ {len(replies)} barriers raced for S002: {winners[0]['message']}")
+    assert free["count"] == 3 and "S002" not in free["spaces"]
+    assert [row[0] for row in listing["parked"]] == ["S002"]
+    assert not bad["ok"] and "Malformed" in bad["message"]
+    assert left["ok"] and not site.parked
+    print("✓ FREE, PARKED and LEAVE answered over TCP")
+    
+    print("✓ TEST 21 PASSED")
+
+def test_concurrent_claims():
+    """Test 22: Threads racing for spaces never double-book"""
+    print("\n" + "="*60)
+    print("TEST 22: Concurrent Space Claims")
+    print("="*60)
+    import threading
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    
+    def race(calls):
+        start = threading.Barrier(len(calls))
+        results = [None] * len(calls)
+        def run(i, call):
+            start.wait()
+            results[i] = call()
+        threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    for _ in range(20):
+        results = race([lambda reg=reg: site.park(reg, 15, "S002") for reg in ("AB12CDE", "ZZ11AAA", "DD22BBB")])
+        assert sum(result.ok for result in results) == 1, "Exactly one car gets S002"
+        results = race([lambda: site.leave("S002"), lambda: site.leave("S002")])
+        assert sum(result.ok for result in results) == 1
+    print("✓ 20 three-way races for S002 each had a single winner")
+    
+    for _ in range(20):
+        results = race([lambda: site.park("ZZ11AAA", 15)] * 4)
+        assert sum(result.ok for result in results) == 1, "A car is parked once"
+        assert site.count_available("Standard") == 3, "Losing claims hand their space back"
+        site.leave("ZZ11AAA")
+    assert not site.parked and site.count_available("Standard") == 4
+    print("✓ Concurrent parks of one car claim a single space")
+    
+    print("✓ TEST 22 PASSED")
+
+def test_overstay_queries():
+    """Test 23: Overdue and leaving-soon queries and the overstay sweep"""
+    print("\n" + "="*60)
+    print("TEST 23: Overstay Detection")
+    print("="*60)
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.load_parked("PARKED.txt")
+    minutes = carpark.to_epoch_minutes
+    # S004 EV99CAR is due out at 18:00 and S001 AB12CDE at 17:00
+    assert site.overdue(minutes("2025-09-30 16:59")) == []
+    assert [r.reg for r in site.overdue(minutes("2025-09-30 18:30"))] == ["AB12CDE", "EV99CAR"]
+    assert [r.reg for r in site.leaving_within(60, minutes("2025-09-30 16:45"))] == ["AB12CDE"]
+    assert [r.reg for r in site.leaving_within(60, minutes("2025-09-30 17:01"))] == ["EV99CAR"]
+    print("✓ Overdue and leaving-within queries answered from the heap")
+    
+    site.park("ZZ11AAA", 30, time_in=minutes("2025-09-30 16:00"))
+    site.leave("AB12CDE")
+    assert [r.reg for r in site.overdue(minutes("2025-09-30 17:30"))] == ["ZZ11AAA"]
+    record = site.parked_index.find("ZZ11AAA")
+    site.parked_index.reschedule(record, minutes("2025-09-30 19:00"))
+    assert site.overdue(minutes("2025-09-30 17:30")) == []
+    assert [r.reg for r in site.overdue(minutes("2025-09-30 20:00"))] == ["EV99CAR", "ZZ11AAA"]
+    print("✓ Park, leave and reschedule keep the heap in step")
+    
+    now = [minutes("2025-09-30 18:10")]
+    events = []
+    monitor = carpark.OverstayMonitor(site, on_overstay=lambda r, late: events.append((r.reg, late)),
+                                      clock=lambda: now[0])
+    assert [r.reg for r in monitor.check()] == ["EV99CAR"]
+    assert monitor.check() == [], "Each overstay is reported once"
+    now[0] = minutes("2025-09-30 19:05")
+    monitor.interval = 0.01
+    monitor.start()
+    for _ in range(500):
+        if len(events) >= 2:
+            break
+        time.sleep(0.01)
+    monitor.stop()
+    assert events == [("EV99CAR", 10), ("ZZ11AAA", 5)]
+    print(f"✓ Sweep emitted {events}")
+    
+    print("✓ TEST 23 PASSED")
+
+def test_history_analytics():
+    """Test 24: Parking history and occupancy analytics"""
+    print("\n" + "="*60)
+    print("TEST 24: History Analytics")
+    print("="*60)
+    import carpark_analytics
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    with tempfile.TemporaryDirectory() as tmp:
+        history_file = os.path.join(tmp, "HISTORY.txt")
+        site.open_history(history_file, keep=True)
+        events = [
+            "PARK, 2025-10-01 08:00, AB12CDE, 120",
+            "PARK, 2025-10-01 08:30, EV99CAR, 60",
+            "PARK, 2025-10-01 09:00, XY34ZRT, 30",
+            "LEAVE, 2025-10-01 09:30, EV99CAR",
+            "LEAVE, 2025-10-01 09:30, XY34ZRT",
+            "LEAVE, 2025-10-01 10:00, AB12CDE",
+            "PARK, 2025-10-01 10:00, ZZ11AAA, 15, S005",
+            "LEAVE, 2025-10-01 10:15, ZZ11AAA",
+        ]
+        stats = carpark.replay_events(events, StringIO(), car_park=site)
+        assert stats.rejected == 0
+        site.close_history()
+        
+        history = carpark.ParkingHistory()
+        report = history.load(history_file)
+        assert report.loaded == 4 and not report.skipped
+        assert history.regs == ["EV99CAR", "XY34ZRT", "AB12CDE", "ZZ11AAA"]
+    print(f"✓ {report.loaded} completed sessions logged and reloaded")
+    
+    curve = carpark_analytics.occupancy(history, site.spaces, 60)
+    assert curve.bucket_start(0) == "2025-10-01 08:00"
+    assert curve.series["All"] == [1.5, 2.0, 0.25]
+    by_level = carpark_analytics.occupancy(history, site.spaces, 60, "level")
+    assert by_level.series == {"Level 1": [1.5, 2.0, 0.0], "Level 2": [0.0, 0.0, 0.25]}
+    assert carpark_analytics.occupancy(history, site.spaces, 60, level=2).series == {"All": [0.25]}
+    by_type = carpark_analytics.occupancy(history, site.spaces, 60, "type")
+    assert list(by_type.series) == ["Standard", "Disabled", "EV"]
+    assert carpark_analytics.peaks(curve.series["All"]) == [(1, 2.0)]
+    print(f"✓ Hourly occupancy {curve.series['All']} peaks at {curve.bucket_start(1)}")
+    
+    dwell = carpark_analytics.dwell_by_entitlement(history)
+    assert dwell["Standard"].sessions == 2 and dwell["Standard"].mean == 67.5
+    assert dwell["EV"].median == 30 and dwell["Disabled"].p90 == 60
+    assert carpark_analytics.dwell_histogram(history, 30) == {0: 1, 30: 1, 60: 1, 120: 1}
+    print("✓ Stay lengths summarised per entitlement")
+    
+    print("✓ TEST 24 PASSED")
+
+def test_allocation_policies():
+    """Test 25: Allocation policies pick spaces from indexed free pools"""
+    print("\n" + "="*60)
+    print("TEST 25: Allocation Policies")
+    print("="*60)
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    assert carpark.location_coordinates("Level 2 - Bay 01") == (2, 1)
+    
+    site.set_policy(carpark.NearestEntrance(entrance_level=2))
+    assert site.park("AB12CDE", 15).record.space_id == "S005"
+    assert site.park("ZZ11AAA", 15).record.space_id == "S006"
+    assert site.park("DD22BBB", 15).record.space_id == "S001", "Level 1 once level 2 is full"
+    site.leave("S005")
+    assert site.park("AB12CDE", 15).record.space_id == "S005", "Released spaces go back in the heap"
+    print("✓ Nearest-to-entrance walks outwards from level 2")
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.set_policy(carpark.FillByLevel([2, 1]))
+    site.park("AB12CDE", 15, "S005")
+    assert site.park("ZZ11AAA", 15).record.space_id == "S006", "Claimed-by-ID spaces are skipped"
+    assert site.park("DD22BBB", 15).record.space_id == "S001"
+    print("✓ Fill-by-level finishes level 2 before opening level 1")
+    
+    site.set_policy(carpark.SpreadWear())
+    for reg in ["ZZ11AAA", "DD22BBB"]:
+        site.leave(reg)
+    used = []
+    for _ in range(4):
+        used.append(site.park("DD22BBB", 15).record.space_id)
+        site.leave("DD22BBB")
+    assert sorted(used[:3]) == ["S001", "S002", "S006"] and used[3] == "S001", "Least-used bay first"
+    site.park("DD22BBB", 15, "S002")
+    site.leave("DD22BBB")
+    assert site.park("DD22BBB", 15).record.space_id == "S006", "Claims by ID count as uses too"
+    site.leave("DD22BBB")
+    print(f"✓ Spread-wear rotated through {used}")
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.set_policy(carpark.KeepEVBays())
+    assert site.park("XY34ZRT", 15).record.space_id == "S004"
+    site.leave("XY34ZRT")
+    site.space_registry.occupy("S004")
+    assert not site.park("XY34ZRT", 15).ok, "Without overflow EV cars keep to EV bays"
+    
+    site.set_policy(carpark.KeepEVBays(ev_overflow=True))
+    assert site.count_available("EV") == 4, "Standard bays count for EV cars too"
+    assert site.park("XY34ZRT", 15).record.space_id == "S001", "EV cars overflow once EV bays are full"
+    site.leave("XY34ZRT")
+    assert site.park("XY34ZRT", 15, space_id="S002").ok, "A named Standard bay is accepted as well"
+    site.leave("XY34ZRT")
+    start = carpark.to_epoch_minutes("2025-10-01 09:00")
+    assert site.find_free_over("EV", start, start + 60).type == "Standard"
+    
+    site.set_policy(None)
+    assert not site.park("XY34ZRT", 15, space_id="S002").ok
+    assert site.find_free_over("EV", start, start + 60) is None
+    print("✓ EV bays are kept for EV cars, which overflow only when asked to")
+    
+    print("✓ TEST 25 PASSED")
+
+def test_level_index():
+    """Test 26: Locations parse into levels with a free index per level"""
+    print("\n" + "="*60)
+    print("TEST 26: Level Index")
+    print("="*60)
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.load_parked("PARKED.txt")
+    s005 = site.space_registry.get("S005")
+    assert (s005.level, s005.bay) == (2, 1)
+    assert carpark.Space("X1", "Roof", carpark.SpaceType.EV).level == carpark.UNKNOWN_COORDINATE
+    assert carpark.location_columns(["Level 3 - Bay 07", "Level 3 - Bay 08"]) == ([3, 3], [7, 8])
+    registry = site.space_registry
+    assert registry.levels() == [1, 2] and registry.level_sizes[1] == 4
+    print("✓ Locations parsed into level and bay on first use")
+    
+    assert site.count_available("Standard", level=1) == 1
+    assert [s.id for s in site.available_spaces("Disabled", level=2)] == ["S005", "S006"]
+    assert registry.free_on_level(1) == {carpark.SpaceType.STANDARD: 1, carpark.SpaceType.DISABLED: 1,
+                                         carpark.SpaceType.EV: 0}
+    assert site.park("ZZ11AAA", 15, level=2).record.space_id == "S005"
+    site.set_policy(carpark.NearestEntrance())
+    assert site.park("DD22BBB", 15, level=2).record.space_id == "S006"
+    result = site.park("XY34ZRT", 15, level=2)
+    assert not result.ok and "on level 2" in result.message
+    site.leave("S005")
+    assert site.count_available("Standard", level=2) == 1 and site.count_available("Standard") == 2
+    # Adding a space drops the level index; the next question rebuilds it
+    assert registry.add(carpark.Space("S900", "Level 9 - Bay 01", carpark.SpaceType.EV))
+    assert registry.levels() == [1, 2, 9] and registry.free_on_level(9)[carpark.SpaceType.EV] == 1
+    assert registry.occupy("S900") and registry.free_on_level(9)[carpark.SpaceType.EV] == 0
+    print("✓ Per-level counts, listings and claims")
+    
+    output = StringIO()
+    with mock.patch("sys.stdout", new=output):
+        carpark.view_free_spaces(site)
+        carpark.view_free_spaces(site, level=3)
+    text = output.getvalue()
+    assert "Level 1: 2 of 4 spaces free" in text and "Level 2: 1 of 2 spaces free" in text
+    assert "No free spaces on level 3." in text
+    print("✓ Free spaces shown level by level")
+    
+    # Listing while other threads park and leave must not trip over the live pools
+    import threading
+    busy = carpark.SpaceRegistry()
+    busy.add_many([carpark.Space(f"B{i:04d}", f"Level 1 - Bay {i:04d}", carpark.SpaceType.STANDARD)
+                   for i in range(2000)])
+    stop = threading.Event()
+    def churn():
+        while not stop.is_set():
+            for i in range(0, 2000, 7):
+                busy.occupy(f"B{i:04d}")
+            for i in range(0, 2000, 7):
+                busy.release(f"B{i:04d}")
+    churner = threading.Thread(target=churn)
+    churner.start()
+    try:
+        for _ in range(200):
+            assert len(list(busy.iter_free_by_level(1))) <= 2000
+            assert len(busy.free_list("Standard")) <= 2000
+    finally:
+        stop.set()
+        churner.join()
+    print("✓ Free listings are safe alongside concurrent parks and leaves")
+    
+    print("✓ TEST 26 PASSED")
+
+def test_paged_views():
+    """Test 27: Paged, filtered views and streamed exports"""
+    print("\n" + "="*60)
+    print("TEST 27: Paged Views")
+    print("="*60)
+    import csv
+    import json
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.load_parked("PARKED.txt")
+    site.park("ZZ11AAA", 60, "S005", time_in=carpark.to_epoch_minutes("2025-09-30 17:30"))
+    assert [r.reg for r in site.iter_parked(level=1)] == ["AB12CDE", "EV99CAR"]
+    assert [r.reg for r in site.iter_parked(space_type="EV")] == ["EV99CAR"]
+    assert [r.reg for r in site.iter_parked(owner="PATEL")] == ["ZZ11AAA"]
+    overdue = site.iter_parked(level=1, overdue_at=carpark.to_epoch_minutes("2025-09-30 17:30"))
+    assert [r.reg for r in overdue] == ["AB12CDE"]
+    print("✓ Parked cars filtered by level, type, owner and overdue")
+    
+    answers = iter([""])
+    output = StringIO()
+    with mock.patch("builtins.input", lambda prompt: next(answers)), mock.patch("sys.stdout", new=output):
+        carpark.view_parked_cars(site, page_size=2)
+    text = output.getvalue()
+    assert text.count("Registration") == 2 and "ZZ11AAA" in text, "Two pages, one prompt between them"
+    answers = iter(["q"])
+    output = StringIO()
+    with mock.patch("builtins.input", lambda prompt: next(answers)), mock.patch("sys.stdout", new=output):
+        carpark.view_free_spaces(site, page_size=2)
+    text = output.getvalue()
+    assert "S002" in text and "S003" in text and "S006" not in text, "Stopped after the first page"
+    with mock.patch("sys.stdout", new=StringIO()) as output:
+        carpark.view_parked_cars(site, owner="nobody")
+    assert "No parked cars match." in output.getvalue()
+    with mock.patch("builtins.input", lambda prompt: "level=2 type=ev"):
+        assert carpark.ask_view_filters(("level", "type")) == {"level": 2, "space_type": "EV"}
+    print("✓ Views page lazily and stop on request")
+    
+    out = StringIO()
+    assert carpark.write_rows(carpark.free_space_rows(site, space_type="Standard"), carpark.FREE_SPACE_FIELDS, out) == 2
+    rows = list(csv.DictReader(StringIO(out.getvalue())))
+    assert [row["id"] for row in rows] == ["S002", "S006"] and rows[1]["level"] == "2"
+    out = StringIO()
+    carpark.write_rows(carpark.parked_rows(site, level=2), carpark.PARKED_FIELDS, out, "jsonl")
+    assert json.loads(out.getvalue()) == {"space_id": "S005", "level": 2, "reg": "ZZ11AAA", "owner": "Neha Patel",
+                                          "time_in": "2025-09-30 17:30", "expected_time_out": "2025-09-30 18:30"}
+    print("✓ Rows streamed as CSV and JSON lines")
+    
+    print("✓ TEST 27 PASSED")
+
+def test_campus_sites():
+    """Test 28: Many sites in one process share one car registry"""
+    print("\n" + "="*60)
+    print("TEST 28: Campus Sites")
+    print("="*60)
+    import carpark_sites
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy("CARS.txt", tmp)
+        for name in ("north", "south"):
+            os.mkdir(os.path.join(tmp, name))
+            shutil.copy("SPACES.txt", os.path.join(tmp, name))
+        shutil.copy("PARKED.txt", os.path.join(tmp, "north"))
+        campus = carpark_sites.Campus()
+        reports = campus.load(tmp)
+        assert [r.loaded for r in reports] == [5, 6, 2, 6, 0] and reports[-1].missing
+        assert campus.sites["north"].cars is campus.sites["south"].cars is campus.cars
+        assert campus.site_of == {"AB12CDE": "north", "EV99CAR": "north"}
+        print(f"✓ {len(campus)} sites loaded against one registry of {len(campus.cars)} cars")
+        
+        assert campus.find_free("EV") == ("south", campus.sites["south"].space_registry.get("S004"))
+        assert campus.free_counts("Disabled") == {"north": 4, "south": 5}
+        result = campus.park("south", "EV99CAR", 15)
+        assert not result.ok and "site 'north'" in result.message
+        site, result = campus.park_anywhere("XY34ZRT", 30)
+        assert site == "south" and result.record.space_id == "S004"
+        assert campus.find_free("EV") is None
+        site, result = campus.park_anywhere("AB12CDE", 30, sites=["south"])
+        assert site == "north" and not result.ok and "site 'north'" in result.message
+        assert campus.locate("xy34zrt")[0] == "south"
+        print("✓ Cross-site free-space search and one site per car")
+        
+        assert campus.leave("EV99CAR").ok
+        assert campus.park("south", "EV99CAR", 15, level=2).record.space_id == "S005"
+        assert campus.leave("S005", site="south").ok and "EV99CAR" not in campus.site_of
+        now = carpark.to_epoch_minutes("2025-09-30 18:30")
+        assert [(site, r.reg) for site, r in campus.overdue(now)] == [("north", "AB12CDE")]
+        try:
+            campus.park("west", "DD22BBB", 15)
+            assert False, "Unknown sites are refused"
+        except ValueError:
+            pass
+        print("✓ Leaving by registration or by site and space, campus-wide overdue list")
+    
+    print("✓ TEST 28 PASSED")
+
+def test_sharded_car_park():
+    """Test 29: Cars and spaces sharded across worker processes"""
+    print("\n" + "="*60)
+    print("TEST 29: Sharded Car Park")
+    print("="*60)
+    import carpark_shards
+    
+    keep = lambda key: carpark_shards.shard_of(key, 2) == 0
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt", keep)
+    site.load_cars("CARS.txt", keep)
+    site.load_parked("PARKED.txt", keep)
+    assert sorted(s.id for s in site.spaces) == ["S004", "S005", "S006"]
+    assert list(site.cars) == ["XY34ZRT"] and [r.reg for r in site.parked] == ["EV99CAR"]
+    assert site.park("AB12CDE", 15, entitlement="Standard").record.space_id == "S005", "Guest from another shard"
+    print("✓ Loaders keep only one shard's rows")
+    
+    with carpark_shards.ShardedCarPark(2) as shards:
+        reports = shards.start("SPACES.txt", "CARS.txt", "PARKED.txt")
+        assert [r.loaded for r in reports] == [6, 5, 2]
+        assert shards.parked_at == {"AB12CDE": 1, "EV99CAR": 0}
+        assert shards.park("ZZ11AAA", 30).record.space_id == "S002"
+        # DD22BBB's own shard has no Standard space left, so it overflows to the other
+        assert shards.park("DD22BBB", 30).record.space_id == "S005"
+        assert not shards.park("DD22BBB", 30).ok
+        assert shards.leave("S005").ok and "DD22BBB" not in shards.parked_at
+        print("✓ Parks routed to the owning shard, overflowing when it is full")
+        
+        out = StringIO()
+        stats = shards.replay(["LEAVE, 2025-10-01 09:00, ZZ11AAA",
+                               "PARK, 2025-10-01 09:00, DD22BBB, 15, S006",
+                               "LEAVE, 2025-10-01 09:30, S001",
+                               "PARK, 2025-10-01 09:45, AB12CDE, 15"], out)
+        assert (stats.events, stats.accepted) == (4, 4)
+        assert [line.split(", ")[1] for line in out.getvalue().splitlines()] == ["OK"] * 4
+        assert shards.parked_at == {"EV99CAR": 0, "DD22BBB": 0, "AB12CDE": 1}
+        assert sorted(r.space_id for r in shards.parked()) == ["S002", "S004", "S006"]
+        print("✓ Batches replayed per shard in input order")
+
+        # DD22BBB's own shard fills up mid-batch, so replay overflows it like park does
+        assert shards.leave("DD22BBB").ok
+        stats = shards.replay(["PARK, 2025-10-01 10:00, ZZ11AAA, 15",
+                               "PARK, 2025-10-01 10:05, DD22BBB, 15",
+                               "LEAVE, 2025-10-01 10:10, DD22BBB",
+                               "PARK, 2025-10-01 10:15, DD22BBB, 15"])
+        assert (stats.events, stats.accepted) == (4, 4)
+        assert shards.parked_at == {"EV99CAR": 0, "AB12CDE": 1, "ZZ11AAA": 1, "DD22BBB": 0}
+        print("✓ Replay overflows a full shard's parks to another shard")
+
+    folder = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(folder, name) for name in ("SPACES.txt", "CARS.txt", "PARKED.txt")]
+        for path, name in zip(paths, ("SPACES.txt", "CARS.txt", "PARKED.txt")):
+            shutil.copy(name, path)
+        with open(paths[0], "a") as file:
+            file.writelines(f"S{i:03d}, Level 9 - Bay {i}, Hovercraft\n" for i in range(100, 125))
+        with open(paths[2], "a") as file:
+            file.write("S001, AB12CDE, yesterday\nS006, EV99CAR, soon, later\n")
+        single = carpark.CarPark()
+        expected = [single.load_spaces(paths[0]), single.load_cars(paths[1]), single.load_parked(paths[2])]
+        with carpark_shards.ShardedCarPark(2) as shards:
+            reports = shards.start(*paths)
+        assert [r.skipped for r in reports] == [r.skipped for r in expected] == [25, 0, 2]
+        assert [r.bad_lines for r in reports] == [r.bad_lines for r in expected]
+        assert len(reports[0].bad_lines) == carpark.MAX_REPORTED_BAD_LINES
+    finally:
+        shutil.rmtree(folder)
+    print("✓ Bad lines merged from every shard, matching a single load")
+
+    print("✓ TEST 29 PASSED")
+
+def test_sqlite_backend():
+    """Test 30: SQLite storage behind the same load/save interface"""
+    print("\n" + "="*60)
+    print("TEST 30: SQLite Backend")
+    print("="*60)
+    import sqlite3
+    import carpark_sqlite
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "carpark.db")
+        reports = carpark_sqlite.import_text(database, "SPACES.txt", "CARS.txt", "PARKED.txt", batch_size=2)
+        assert [r.loaded for r in reports] == [6, 5, 2]
+        conn = sqlite3.connect(database)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"spaces_type", "parked_expected_out"} <= indexes
+        plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM parked WHERE reg = 'X'"))
+        assert "INDEX" in plan, "Registration lookups use an index"
+        print(f"✓ Imported {[r.loaded for r in reports]} rows into a WAL database with indexes")
+
+        statements = []
+        connect = carpark_sqlite.connect
+        def traced(path):
+            traced_conn = connect(path)
+            traced_conn.set_trace_callback(statements.append)
+            return traced_conn
+        carpark_sqlite.connect = traced
+        try:
+            carpark_sqlite.import_text(database, "SPACES.txt", "CARS.txt", "PARKED.txt", batch_size=2)
+        finally:
+            carpark_sqlite.connect = connect
+        assert statements.count("COMMIT") == 1 and statements[1] == "DELETE FROM spaces", "One transaction per import"
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(cars)")]
+        assert columns == ["reg", "owner", "contract", "entitlement"]
+        print("✓ Imports replace the contents in one transaction; cars keep a contract column")
+
+        site = carpark.CarPark()
+        assert [site.load_spaces(database).loaded, site.load_cars(database).loaded,
+                site.load_parked(database).loaded] == [6, 5, 2]
+        assert site.space_registry.get("S005").level == 2 and site.space_registry.get("S004").occupied
+        assert site.cars["EV99CAR"].entitlement == "Disabled"
+        assert site.parked_index.find("AB12CDE").expected_time_out == "2025-09-30 17:00"
+        print("✓ Spaces, cars and sessions loaded from the database")
+        
+        site.open_journal(database, sync_every=2)
+        site.park("ZZ11AAA", 30, "S002")
+        site.leave("EV99CAR")
+        site.park("DD22BBB", 15)
+        rows = conn.execute("SELECT reg FROM parked ORDER BY reg").fetchall()
+        assert [row[0] for row in rows] == ["AB12CDE", "ZZ11AAA"], "Committed in batches of two events"
+        site.close_journal()
+        reloaded = carpark.CarPark()
+        reloaded.load_spaces(database)
+        reloaded.load_parked(database)
+        assert sorted(r.reg for r in reloaded.parked) == ["AB12CDE", "DD22BBB", "ZZ11AAA"]
+        reloaded.leave("AB12CDE")
+        reloaded.save_parked(database)
+        assert conn.execute("SELECT COUNT(*) FROM parked").fetchone()[0] == 2
+        conn.close()
+        assert carpark.CarPark().load_cars(os.path.join(tmp, "missing.db")).missing
+        print("✓ Journal and save_parked write straight to the parked table")
+    
+    print("✓ TEST 30 PASSED")
+
+def test_workload_generator():
+    """Test 31: Seedable synthetic workloads in the file formats"""
+    print("\n" + "="*60)
+    print("TEST 31: Workload Generator")
+    print("="*60)
+    import carpark_workload
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = carpark_workload.write_workload(os.path.join(tmp, "a"), levels=3, bays_per_level=40, days=2, seed=7)
+        again = carpark_workload.write_workload(os.path.join(tmp, "b"), levels=3, bays_per_level=40, days=2, seed=7)
+        other = carpark_workload.write_workload(os.path.join(tmp, "c"), levels=3, bays_per_level=40, days=2, seed=8)
+        contents = {key: open(path).read() for key, path in paths.items()}
+        assert contents == {key: open(path).read() for key, path in again.items()}, "Same seed, same files"
+        assert contents["EVENTS.txt"] != open(other["EVENTS.txt"]).read()
+        print("✓ Same seed reproduces every file")
+        
+        site = carpark.CarPark()
+        spaces, cars = site.load_spaces(paths["SPACES.txt"]), site.load_cars(paths["CARS.txt"])
+        assert (spaces.loaded, cars.loaded) == (120, 240) and not spaces.skipped and not cars.skipped
+        assert site.space_registry.levels() == [1, 2, 3]
+        types = [space.type for space in site.spaces if space.level == 2]
+        assert types.count("Disabled") == 2 and types.count("EV") == 4 and types[0] == "Disabled" and types[-1] == "EV"
+        
+        lines = contents["EVENTS.txt"].splitlines()[1:]
+        minutes = [carpark.parse_time_minutes(line.split(", ")[1]) for line in lines]
+        assert minutes == sorted(minutes), "Events are time-ordered"
+        parks = [line.split(", ") for line in lines if line.startswith("PARK")]
+        assert all(int(park[3]) % 15 == 0 for park in parks)
+        by_hour = [0] * 24
+        for park in parks:
+            by_hour[int(park[1][11:13])] += 1
+        assert by_hour.index(max(by_hour)) in (7, 8, 9), "Arrivals peak in the morning"
+        stats = carpark.replay_events(lines, StringIO(), car_park=site)
+        assert stats.rejected == 0 and stats.accepted == len(lines) and not site.parked
+        print(f"✓ {len(lines)} events replay cleanly, peaking at {by_hour.index(max(by_hour)):02d}:00")
+    
+    print("✓ TEST 31 PASSED")
+
+def test_metrics():
+    """Test 32: Opt-in hot-path metrics in the Prometheus text format"""
+    print("\n" + "="*60)
+    print("TEST 32: Metrics")
+    print("="*60)
+    import urllib.request
+    import carpark_metrics
+    
+    site = carpark.CarPark()
+    metrics = carpark_metrics.instrument(site)
+    assert "park" in vars(site) and "park" not in vars(carpark.CarPark())
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.load_parked("PARKED.txt")
+    assert len(site.available_spaces("Standard")) == 3
+    assert site.park("ZZ11AAA", 30).ok
+    assert not site.park("ZZ11AAA", 30).ok, "Already parked"
+    assert site.leave("ZZ11AAA").ok
+    assert metrics.count("park") == 2 and metrics.count("available_spaces") == 1
+    
+    text = metrics.render()
+    for line in ('carpark_operations_total{operation="park",outcome="ok"} 1',
+                 'carpark_operations_total{operation="park",outcome="rejected"} 1',
+                 'carpark_operations_total{operation="leave",outcome="ok"} 1',
+                 'carpark_rows_loaded_total{operation="load_spaces"} 6',
+                 'carpark_operation_seconds_bucket{operation="park",le="+Inf"} 2',
+                 'carpark_operation_seconds_count{operation="load_cars"} 1',
+                 'carpark_spaces{type="Standard"} 4',
+                 'carpark_spaces_free{type="Disabled"} 1',
+                 'carpark_spaces_free{type="EV"} 0',
+                 'carpark_parked_cars 2'):
+        assert line in text.splitlines(), line
+    assert "# TYPE carpark_operation_seconds histogram" in text
+    print("✓ Counters, latency histograms and occupancy gauges rendered")
+    
+    server = carpark_metrics.serve(metrics, 0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "carpark_parked_cars 2" in response.read().decode()
+    finally:
+        server.shutdown()
+    with tempfile.TemporaryDirectory() as tmp:
+        site.save_parked(os.path.join(tmp, "PARKED.txt"))
+        metrics.write(os.path.join(tmp, "carpark.prom"))
+        with open(os.path.join(tmp, "carpark.prom")) as file:
+            assert 'carpark_operation_seconds_count{operation="save_parked"} 1' in file.read()
+    print("✓ Served over HTTP and dumped to a file")
+    
+    carpark_metrics.uninstrument(site)
+    site.park("ZZ11AAA", 30)
+    assert "park" not in vars(site) and metrics.count("park") == 2
+    print("✓ uninstrument restores the plain methods")
+    
+    print("✓ TEST 32 PASSED")
+
+def test_session_profiler():
+    """Test 33: Profiling a session into collapsed stacks and a top-N summary"""
+    print("\n" + "="*60)
+    print("TEST 33: Session Profiler")
+    print("="*60)
+    import carpark_profile
+    
+    sampler = carpark_profile.StackSampler()
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    assert not sampler.stacks, "Idle time (e.g. waiting at a prompt) is not sampled"
+    print("✓ Idle time is left out of the samples")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        folded = os.path.join(tmp, "session.folded")
+        out = StringIO()
+        site = carpark.CarPark()
+        site.load_spaces("SPACES.txt")
+        site.load_cars("CARS.txt")
+        profiler = carpark_profile.SessionProfiler(folded, top=5, interval=0.0005, out=out)
+        profiler.start()
+        deadline = time.process_time() + 0.2
+        while time.process_time() < deadline:
+            assert site.park("ZZ11AAA", 30).ok and site.leave("ZZ11AAA").ok
+        summary = profiler.stop()
+        assert 0 < len(summary) <= 5
+        assert {"carpark:park", "carpark:leave"} & {row[0].rsplit(":", 1)[0] for row in summary}
+        assert all(row[0].startswith("carpark") for row in summary)
+        assert "Top" in out.getvalue() and "carpark:" in out.getvalue()
+        with open(folded) as file:
+            lines = file.read().splitlines()
+        assert lines, "Busy time is sampled"
+        for line in lines:
+            stack, weight = line.rsplit(" ", 1)
+            assert int(weight) > 0 and ";" in stack
+        assert any("CarPark.park" in line for line in lines)
+        print(f"✓ {len(lines)} collapsed stacks and a top-{len(summary)} summary")
+    
+    print("✓ TEST 33 PASSED")
+
+def test_reservations():
+    """Test 34: Advance bookings alongside walk-in parking"""
+    print("\n" + "="*60)
+    print("TEST 34: Reservations")
+    print("="*60)
+    import threading
+    at = carpark.to_epoch_minutes
+    
+    site = carpark.CarPark()
+    site.load_spaces("SPACES.txt")
+    site.load_cars("CARS.txt")
+    site.load_parked("PARKED.txt")
+    result = site.reserve("zz11aaa", at("2025-10-01 09:00"), at("2025-10-01 12:00"))
+    assert result.ok and "Space 'S002'" in result.message, result.message
+    assert not site.is_free_over("S002", at("2025-10-01 10:00"), at("2025-10-01 11:00"))
+    assert site.is_free_over("S002", at("2025-10-01 12:00"), at("2025-10-01 13:00"))
+    assert not site.is_free_over("S001", at("2025-09-30 16:00"), at("2025-09-30 17:30")), "AB12CDE is due out at 17:00"
+    assert site.reserve("DD22BBB", at("2025-09-30 17:00"), at("2025-09-30 18:00"), "S001").ok
+    assert not site.reserve("DD22BBB", at("2025-09-30 17:30"), at("2025-09-30 19:00")).ok, "Overlaps its own booking"
+    assert not site.reserve("DD22BBB", at("2025-10-01 10:00"), at("2025-10-01 11:00"), "S002").ok
+    assert "boundaries" in site.reserve("DD22BBB", at("2025-10-02 09:05"), at("2025-10-02 10:00")).message
+    assert len(site.reservations) == 2
+    print("✓ Bookings made, clashes and bad times refused")
+    
+    result = site.park("DD22BBB", 120, time_in=at("2025-10-01 08:00"))
+    assert result.ok and result.record.space_id != "S002", "Walk-ins avoid spaces booked during their stay"
+    site.leave("DD22BBB")
+    assert site.park("DD22BBB", 60, "S002", time_in=at("2025-10-01 08:00")).ok, "Ends as the booking starts"
+    site.leave("DD22BBB")
+    result = site.park("DD22BBB", 75, "S002", time_in=at("2025-10-01 08:00"))
+    assert not result.ok and "reserved from 2025-10-01 09:00" in result.message
+    result = site.park("ZZ11AAA", 180, time_in=at("2025-10-01 08:50"))
+    assert result.ok and result.record.space_id == "S002", "Arriving for a booking gets the booked space"
+    assert site.reservations.find("ZZ11AAA", at("2025-10-01 09:00")) is None, "The booking is used up"
+    site.leave("ZZ11AAA")
+    print("✓ Walk-ins steer around bookings; booked cars get their space")
+    
+    result = site.reserve("XY34ZRT", at("2025-09-30 18:00"), at("2025-09-30 19:00"))
+    assert result.ok and "Space 'S004'" in result.message, "Free once EV99CAR is due out"
+    result = site.park("XY34ZRT", 60, time_in=at("2025-09-30 18:00"))
+    assert not result.ok and "No available parking spaces" in result.message, "EV99CAR has overstayed"
+    assert site.cancel_reservation("XY34ZRT", at("2025-09-30 18:00")).ok
+    assert not site.cancel_reservation("XY34ZRT", at("2025-09-30 18:00")).ok
+    print("✓ Overstays and cancellations handled")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "RESERVATIONS.txt")
+        site.save_reservations(filename)
+        with open(filename, "a") as file:
+            file.write("S001, ZZ11AAA, 2025-09-30 17:30, 2025-09-30 18:30\nnot a booking\n")
+        reloaded = carpark.CarPark()
+        reloaded.load_spaces("SPACES.txt")
+        report = reloaded.load_reservations(filename)
+        assert report.loaded == 1 and report.skipped == 2
+        assert [(b.space_id, b.reg, b.start, b.end) for b in reloaded.reservations] == \
+            [("S001", "DD22BBB", "2025-09-30 17:00", "2025-09-30 18:00")]
+
+        def saved():
+            with open(filename) as file:
+                return [line.split(", ")[:2] for line in file.read().splitlines()[1:]]
+        reloaded.load_cars("CARS.txt")
+        reloaded.load_reservations(filename, autosave=True)
+        assert reloaded.reserve("ZZ11AAA", at("2025-10-01 09:00"), at("2025-10-01 10:00"), "S002").ok
+        assert saved() == [["S001", "DD22BBB"], ["S002", "ZZ11AAA"]], "Saved as soon as it is booked"
+        assert reloaded.cancel_reservation("DD22BBB", at("2025-09-30 17:00")).ok
+        assert saved() == [["S002", "ZZ11AAA"]]
+        assert reloaded.park("ZZ11AAA", 60, time_in=at("2025-10-01 09:00")).record.space_id == "S002"
+        assert saved() == [], "A booking used up by a park is saved too"
+    print("✓ Bookings saved and reloaded, and kept saved with autosave")
+    
+    # Many walk-ins racing while half the spaces are booked: none may take a booked space
+    crowded = carpark.CarPark()
+    crowded.spaces = [carpark.Space(f"S{i:03d}", f"Level 1 - Bay {i + 1:02d}", carpark.SpaceType.STANDARD)
+                      for i in range(200)]
+    crowded.space_registry.add_many(crowded.spaces)
+    regs = [f"CAR{i:03d}" for i in range(200)]
+    crowded.cars.extend(regs, ["Owner"] * 200, ["owner@email.com"] * 200, [0] * 200)
+    for i in range(0, 200, 2):
+        assert crowded.reserve(regs[i], at("2025-10-01 09:00"), at("2025-10-01 10:00"), f"S{i:03d}").ok
+    results = []
+    def walk_in(batch):
+        results.extend(crowded.park(reg, 15, time_in=at("2025-10-01 09:30")) for reg in batch)
+    threads = [threading.Thread(target=walk_in, args=(regs[1 + t::16],)) for t in range(0, 16, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 100 and all(result.ok for result in results)
+    assert all(int(result.record.space_id[1:]) % 2 == 1 for result in results)
+    assert len(crowded.reservations) == 100
+    print("✓ 100 concurrent walk-ins kept clear of 100 booked spaces")
+
+    space_id = crowded.leave("CAR199").record.space_id
+    with crowded.reservations.lock:
+        parker = threading.Thread(
+            target=lambda: results.append(crowded.park("CAR199", 15, space_id, time_in=at("2025-10-01 09:30"))))
+        parker.start()
+        parker.join(5)
+        assert not parker.is_alive(), "Parking in a space without bookings must not wait on the booking lock"
+    assert results[-1].record.space_id == space_id
+    print("✓ Walk-ins to spaces without bookings skip the booking lock")
+    
+    print("✓ TEST 34 PASSED")
+
 def run_all_tests():
     """Run all test cases"""
     print("\n" + "="*60)
@@ -204,6 +1399,30 @@ def run_all_tests():
         test_space_occupancy()
         test_unregistered_car()
         test_free_spaces_count()
+        test_space_registry()
+        test_availability_queries()
+        test_leave_by_index()
+        test_compact_records()
+        test_parked_journal()
+        test_bad_lines_reported()
+        test_binary_snapshot()
+        test_mapped_car_registry()
+        test_batch_replay()
+        test_independent_car_parks()
+        test_network_service()
+        test_concurrent_claims()
+        test_overstay_queries()
+        test_history_analytics()
+        test_allocation_policies()
+        test_level_index()
+        test_paged_views()
+        test_campus_sites()
+        test_sharded_car_park()
+        test_sqlite_backend()
+        test_workload_generator()
+        test_metrics()
+        test_session_profiler()
+        test_reservations()
         
         print("\n" + "="*60)
         print("ALL TESTS PASSED! ✓")